@@ -6,6 +6,9 @@ from src.aux_code.extra_functions import hsv_to_rgb, rgb_to_hex
 from src.aux_code.pygame_configure import pygame, math, fill_gradient, draw_lines_g, draw_square, draw_text
 from src.aux_code.ui import UI  # needed for (host: UI) arg typing
 from src.aux_code.constants import COLOUR_UI, HORIZONTAL, VERTICAL
+from src.aux_code.log import get_logger
+
+log = get_logger('ui')
 
 
 class UIelement:
@@ -72,7 +75,7 @@ class UIelement:
         returns False if your mouse is not on the element"""
         x, y = self.position
         if x < mouse_x < x + self.width and y < mouse_y < y + self.height:
-            print("clicked on: " + self.etype)
+            log.debug("clicked on: %s", self.etype)
             return (mouse_x - x, mouse_y - y)
         else:
             return None
@@ -0,0 +1,186 @@
+"""processing folders of save files from the command line, spread over a pool of worker processes
+
+Every file goes through the operations asked for, in this order:
+    - validate: check the layers are all the same size and every cell has a sensible colour
+    - reencode: write the file again in the compressed save format (old files were written as python literals)
+    - thumbnail: render a small png of it (see export.thumbnail)
+    - render: render a full size png of it (see export.render)
+Files never share a worker's memory: each worker handles at most --tasks-per-worker files before it's replaced
+(so whatever a big file left behind goes with it), and --memory-limit caps how much memory a worker can ask for
+(a file that needs more fails on its own, without taking the batch down).
+
+A report line (JSON) is printed for every file as it finishes, with how long each operation took, and the whole
+report can also be written to a file.
+
+Usage:
+    python -m src.aux_code.batch <files or folders> [--ops validate,reencode,thumbnail,render] [--out <folder>]
+        [--workers N] [--tasks-per-worker N] [--memory-limit MB] [--radius R] [--thumbnail-size PX] [--report <file>]
+"""
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import time
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')  # every worker imports pygame
+
+from src.aux_code.export import DEFAULT_RADIUS, THUMBNAIL_SIZE, render, thumbnail
+from src.aux_code.canvas_system import HexCanvas
+from src.aux_code.save_and_load import compress_writing, read_file, write_file
+from src.aux_code.pygame_configure import pygame
+
+OPERATIONS = ('validate', 'reencode', 'thumbnail', 'render')  # in the order they're applied to a file
+TASKS_PER_WORKER = 8  # files a worker handles before it's replaced by a fresh one
+
+
+def validate_layers(layers: list) -> list[str]:
+    """the problems with the layers of a save file (empty if there are none)"""
+    if not layers or not layers[0] or not layers[0][0]:
+        return ['the file has no pixels']
+    problems = []
+    width, height = len(layers[0][0]), len(layers[0])
+    for i, layer in enumerate(layers):
+        if len(layer) != height or any(len(row) != width for row in layer):
+            problems.append(f'layer {i} is not {width} x {height}')
+            continue
+        for y, row in enumerate(layer):
+            for x, pix_dict in enumerate(row):
+                rgb, alpha = pix_dict['rgb'], pix_dict['alpha']
+                if rgb is not None and (len(rgb) != 3 or any(not 0 <= value <= 255 for value in rgb)):
+                    problems.append(f'layer {i} cell {(x, y)} has colour {rgb}')
+                elif not 0.0 <= alpha <= 1.0:
+                    problems.append(f'layer {i} cell {(x, y)} has alpha {alpha}')
+    return problems
+
+
+def process_file(file_path: str, ops: list[str], out_dir: str, radius: float = DEFAULT_RADIUS,
+                 thumbnail_size: int = THUMBNAIL_SIZE) -> dict:
+    """apply the given operations to a save file, writing what they make to out_dir
+    returns the file's report: whether it worked, what went wrong, what got written and how long everything took"""
+    report = {'file': file_path, 'ok': True, 'error': None, 'problems': [], 'outputs': [], 'seconds': {}}
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    start = time.perf_counter()
+    try:
+        file = read_file(file_path)
+        report['seconds']['read'] = time.perf_counter() - start
+        layers, pix_size = file[0], file[1]
+
+        if 'validate' in ops:
+            step = time.perf_counter()
+            report['problems'] = validate_layers(layers)
+            report['ok'] = not report['problems']
+            report['seconds']['validate'] = time.perf_counter() - step
+            if not report['ok']:
+                return report
+
+        step = time.perf_counter()
+        canvas = HexCanvas((len(layers[0][0]), len(layers[0])))
+        canvas.load_layers(layers)
+        report['size'] = [canvas.width, canvas.height]
+        report['layers'] = len(canvas.layers)
+        report['seconds']['load'] = time.perf_counter() - step
+
+        if 'reencode' in ops:
+            step = time.perf_counter()
+            snapshot = canvas.snapshot()
+            snapshot[1] = pix_size  # keep the pixel size the file was saved with
+            out_path = os.path.join(out_dir, name + '.hexpaint')
+            write_file(out_path, compress_writing(snapshot))
+            report['outputs'].append(out_path)
+            report['seconds']['reencode'] = time.perf_counter() - step
+        for op, make, suffix in (('thumbnail', lambda: thumbnail(canvas, thumbnail_size), '.thumb.png'),
+                                 ('render', lambda: render(canvas, radius), '.png')):
+            if op in ops:
+                step = time.perf_counter()
+                out_path = os.path.join(out_dir, name + suffix)
+                pygame.image.save(make(), out_path)
+                report['outputs'].append(out_path)
+                report['seconds'][op] = time.perf_counter() - step
+    except Exception as e:  # (including MemoryError, if the worker hit its memory limit)
+        report['ok'], report['error'] = False, f'{type(e).__name__}: {e}'
+    report['seconds']['total'] = time.perf_counter() - start
+    return report
+
+
+def limit_memory(megabytes: int | None) -> None:
+    """caps the memory the process running this can ask for (run in every worker as it starts)"""
+    if megabytes:
+        try:
+            import resource
+        except ImportError:  # no way to cap it (e.g. on Windows), so workers only get recycled
+            return
+        limit = megabytes * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def save_files(paths: list[str]) -> list[str]:
+    """the save files given, with folders replaced by the save files in them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.hexpaint'))))
+        else:
+            files.append(path)
+    return files
+
+
+def run_batch(files: list[str], ops: list[str], out_dir: str, workers: int | None = None,
+              tasks_per_worker: int = TASKS_PER_WORKER, memory_limit: int | None = None,
+              radius: float = DEFAULT_RADIUS, thumbnail_size: int = THUMBNAIL_SIZE,
+              on_report=None) -> list[dict]:
+    """process every file over a pool of worker processes, returns their reports in the order of files
+    on_report (if given) is called with each report as soon as its file is done"""
+    os.makedirs(out_dir, exist_ok=True)
+    reports = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=tasks_per_worker,
+                                                initializer=limit_memory, initargs=(memory_limit,)) as pool:
+        futures = {pool.submit(process_file, file_path, ops, out_dir, radius, thumbnail_size): file_path
+                   for file_path in files}
+        for future in concurrent.futures.as_completed(futures):
+            file_path = futures[future]
+            try:
+                report = future.result()
+            except concurrent.futures.process.BrokenProcessPool as e:  # the worker died with the file
+                report = {'file': file_path, 'ok': False, 'error': f'worker died: {e}', 'seconds': {}}
+            reports[file_path] = report
+            if on_report:
+                on_report(report)
+    return [reports[file_path] for file_path in files]
+
+
+def main() -> None:
+    """command line batch: processes the given save files and folders, printing a report line per file"""
+    parser = argparse.ArgumentParser(description='validate, re-encode and render folders of HexPaint save files')
+    parser.add_argument('paths', nargs='+', help='save files, or folders of them')
+    parser.add_argument('--ops', default='validate,reencode,thumbnail,render',
+                        help='comma separated operations, out of ' + ', '.join(OPERATIONS))
+    parser.add_argument('--out', default='batch_out', help='folder to write what the operations make to')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (defaults to one per cpu)')
+    parser.add_argument('--tasks-per-worker', type=int, default=TASKS_PER_WORKER,
+                        help='files a worker handles before it is replaced')
+    parser.add_argument('--memory-limit', type=int, default=None, help='most memory a worker can use (in MB)')
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS, help='cell radius of full renders')
+    parser.add_argument('--thumbnail-size', type=int, default=THUMBNAIL_SIZE, help='longest side of thumbnails')
+    parser.add_argument('--report', default=None, help='also write the whole report (JSON) to this file')
+    args = parser.parse_args()
+
+    ops = [op for op in args.ops.split(',') if op]
+    for op in ops:
+        if op not in OPERATIONS:
+            parser.error(f'unknown operation {op}')
+    files = save_files(args.paths)
+    start = time.perf_counter()
+    reports = run_batch(files, ops, args.out, args.workers, args.tasks_per_worker, args.memory_limit, args.radius,
+                        args.thumbnail_size, on_report=lambda report: print(json.dumps(report), flush=True))
+    summary = {'files': len(files), 'failed': sum(not report['ok'] for report in reports),
+               'seconds': time.perf_counter() - start}
+    print(json.dumps(summary))
+    if args.report:
+        write_file(args.report, json.dumps({'summary': summary, 'files': reports}, indent=1))
+
+
+if __name__ == '__main__':
+    main()
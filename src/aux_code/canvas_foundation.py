@@ -1,18 +1,324 @@
 from __future__ import annotations
 
 import random
+import weakref
+from array import array
 from typing import Any
 
+import numpy as np
+
 from src.aux_code.pygame_configure import pygame, math, draw_hexagon
 from src.aux_code.extra_functions import cycle_list, colour_add, hsv_to_rgb, rgb_to_hsv
 
 
+MAX_ZOOM_RADIUS = 120  # the biggest a cell's radius can be zoomed to (in screen pixels)
+
+
+class CanvasLayout:
+    """where the cells of a canvas sit on the screen
+
+    One layout is shared by every layer of a canvas (and by every history entry made from it),
+    so laying out a canvas is a single pass no matter how many layers or pixels there are.
+
+    The canvas is shown through a viewport: the view is the area of the screen the canvas is shown in, and zooming and
+    panning scale and move the canvas inside it (only the cells in the view get drawn or picked).
+
+    Instance Attributes:
+        - radius: the radius of every drawn hexagon pixel
+        - x_offset, y_offset: top left corner of the canvas on the screen
+        - col_x: the x centre of every column, for even rows (index 0) and odd rows (index 1)
+        - row_y: the y centre of every row
+        - view: the area of the screen the canvas is shown in
+        - zoom: how many times bigger the cells are than when the whole canvas fits in the view
+    """
+    radius: float
+    x_offset: float
+    y_offset: float
+    col_x: np.ndarray | None
+    row_y: np.ndarray | None
+    view: pygame.Rect
+    zoom: float
+    _fit_radius: float  # the radius that fits the whole canvas in the view
+    _size: tuple[int, int]  # the width and height of the canvas (in cells)
+    _col_x: list[list[float]]
+    _row_y: list[float]
+
+    def __init__(self) -> None:
+        self.radius = 1.0
+        self.x_offset, self.y_offset = 0.0, 0.0
+        self.col_x, self.row_y = None, None
+        self.view = pygame.Rect(0, 0, 0, 0)
+        self.zoom, self._fit_radius, self._size = 1.0, 1.0, (0, 0)
+        self._col_x, self._row_y = [[], []], []
+
+    def fit(self, screen: pygame.Surface, width: int, height: int) -> None:
+        """fit a width x height hex grid into the canvas area of the screen (which resets the zoom and pan)"""
+        root3 = math.sqrt(3)
+        margin_horiz, margin_vert = 0.5, 0.9
+        w, h = screen.get_width() * margin_horiz, screen.get_height() * margin_vert
+        r = min(w / (root3 * (width + 0.5)), h / (1.5 * height + 0.5))  # pixel radius
+        self.x_offset = screen.get_width() * (1 - margin_horiz) / 2
+        self.y_offset = screen.get_height() * (1 - margin_vert) / 2
+        self.view = pygame.Rect(math.floor(self.x_offset), math.floor(self.y_offset), math.ceil(w), math.ceil(h))
+        self.zoom, self._fit_radius, self._size = 1.0, r, (width, height)
+        self.place(r, self.x_offset, self.y_offset)
+
+    def place_at(self, width: int, height: int, radius: float) -> pygame.Rect:
+        """lay a width x height hex grid out at the given radius, with its top left corner at (0, 0) and the view
+        covering all of it (for drawing a canvas off screen), returns that view"""
+        w, h = math.ceil(radius * math.sqrt(3) * (width + 0.5)), math.ceil(radius * (1.5 * height + 0.5))
+        self.view = pygame.Rect(0, 0, w, h)
+        self.zoom, self._fit_radius, self._size = 1.0, radius, (width, height)
+        self.place(radius, 0.0, 0.0)
+        return self.view
+
+    def place(self, radius: float, x_offset: float, y_offset: float) -> None:
+        """put the canvas at the given cell radius and top left corner"""
+        width, height = self._size
+        # keep some of the canvas in the view
+        canvas_w, canvas_h = radius * math.sqrt(3) * (width + 0.5), radius * (1.5 * height + 0.5)
+        keep = min(self.view.w, self.view.h) / 4
+        keep_x, keep_y = min(keep, canvas_w), min(keep, canvas_h)
+        x_offset = min(self.view.right - keep_x, max(self.view.left + keep_x - canvas_w, x_offset))
+        y_offset = min(self.view.bottom - keep_y, max(self.view.top + keep_y - canvas_h, y_offset))
+        self.radius, self.x_offset, self.y_offset = radius, x_offset, y_offset
+
+        # even rows are shifted half a hexagon less than odd rows
+        cols = np.arange(width, dtype=np.float64)
+        self.col_x = self.x_offset + radius * math.sqrt(3) * (cols + np.array([[0.5], [1.0]]))
+        self.row_y = self.y_offset + radius * (1 + 1.5 * np.arange(height, dtype=np.float64))
+        self._col_x, self._row_y = self.col_x.tolist(), self.row_y.tolist()
+
+    def zoom_at(self, factor: float, point: tuple[float, float]) -> None:
+        """zoom in (factor > 1) or out (factor < 1), keeping what's under point where it is
+        cells can't get smaller than when the canvas fits the view, or bigger than MAX_ZOOM_RADIUS"""
+        zoom = min(max(1.0, MAX_ZOOM_RADIUS / self._fit_radius), max(1.0, self.zoom * factor))
+        factor = zoom / self.zoom
+        self.zoom = zoom
+        self.place(self.radius * factor, point[0] - (point[0] - self.x_offset) * factor,
+                   point[1] - (point[1] - self.y_offset) * factor)
+
+    def pan(self, dx: float, dy: float) -> None:
+        """move the canvas by (dx, dy) screen pixels"""
+        self.place(self.radius, self.x_offset + dx, self.y_offset + dy)
+
+    def placement(self) -> list[float]:
+        """the cell radius, top left corner and zoom the canvas is shown at (what restore takes back)"""
+        return [self.radius, self.x_offset, self.y_offset, self.zoom]
+
+    def restore(self, radius: float, x_offset: float, y_offset: float, zoom: float) -> None:
+        """show the canvas at a placement this layout had before (zoomed and panned the same way)"""
+        self.zoom = zoom
+        self.place(radius, x_offset, y_offset)
+
+    @property
+    def fitted(self) -> bool:
+        """whether this layout has been fit to a screen yet"""
+        return self.col_x is not None
+
+    def centre(self, coord: tuple[int, int]) -> tuple[float, float] | None:
+        """the screen position of the centre of the cell at coord"""
+        if not self._row_y:
+            return None
+        x, y = coord
+        return (self._col_x[y % 2][x], self._row_y[y])
+
+
+TILE_SIZE = 64  # width and height (in cells) of the tiles colour planes are stored in
+STAMP_CHUNK = TILE_SIZE * TILE_SIZE  # cells in a chunk of operation marks (see CellStamps)
+
+
+class ColourPlanes:
+    """the colours of every cell of one canvas layer, stored as arrays in TILE_SIZE x TILE_SIZE tiles
+    a tile is only made when one of its cells is first written to, every cell of a missing tile has the background
+    colour. an 'empty' cell is one with an alpha of 0
+
+    Instance Attributes:
+        - width, height: number of cells across and down
+        - background: the rgb of every cell that hasn't been written to
+        - background_alpha: the alpha of every cell that hasn't been written to
+        - tiles: the (rgb, alpha) arrays of every tile that has been written to, by tile index
+            (tile row * tiles across + tile column), with shapes (TILE_SIZE, TILE_SIZE, 3) and (TILE_SIZE, TILE_SIZE)
+    """
+    width: int
+    height: int
+    background: tuple[int, int, int]
+    background_alpha: float
+    tiles: dict[int, tuple[np.ndarray, np.ndarray]]
+
+    def __init__(self, width: int, height: int, colour: tuple[int, int, int] | None = (255, 255, 255),
+                 alpha: float = 1.0) -> None:
+        """planes with every cell the same colour"""
+        self.width, self.height = width, height
+        self.background = tuple(colour) if colour else (0, 0, 0)
+        self.background_alpha = alpha
+        self.tiles = {}
+
+    @classmethod
+    def from_arrays(cls, rgb: np.ndarray, alpha: np.ndarray) -> ColourPlanes:
+        """planes holding the colours of (height, width, 3) and (height, width) arrays
+        the colour of the top left cell is taken as the background, so tiles made only of it aren't kept"""
+        height, width = alpha.shape
+        planes = cls(width, height, tuple(rgb[0, 0].tolist()), float(alpha[0, 0]))
+        for key in range(planes.tiles_across * planes.tiles_down):
+            top, left = divmod(key, planes.tiles_across)
+            top, left = top * TILE_SIZE, left * TILE_SIZE
+            tile_rgb = rgb[top:top + TILE_SIZE, left:left + TILE_SIZE]
+            tile_alpha = alpha[top:top + TILE_SIZE, left:left + TILE_SIZE]
+            if (tile_rgb != planes.background).any() or (tile_alpha != planes.background_alpha).any():
+                new_rgb, new_alpha = planes.blank_tile()
+                new_rgb[:tile_rgb.shape[0], :tile_rgb.shape[1]] = tile_rgb
+                new_alpha[:tile_alpha.shape[0], :tile_alpha.shape[1]] = tile_alpha
+                planes.tiles[key] = (new_rgb, new_alpha)
+        return planes
+
+    @property
+    def tiles_across(self) -> int:
+        """number of tiles in a row of tiles"""
+        return -(-self.width // TILE_SIZE)
+
+    @property
+    def tiles_down(self) -> int:
+        """number of tiles in a column of tiles"""
+        return -(-self.height // TILE_SIZE)
+
+    def blank_tile(self) -> tuple[np.ndarray, np.ndarray]:
+        """a new tile with every cell the background colour"""
+        rgb = np.empty((TILE_SIZE, TILE_SIZE, 3), dtype=np.uint8)
+        rgb[:] = self.background
+        return rgb, np.full((TILE_SIZE, TILE_SIZE), self.background_alpha, dtype=np.float64)
+
+    def tile_key(self, x: int, y: int) -> int:
+        """the index of the tile cell (x, y) is in"""
+        return (y // TILE_SIZE) * self.tiles_across + x // TILE_SIZE
+
+    def get(self, x: int, y: int) -> tuple[tuple[int, int, int], float]:
+        """the rgb and alpha of cell (x, y)"""
+        tile = self.tiles.get(self.tile_key(x, y))
+        if tile is None:
+            return self.background, self.background_alpha
+        y, x = y % TILE_SIZE, x % TILE_SIZE
+        return tuple(tile[0][y, x].tolist()), float(tile[1][y, x])
+
+    def set(self, x: int, y: int, rgb: tuple[int, int, int] | None = None, alpha: float | None = None) -> None:
+        """write the rgb and/or alpha of cell (x, y), making its tile if it hasn't been made yet"""
+        key = self.tile_key(x, y)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.tiles[key] = self.blank_tile()
+        y, x = y % TILE_SIZE, x % TILE_SIZE
+        if rgb is not None:
+            tile[0][y, x] = rgb
+        if alpha is not None:
+            tile[1][y, x] = alpha
+
+    def gather(self, cells: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """the rgb and alpha of the cells at the given flat indices, as (n, 3) and (n,) arrays"""
+        rgb = np.empty((len(cells), 3), dtype=np.uint8)
+        rgb[:] = self.background
+        alpha = np.full(len(cells), self.background_alpha, dtype=np.float64)
+        for key, where, ys, xs in self.by_tile(cells):
+            tile = self.tiles.get(key)
+            if tile is not None:
+                rgb[where], alpha[where] = tile[0][ys, xs], tile[1][ys, xs]
+        return rgb, alpha
+
+    def scatter(self, cells: np.ndarray, rgb: np.ndarray, alpha: np.ndarray) -> None:
+        """write (n, 3) and (n,) arrays of colours to the cells at the given flat indices"""
+        for key, where, ys, xs in self.by_tile(cells):
+            tile = self.tiles.get(key)
+            if tile is None:
+                tile = self.tiles[key] = self.blank_tile()
+            tile[0][ys, xs], tile[1][ys, xs] = rgb[where], alpha[where]
+
+    def by_tile(self, cells: np.ndarray):
+        """groups flat cell indices by the tile they're in, yielding the tile index, the positions in cells of the
+        tile's cells, and where those cells are in the tile (rows, columns)"""
+        cells = np.asarray(cells, dtype=np.int64)
+        ys, xs = np.divmod(cells, self.width)
+        keys = (ys // TILE_SIZE) * self.tiles_across + xs // TILE_SIZE
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for where in np.split(order, bounds) if len(cells) else []:
+            yield int(keys[where[0]]), where, ys[where] % TILE_SIZE, xs[where] % TILE_SIZE
+
+    def tile_arrays(self, key: int) -> tuple[np.ndarray, np.ndarray]:
+        """the colours of a tile (background coloured arrays if it hasn't been made)"""
+        tile = self.tiles.get(key)
+        return tile if tile is not None else self.blank_tile()
+
+    def region(self, left: int, top: int, right: int, bottom: int) -> tuple[np.ndarray, np.ndarray]:
+        """the colours of the cells in columns left to right and rows top to bottom (ends excluded),
+        as (rows, columns, 3) and (rows, columns) arrays"""
+        rgb = np.empty((bottom - top, right - left, 3), dtype=np.uint8)
+        rgb[:] = self.background
+        alpha = np.full((bottom - top, right - left), self.background_alpha, dtype=np.float64)
+        for tile_y in range(top // TILE_SIZE, -(-bottom // TILE_SIZE)):
+            for tile_x in range(left // TILE_SIZE, -(-right // TILE_SIZE)):
+                tile = self.tiles.get(tile_y * self.tiles_across + tile_x)
+                if tile is None:
+                    continue
+                y0, x0 = max(top, tile_y * TILE_SIZE), max(left, tile_x * TILE_SIZE)
+                y1, x1 = min(bottom, (tile_y + 1) * TILE_SIZE), min(right, (tile_x + 1) * TILE_SIZE)
+                in_tile = (slice(y0 - tile_y * TILE_SIZE, y1 - tile_y * TILE_SIZE),
+                           slice(x0 - tile_x * TILE_SIZE, x1 - tile_x * TILE_SIZE))
+                rgb[y0 - top:y1 - top, x0 - left:x1 - left] = tile[0][in_tile]
+                alpha[y0 - top:y1 - top, x0 - left:x1 - left] = tile[1][in_tile]
+        return rgb, alpha
+
+    def dense(self) -> tuple[np.ndarray, np.ndarray]:
+        """every cell's colour as (height, width, 3) and (height, width) arrays"""
+        return self.region(0, 0, self.width, self.height)
+
+    def copy(self) -> ColourPlanes:
+        """returns a copy of the planes"""
+        planes = ColourPlanes(self.width, self.height, self.background, self.background_alpha)
+        planes.copy_from(self)
+        return planes
+
+    def copy_from(self, other: ColourPlanes) -> None:
+        """overwrite every colour with the colours of other (planes of the same size)"""
+        self.background, self.background_alpha = other.background, other.background_alpha
+        self.tiles = {key: (rgb.copy(), alpha.copy()) for key, (rgb, alpha) in other.tiles.items()}
+
+    def copy_cells_from(self, other: ColourPlanes, cells: np.ndarray) -> None:
+        """overwrite the colours of the cells at the given flat indices with their colours in other
+        (planes of the same size and background), leaving every other cell as it is"""
+        self.scatter(cells, *other.gather(cells))
+
+
+class LayerSettings:
+    """how a layer shows in the composite of its canvas
+
+    Instance Attributes:
+        - visible: whether the layer shows at all
+        - opacity: scales the alpha of every cell of the layer
+        - blend: how the layer's colours mix with the layers below it (one of BLEND_MODES)
+    """
+    visible: bool
+    opacity: float
+    blend: str
+
+    def __init__(self, visible: bool = True, opacity: float = 1.0, blend: str = 'NORMAL') -> None:
+        self.visible = visible
+        self.opacity = opacity
+        self.blend = blend
+
+
 class Canvas:
     """parent class of HexCanvas and HistoryEntry"""
     width: int
     height: int
-    layers: list[list[list[Pixel]]]
+    layers: list[PixelGrid]
+    planes: list[ColourPlanes]  # the colours of each layer (what the pixels of a layer read and write)
     background: tuple[int, int, int] | None
+    layout: CanvasLayout
+
+    def same_layers(self, other: Canvas) -> bool:
+        """whether other has as many layers as self, each the same size and with the same background"""
+        return self.background == other.background and len(self.planes) == len(other.planes) and all(
+            (p.width, p.height, p.background, p.background_alpha) ==
+            (q.width, q.height, q.background, q.background_alpha) for p, q in zip(self.planes, other.planes))
 
     def get_adjacent_pixels(self, layer: int,
                             coord: tuple[int, int], update: bool = False) -> list[Pixel]:
@@ -22,93 +328,296 @@ class Canvas:
         Preconditions:
             - self.grid[coord[0]][coord[1]] is a valid Pixel
         """
+        act_adj = self.layers[layer].neighbours(coord)
+        if update:
+            self.layers[layer][coord[1]][coord[0]].adj = act_adj
+        return act_adj
+
+    def position_pixels(self, screen: pygame.Surface) -> None:
+        """assuming a pygame screen has been made, attribute the position for every pixel in a canvas/historyentry
+        (every pixel reads its position from the shared layout, so no pixel is visited here)"""
+        self.layout.fit(screen, self.width, self.height)
+
+
+class CellStamps:
+    """marks on the cells of a layer that only last one operation (a stroke, click or fill): which cells were drawn,
+    coloured or queued during it. a cell is marked while its stamp is the generation of the running operation,
+    so starting the next operation unmarks every cell at once, without visiting any of them.
+    stamps are kept in chunks of STAMP_CHUNK cells (in flat index order), each made when a cell in it is first marked,
+    so they take as much memory as the parts of the layer that were ever marked, not the whole layer
+
+    Instance Attributes:
+        - size: number of cells
+        - generation: the number of the running operation (stamps of earlier operations are smaller)
+        - stamps: for each kind of mark, the chunks of stamps made so far by chunk number (the generation each cell
+            was last marked in)
+    """
+    size: int
+    generation: int
+    stamps: dict[str, dict[int, array]]
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.generation = 1
+        self.stamps = {}
+
+    def marked(self, kind: str, index: int) -> bool:
+        """whether the cell was given this kind of mark during the running operation"""
+        chunks = self.stamps.get(kind)
+        if chunks is None:
+            return False
+        chunk = chunks.get(index // STAMP_CHUNK)
+        return chunk is not None and chunk[index % STAMP_CHUNK] == self.generation
+
+    def mark(self, kind: str, index: int, value: bool = True) -> None:
+        """mark (or unmark) the cell for the running operation"""
+        chunks = self.stamps.get(kind)
+        if chunks is None:
+            if not value:
+                return
+            chunks = self.stamps[kind] = {}
+        chunk = chunks.get(index // STAMP_CHUNK)
+        if chunk is None:
+            if not value:
+                return
+            chunk = chunks[index // STAMP_CHUNK] = array('I', bytes(4 * STAMP_CHUNK))
+        chunk[index % STAMP_CHUNK] = self.generation if value else 0
+
+    def next_generation(self) -> None:
+        """start a new operation (unmarking every cell)"""
+        self.generation += 1
+
+
+class PixelGrid:
+    """the pixels of one canvas layer, indexed like a list of rows (grid[y][x])
+    a pixel is only made when it's asked for, and kept only while something else holds on to it (so the same cell is
+    the same Pixel while it's in use, and a fill over the whole layer doesn't leave a Pixel behind for every cell)
+
+    Instance Attributes:
+        - planes: the colour planes of the layer
+        - layout: the layout shared by the pixels of the canvas
+        - stamps: the marks the running operation left on the layer's cells
+        - hovered, selected: the flat indices of the cells that are hovered by the cursor / selected
+          (kept here rather than on the pixels, which don't last)
+    """
+    planes: ColourPlanes
+    layout: CanvasLayout
+    stamps: CellStamps
+    hovered: set[int]
+    selected: set[int]
+    _pixels: weakref.WeakValueDictionary[int, Pixel]  # the pixels in use, by flat cell index
+
+    def __init__(self, planes: ColourPlanes, layout: CanvasLayout) -> None:
+        self.planes = planes
+        self.layout = layout
+        self.stamps = CellStamps(planes.width * planes.height)
+        self.hovered, self.selected = set(), set()
+        self._pixels = weakref.WeakValueDictionary()
+
+    def __len__(self) -> int:
+        """number of rows"""
+        return self.planes.height
+
+    def __getitem__(self, y: int) -> PixelRow:
+        """a row of pixels"""
+        if y < 0:
+            y += self.planes.height
+        if not 0 <= y < self.planes.height:
+            raise IndexError('row ' + str(y) + ' is not on the canvas')
+        return PixelRow(self, y)
+
+    def __iter__(self):
+        """every row, from the top"""
+        return (PixelRow(self, y) for y in range(self.planes.height))
+
+    def pixel(self, x: int, y: int) -> Pixel:
+        """the pixel at (x, y)"""
+        index = y * self.planes.width + x
+        pixel = self._pixels.get(index)
+        if pixel is None:
+            pixel = self._pixels[index] = Pixel((x, y), None, self.layout, grid=self)
+        return pixel
+
+    def neighbours(self, coord: tuple[int, int]) -> list[Pixel]:
+        """the pixels adjacent to coord, starting from the left one then going around clockwise"""
         x, y = coord
-        x_range, y_range = self.width - 1, self.height - 1
+        x_range, y_range = self.planes.width - 1, self.planes.height - 1
         if y % 2 == 0:
             pot_adj = [(x - 1, y), (x - 1, y - 1), (x, y - 1), (x + 1, y), (x, y + 1), (x - 1, y + 1)]
         else:
             pot_adj = [(x - 1, y), (x, y - 1), (x + 1, y - 1), (x + 1, y), (x + 1, y + 1), (x, y + 1)]
-        act_adj = []
+        return [self.pixel(adj[0], adj[1]) for adj in pot_adj if 0 <= adj[0] <= x_range and 0 <= adj[1] <= y_range]
 
-        for adj in pot_adj:
-            if 0 <= adj[0] <= x_range and 0 <= adj[1] <= y_range:
-                adj_pixel = self.layers[layer][adj[1]][adj[0]]
-                act_adj.append(adj_pixel)
-        if update:
-            self.layers[layer][coord[1]][coord[0]].adj = act_adj
-        return act_adj
 
-    def position_pixels(self, screen: pygame.Surface) -> None:
-        """assuming a pygame screen has been made, attribute the position for every pixel in a canvas/historyentry"""
-        root3 = math.sqrt(3)
-        margin_horiz, margin_vert = 0.5, 0.9
-        w, h = screen.get_width() * margin_horiz, screen.get_height() * margin_vert
-        n, m = self.width, self.height
-        r = min(w / (root3 * (n + 0.5)), h / (1.5 * m + 0.5))  # pixel radius
-        x_offset = screen.get_width() * (1 - margin_horiz) / 2
-        y_offset = screen.get_height() * (1 - margin_vert) / 2
+class PixelRow:
+    """a row of a PixelGrid"""
+    grid: PixelGrid
+    y: int
+
+    def __init__(self, grid: PixelGrid, y: int) -> None:
+        self.grid = grid
+        self.y = y
+
+    def __len__(self) -> int:
+        return self.grid.planes.width
 
-        for layer in range(0, len(self.layers)):
-            for i in range(0, m):
-                for j in range(0, n):
-                    extra_offset = 0.5 if i % 2 == 0 else 1
-                    x = r * root3 * (extra_offset + j)
-                    y = r * (1 + 1.5 * i)
-                    self.layers[layer][i][j].position = (x_offset + x, y_offset + y)
-                    self.layers[layer][i][j].size = r
+    def __getitem__(self, x: int) -> Pixel:
+        width = self.grid.planes.width
+        if x < 0:
+            x += width
+        if not 0 <= x < width:
+            raise IndexError('column ' + str(x) + ' is not on the canvas')
+        return self.grid.pixel(x, self.y)
+
+    def __iter__(self):
+        return (self.grid.pixel(x, self.y) for x in range(self.grid.planes.width))
 
 
 class Pixel:
-    """A pixel on the grid
+    """A pixel on the grid (a view of one cell of its layer's colour planes)
 
     Instance Attributes:
-        - rgb: an RGB tuple. If it's None then it's an 'empty' pixel
-        - alpha: alpha percentage
+        - rgb: an RGB tuple
+        - alpha: alpha percentage. If it's 0 then it's an 'empty' pixel
         - coord: x, y coords for the hexagonal grid
-        - adj: list of neighbouring pixels
+        - planes: the colour planes the pixel's colour lives in
+        - grid: the pixels of the pixel's layer (None for a pixel on its own)
+        - adj: list of neighbouring pixels (found whenever asked for, unless set, so pixels don't keep each other)
+        - layout: the layout shared by the pixel's canvas
         - position: actual drawn position on pygame canvas (centre of pixel). If it's None then it hasn't been drawn
         - size: actual radius of pixel drawn (affected by zooming)
         - hovered: if pixel is hovered by cursor
+        - selected: if pixel is selected
     """
-    rgb: tuple[int, int, int] | None
-    alpha: float
     coord: tuple[int, int]
-    adj: list[Pixel]
-    position: tuple[float, float] | None
-    size: float
-    hovered: bool
-    selected: bool
-    drawn: bool  # if pixel has been drawn during a draw
-    coloured: bool  # if pixel has been coloured during a colouring. Useful for when pixels are marked drawn but not coloured
-    in_queue: bool  # if pixel is in a queue for colouring
+    planes: ColourPlanes
+    grid: PixelGrid | None
+    layout: CanvasLayout | None
+    _cell: tuple[int, int]  # where the pixel is in its planes (x, y)
+    _stamps: CellStamps  # the operation marks of the pixel's layer (the drawn, coloured and in_queue properties)
+    _index: int  # the flat index of the pixel's cell in _stamps, _hovered and _selected
+    _hovered: set[int]  # the hovered cells of the pixel's layer (the hovered property)
+    _selected: set[int]  # the selected cells of the pixel's layer (the selected property)
+    _adj: list[Pixel] | None  # the neighbouring pixels, if they were set
 
 
     def __init__(self, coord: tuple[int, int], colour: tuple[int, int, int] | None,
-                 pos: tuple[float, float] | None, size: float = 1.0, alpha: float = 1.0) -> None:
-        """create a new pixel (when loading grid or erasing)"""
-        self.rgb = colour
-        self.alpha = alpha
+                 layout: CanvasLayout | None, alpha: float = 1.0, grid: PixelGrid | None = None) -> None:
+        """create a new pixel (when loading grid or erasing)
+        a pixel of a canvas layer is given its layer's grid, and keeps the colour the layer has for it if colour
+        is None. otherwise the pixel gets planes of its own"""
         self.coord = coord
-        self.adj = []
-        self.position = pos
-        self.size = size
-        self.hovered = False
-        self.selected = False
-        self.drawn = False
-        self.coloured = False
-        self.in_queue = False
+        self.grid = grid
+        if grid is None:
+            self.planes, self._cell = ColourPlanes(1, 1, colour, alpha), (0, 0)
+            self._stamps, self._index = CellStamps(1), 0
+            self._hovered, self._selected = set(), set()
+        else:
+            self.planes, self._cell = grid.planes, coord
+            self._stamps, self._index = grid.stamps, coord[1] * grid.planes.width + coord[0]
+            self._hovered, self._selected = grid.hovered, grid.selected
+            if colour is not None:
+                self.rgb, self.alpha = colour, alpha
+        self._adj = None
+        self.layout = layout
+
+    @property
+    def drawn(self) -> bool:
+        """if pixel has been drawn during the running operation"""
+        return self._stamps.marked('drawn', self._index)
+
+    @drawn.setter
+    def drawn(self, value: bool) -> None:
+        self._stamps.mark('drawn', self._index, value)
+
+    @property
+    def coloured(self) -> bool:
+        """if pixel has been coloured during the running operation
+        (useful for when pixels are marked drawn but not coloured)"""
+        return self._stamps.marked('coloured', self._index)
+
+    @coloured.setter
+    def coloured(self, value: bool) -> None:
+        self._stamps.mark('coloured', self._index, value)
+
+    @property
+    def in_queue(self) -> bool:
+        """if pixel has been queued for colouring during the running operation"""
+        return self._stamps.marked('queued', self._index)
+
+    @in_queue.setter
+    def in_queue(self, value: bool) -> None:
+        self._stamps.mark('queued', self._index, value)
+
+    @property
+    def hovered(self) -> bool:
+        """if pixel is hovered by cursor"""
+        return self._index in self._hovered
+
+    @hovered.setter
+    def hovered(self, value: bool) -> None:
+        if value:
+            self._hovered.add(self._index)
+        else:
+            self._hovered.discard(self._index)
+
+    @property
+    def selected(self) -> bool:
+        """if pixel is selected"""
+        return self._index in self._selected
+
+    @selected.setter
+    def selected(self, value: bool) -> None:
+        if value:
+            self._selected.add(self._index)
+        else:
+            self._selected.discard(self._index)
+
+    @property
+    def rgb(self) -> tuple[int, int, int]:
+        """the pixel's colour"""
+        return self.planes.get(*self._cell)[0]
+
+    @rgb.setter
+    def rgb(self, colour: tuple[int, int, int]) -> None:
+        self.planes.set(*self._cell, rgb=colour)
+
+    @property
+    def alpha(self) -> float:
+        """the pixel's alpha"""
+        return self.planes.get(*self._cell)[1]
+
+    @alpha.setter
+    def alpha(self, alpha: float) -> None:
+        self.planes.set(*self._cell, alpha=alpha)
+
+    @property
+    def adj(self) -> list[Pixel]:
+        """the neighbouring pixels"""
+        if self._adj is not None:
+            return self._adj
+        return self.grid.neighbours(self.coord) if self.grid else []
+
+    @adj.setter
+    def adj(self, pixels: list[Pixel]) -> None:
+        self._adj = pixels
+
+    @property
+    def position(self) -> tuple[float, float] | None:
+        """centre of the pixel on the screen"""
+        return self.layout.centre(self.coord) if self.layout else None
+
+    @property
+    def size(self) -> float:
+        """radius of the pixel on the screen"""
+        return self.layout.radius if self.layout else 1.0
 
     def copy(self) -> Pixel:
-        """returns a copy of itself"""
-        pix = Pixel(self.coord, self.rgb, self.position, self.size, self.alpha)
+        """returns a copy of itself (with planes of its own)"""
+        pix = Pixel(self.coord, self.rgb, self.layout, self.alpha)
         pix.selected = self.selected
         return pix
 
-    def is_copy(self, other: Pixel) -> bool:
-        """checks if another Pixel is a copy of itself (used to avoid unecessary redrawing)"""
-        return [self.rgb, self.alpha, self.position, self.size, self.selected] == \
-            [other.rgb, other.alpha, other.position, other.size, other.selected]
-
     def set_drawn(self, enforce_drawn_once: bool) -> bool:
         """set pixel as drawn. returns false if pixel has already been drawn, i.e. this is a problem"""
         if enforce_drawn_once:
@@ -157,7 +666,8 @@ class Pixel:
         """
         if not relative_rgba:
             relative_rgba = self.rgb + (self.alpha,)
-        col_deviation = sum(abs(relative_rgba[i] - other.rgb[i]) for i in range(3)) / 3 / 255
+        other_rgb = other.rgb
+        col_deviation = sum(abs(relative_rgba[i] - other_rgb[i]) for i in range(3)) / 3 / 255
         alpha_deviation = abs(relative_rgba[3] - other.alpha) if alpha_tolerate else 0.0
         return col_deviation <= tolerance ** 2 and alpha_deviation <= tolerance ** 2
 
@@ -197,9 +707,10 @@ class Pixel:
                             rgba = actual_drawn.rgb + (actual_drawn.alpha,)
                             draw_hexagon(screen, rgba, actual_drawn.position, actual_drawn.size)
                 visited.add(self)
-                new_pix_queue = pix_queue + self.adj
-                cycle_list(self.adj, adj_index)
-                for pix in self.adj:
+                adj = self.adj
+                new_pix_queue = pix_queue + adj
+                cycle_list(adj, adj_index)
+                for pix in adj:
                     if pix not in visited and pix not in pix_queue:
                         if self.alike(pix, tolerance, alpha_tolerate, relative_rgba):
                             adj_index = (adj_index + 1) % spiral
@@ -215,8 +726,7 @@ class Pixel:
                 index, curr_alpha = 0, alpha
                 while pix_queue and index < len(pix_queue) and curr_alpha > 0:
                     pix = pix_queue[index]
-                    pix.in_queue = False
-                    visited.add(pix)
+                    visited.add(pix)  # (so it won't be queued again, though it stays marked in_queue)
                     # here we use pix_queue as a priority queue as opposed to in spiral mode (opposite use)
                     if self.alike(pix, tolerance, alpha_tolerate, relative_rgba):
                         if not keep_mass:
@@ -229,7 +739,6 @@ class Pixel:
                                     x.in_queue = True
                                     pix_queue.append(x)
                             pix_queue.pop(index)
-                            pix.in_queue = False
                             # we only need to actually apply the draw for a meaningful change
                             if pix.alpha != alpha or pix.rgb != colour:
                                 # pix.recolour(colour, curr_alpha, overwrite)
@@ -0,0 +1,238 @@
+"""drawing a canvas with arrays instead of one polygon per cell
+
+Once per layout, every screen pixel of the canvas area is mapped to the index of the cell whose hexagon contains it
+(-1 if it's in none). Picking the cell under the cursor is then one lookup in that map, and drawing the canvas is a
+gather of the cells' colours through the map into a surface, which is blitted onto the screen in one go.
+
+Zoomed out far enough for cells to be smaller than screen pixels, the colours come from a level of a mip pyramid
+instead (see mip_pyramid), each screen pixel showing the average of the cells around it rather than just one of them.
+
+The gathered colours are premultiplied by their alpha, and blended (BLEND_PREMULTIPLIED) over a checkerboard
+underlay made once per layout, so translucent and erased cells show what's beneath them.
+"""
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.aux_code.canvas_foundation import CanvasLayout
+from src.aux_code.mip_pyramid import MipPyramid, lod_level
+from src.aux_code.pygame_configure import pygame, math
+
+if TYPE_CHECKING:
+    from src.aux_code.canvas_system import HexCanvas
+
+# above this many cells, a redraw regathers the whole canvas instead of patching each cell's bounding box
+FULL_REDRAW_CELLS = 150
+# the transparency checkerboard under the canvas: size of its squares (in screen pixels) and its two colours
+CHECKER_SIZE = 8
+CHECKER_COLOURS = ((255, 255, 255), (204, 204, 204))
+
+
+def canvas_rect(layout: CanvasLayout, width: int, height: int, screen_size: tuple[int, int]) -> pygame.Rect:
+    """the area of the screen a width x height canvas covers (clipped to the view and the screen)"""
+    r = layout.radius
+    left, top = math.floor(layout.x_offset), math.floor(layout.y_offset)
+    right = math.ceil(layout.x_offset + r * math.sqrt(3) * (width + 0.5))
+    bottom = math.ceil(layout.y_offset + r * (1.5 * height + 0.5))
+    return pygame.Rect(left, top, right - left, bottom - top).clip(layout.view).clip(pygame.Rect((0, 0), screen_size))
+
+
+def cell_index_map(layout: CanvasLayout, width: int, height: int, rect: pygame.Rect) -> np.ndarray:
+    """the flat index of the cell under every screen pixel of rect, as a (rect width, rect height) array
+    (indexed x first, like pygame.surfarray), with -1 where a screen pixel isn't in any cell"""
+    r, root3 = layout.radius, math.sqrt(3)
+    # centres of the screen pixels, relative to the centre of cell (0, 0), in cells
+    # (single precision is plenty once they're in cells, and halves the work on the full size arrays)
+    px = (np.arange(rect.left, rect.right) + 0.5 - (layout.x_offset + r * root3 * 0.5)) / r
+    py = (np.arange(rect.top, rect.bottom) + 0.5 - (layout.y_offset + r)) / r
+
+    # fractional cube coordinates, rounded to the nearest cell (the component that rounded the most gets fixed)
+    # cz only depends on the screen row, so it stays one row of values
+    cx = (root3 / 3 * px).astype(np.float32)[:, None] - (py / 3).astype(np.float32)[None, :]
+    cz = (2 / 3 * py).astype(np.float32)[None, :]
+    cy = -cx - cz
+    rx, ry, rz = np.rint(cx), np.rint(cy), np.rint(cz)
+    dx, dy, dz = np.abs(rx - cx), np.abs(ry - cy), np.abs(rz - cz)
+    fix_x = (dx > dy) & (dx > dz)
+    rx = np.where(fix_x, -ry - rz, rx)
+    rz = np.where(~fix_x & (dz >= dy), -rx - ry, np.broadcast_to(rz, rx.shape))
+
+    # cube coordinates to (column, row), odd rows being shifted right
+    rows = rz.astype(np.int64)
+    cols = rx.astype(np.int64) + (rows - (rows & 1)) // 2
+    inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    return np.where(inside, rows * width + cols, -1).astype(np.int32)
+
+
+def shifted_index_map(layout: CanvasLayout, width: int, height: int, rect: pygame.Rect,
+                      old_map: np.ndarray, old_rect: pygame.Rect, shift: tuple[int, int]) -> np.ndarray:
+    """the cell index map of rect, for a canvas that moved by a whole number of screen pixels (shift) since old_map
+    (of old_rect) was made: the part of old_map still on screen is moved, only the rest is worked out"""
+    index_map = np.empty(rect.size, dtype=np.int32)
+    kept = rect.clip(old_rect.move(shift))
+    if kept.w == 0 or kept.h == 0:
+        return cell_index_map(layout, width, height, rect)
+    index_map[kept.left - rect.left:kept.right - rect.left, kept.top - rect.top:kept.bottom - rect.top] = \
+        old_map[kept.left - shift[0] - old_rect.left:kept.right - shift[0] - old_rect.left,
+                kept.top - shift[1] - old_rect.top:kept.bottom - shift[1] - old_rect.top]
+    # the strips on either side of what was kept (full height), then above and below it
+    strips = [pygame.Rect(rect.left, rect.top, kept.left - rect.left, rect.h),
+              pygame.Rect(kept.right, rect.top, rect.right - kept.right, rect.h),
+              pygame.Rect(kept.left, rect.top, kept.w, kept.top - rect.top),
+              pygame.Rect(kept.left, kept.bottom, kept.w, rect.bottom - kept.bottom)]
+    for strip in strips:
+        if strip.w > 0 and strip.h > 0:
+            index_map[strip.left - rect.left:strip.right - rect.left, strip.top - rect.top:strip.bottom - rect.top] = \
+                cell_index_map(layout, width, height, strip)
+    return index_map
+
+
+class CanvasRenderer:
+    """picks and draws the cells of a canvas through its cell index map
+
+    Instance Attributes:
+        - rect: the area of the screen the canvas covers
+        - index_map: the cell under every screen pixel of rect (see cell_index_map)
+        - surface: the canvas colours at screen resolution (premultiplied, transparent outside the cells)
+        - underlay: the checkerboard shown through translucent cells (transparent outside the cells)
+        - frame: the canvas colours blended over the underlay (what gets blitted onto the screen)
+        - level: the level of the pyramid the colours are drawn from (0 draws the cells themselves)
+        - pyramid: downsampled copies of the canvas composite, for drawing it zoomed out
+    """
+    rect: pygame.Rect | None
+    index_map: np.ndarray | None
+    surface: pygame.Surface | None
+    underlay: pygame.Surface | None
+    frame: pygame.Surface | None
+    level: int
+    pyramid: MipPyramid
+    _key: tuple | None  # the layout the map was made for
+    _checker: tuple[pygame.Rect, pygame.Surface] | None  # the checkerboard over a whole view, and that view
+    _region: tuple[int, int, int, int] | None  # the columns and rows (left, top, right, bottom) of the mapped texels
+    _slots: np.ndarray | None  # where each element of the index map is in _region, flattened (its area if it's -1)
+
+    def __init__(self) -> None:
+        self.rect, self.index_map, self.surface = None, None, None
+        self.underlay, self.frame = None, None
+        self._key, self._region, self._slots = None, None, None
+        self._checker = None
+        self.level, self.pyramid = 0, MipPyramid()
+
+    def update(self, canvas: HexCanvas, screen_size: tuple[int, int]) -> bool:
+        """remake the index map if the canvas layout (or the screen) changed since it was made
+        returns whether it was remade (in which case the whole canvas needs drawing)"""
+        layout = canvas.layout
+        key = (layout.radius, layout.x_offset, layout.y_offset, tuple(layout.view), canvas.width, canvas.height,
+               tuple(screen_size))
+        if key == self._key:
+            return False
+        old_key, old_rect, old_map = self._key, self.rect, self.index_map
+        self._key = key
+        self.rect = canvas_rect(layout, canvas.width, canvas.height, screen_size)
+        shift = (layout.x_offset - old_key[1], layout.y_offset - old_key[2]) if old_key else (0.5, 0.5)
+        whole_shift = (round(shift[0]), round(shift[1]))
+        if (old_key and old_key[0] == key[0] and old_key[4:] == key[4:]
+                and max(abs(shift[0] - whole_shift[0]), abs(shift[1] - whole_shift[1])) < 1e-6):
+            # only panned by whole screen pixels
+            self.index_map = shifted_index_map(layout, canvas.width, canvas.height, self.rect, old_map, old_rect,
+                                               whole_shift)
+        else:
+            self.index_map = cell_index_map(layout, canvas.width, canvas.height, self.rect)
+        # the texel of the pyramid level each screen pixel shows, as a slot in the region of texels in the view
+        self.level = lod_level(layout.radius)
+        self._region, self._slots = None, None
+        inside = self.index_map >= 0
+        if inside.any():
+            rows, cols = np.divmod(self.index_map, canvas.width)
+            rows, cols = rows >> self.level, cols >> self.level
+            top, bottom = int(rows[inside].min()), int(rows[inside].max()) + 1
+            left, right = int(cols[inside].min()), int(cols[inside].max()) + 1
+            self._region = (left, top, right, bottom)
+            self._slots = np.where(inside, (rows - top) * (right - left) + cols - left, (bottom - top) * (right - left))
+        self.surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        self.frame = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        self.underlay = self.checkerboard(layout.view)
+        return True
+
+    def checkerboard(self, view: pygame.Rect) -> pygame.Surface:
+        """the checkerboard underlay, only inside the cells of the index map
+        (the squares are fixed to the screen, so the checkerboard of the whole view is made once and cut from)"""
+        if self._checker is None or self._checker[0] != view:
+            checker = pygame.Surface(view.size, pygame.SRCALPHA)
+            xs = (np.arange(view.left, view.right) // CHECKER_SIZE)[:, None]
+            ys = (np.arange(view.top, view.bottom) // CHECKER_SIZE)[None, :]
+            light = (xs + ys) % 2 == 0
+            pygame.surfarray.blit_array(checker, np.where(light[..., None], CHECKER_COLOURS[0],
+                                                          CHECKER_COLOURS[1]).astype(np.uint8))
+            self._checker = (pygame.Rect(view), checker)
+        underlay = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+        underlay.blit(self._checker[1], (0, 0), self.rect.move(-view.left, -view.top))
+        alphas = pygame.surfarray.pixels_alpha(underlay)
+        alphas[...] = np.where(self.index_map >= 0, 255, 0)
+        del alphas  # unlocks the surface
+        return underlay
+
+    def pick(self, x: float, y: float) -> int:
+        """the index of the cell under screen position (x, y), or -1"""
+        i, j = math.floor(x) - self.rect.x, math.floor(y) - self.rect.y
+        if 0 <= i < self.rect.w and 0 <= j < self.rect.h:
+            return int(self.index_map[i, j])
+        return -1
+
+    def draw(self, screen: pygame.Surface, canvas: HexCanvas, cells: set[int] | None = None) -> int:
+        """draw the given cells of canvas (None for all of them) onto screen, returns how many were drawn
+        cells show the composite of the canvas layers, over the checkerboard
+        (zoomed out to a pyramid level, every drawing is of the whole view)"""
+        self.pyramid.touch(canvas.composite, cells)
+        if self.update(canvas, screen.get_size()):
+            cells = None
+        full = cells is None or len(cells) > FULL_REDRAW_CELLS or self.level > 0
+
+        if full:  # the colours of the texels in the view, gathered a tile at a time
+            if self._region is None:  # no cells in the view
+                self.surface.fill((0, 0, 0, 0))
+            else:
+                rgb, alpha = self.pyramid.level(self.level).region(*self._region)
+                palette = np.append(self.pack(rgb.reshape(-1, 3), alpha.reshape(-1)), np.uint32(0))
+                pygame.surfarray.blit_array(self.surface, palette[self._slots])
+            boxes = [pygame.Rect((0, 0), self.rect.size)]
+        else:  # only the cells in the view
+            boxes = [self.cell_box(canvas.layout, canvas.width, cell) for cell in cells]
+            cells = [cell for cell, box in zip(cells, boxes) if box.w > 0 and box.h > 0]
+            boxes = [box for box in boxes if box.w > 0 and box.h > 0]
+            palette = self.pack(*canvas.composite.gather(np.array(cells, dtype=np.int64)))
+            pixels = pygame.surfarray.pixels2d(self.surface)
+            for cell, colour, box in zip(cells, palette, boxes):
+                in_cell = self.index_map[box.left:box.right, box.top:box.bottom] == cell
+                pixels[box.left:box.right, box.top:box.bottom][in_cell] = colour
+            del pixels  # unlocks the surface
+
+        # the boxes get blended as one batch, then go onto the screen as another
+        self.frame.blits([(self.underlay, box.topleft, box) for box in boxes], doreturn=False)
+        self.frame.blits([(self.surface, box.topleft, box, pygame.BLEND_PREMULTIPLIED) for box in boxes],
+                         doreturn=False)
+        screen.blits([(self.frame, box.move(self.rect.topleft), box) for box in boxes], doreturn=False)
+        return canvas.width * canvas.height if full else len(boxes)
+
+    def pack(self, rgb: np.ndarray, alpha: np.ndarray) -> np.ndarray:
+        """(n, 3) rgb and (n,) alpha arrays as premultiplied colours, packed the way the surface stores pixels"""
+        # the surface is 32 bit with 8 bits a channel, so each channel is one byte of the packed colour
+        places = [shift // 8 if sys.byteorder == 'little' else 3 - shift // 8 for shift in self.surface.get_shifts()]
+        alpha = np.clip(alpha, 0.0, 1.0).astype(np.float32)
+        packed = np.empty((len(alpha), 4), dtype=np.uint8)
+        packed[:, places[:3]] = np.rint(rgb * alpha[:, None])
+        packed[:, places[3]] = np.rint(alpha * 255)
+        return packed.view(np.uint32).reshape(-1)
+
+    def cell_box(self, layout: CanvasLayout, width: int, cell: int) -> pygame.Rect:
+        """the bounding box of a cell, in surface coordinates (empty if it's not in the view)"""
+        y, x = divmod(cell, width)
+        cx, cy = layout.centre((x, y))
+        half_w, r = layout.radius * math.sqrt(3) / 2, layout.radius
+        left, top = math.floor(cx - half_w) - self.rect.x, math.floor(cy - r) - self.rect.y
+        box = pygame.Rect(left, top, math.ceil(cx + half_w) - self.rect.x - left + 1,
+                          math.ceil(cy + r) - self.rect.y - top + 1)
+        return box.clip(pygame.Rect((0, 0), self.rect.size))
@@ -1,11 +1,27 @@
 from __future__ import annotations
 
-from src.aux_code.save_and_load import create_file, load_file
+import os
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.aux_code.save_and_load import BackgroundSaver, save_prompt, load_file, snapshot_lists
 from src.aux_code.extra_functions import hsv_to_rgb
-from src.aux_code.history_system import HistoryEntry, History
-from src.aux_code.canvas_foundation import Canvas, Pixel
-from src.aux_code.pygame_configure import pygame, math, draw_hexagon
-from src.aux_code.constants import LINE_TOOLS, TOOLS
+from src.aux_code.history_system import COPY_SPEEDUP, HistoryEntry, History
+from src.aux_code.journal import Journal, journal_path, read_journal
+from src.aux_code.canvas_foundation import Canvas, CanvasLayout, ColourPlanes, LayerSettings, Pixel, PixelGrid
+from src.aux_code.compositing import composite_cells
+from src.aux_code.canvas_render import CanvasRenderer
+from src.aux_code.pygame_configure import pygame, math
+from src.aux_code.constants import LINE_TOOLS, TOOLS, BLEND_MODES
+from src.aux_code.profiler import PROFILER, timed
+from src.aux_code.log import get_logger
+
+if TYPE_CHECKING:
+    from src.aux_code.recorder import Recorder
+
+log, tool_log, history_log = get_logger('canvas'), get_logger('tools'), get_logger('history')
+render_log, io_log = get_logger('render'), get_logger('io')
 
 
 class ToolBelt:
@@ -136,7 +152,7 @@ class ToolBelt:
                     if self.spiral:
                         visited, pix_queue = set(), []
                     else:
-                        visited, pix_queue = {pixel}, pixel.adj
+                        visited, pix_queue = {pixel}, list(pixel.adj)  # (the fill changes its queue)
                         pixel.in_queue = True
                         for pix in pix_queue:
                             pix.in_queue = True
@@ -151,8 +167,7 @@ class ToolBelt:
                                               alpha_dim=self.alpha_dim / 10, tolerance=self.tolerance,
                                               alpha_tolerate=self.alpha_tolerate, draw_inloop=False, spiral=self.spiral,
                                               keep_mass=self.keep_mass)
-                    print("done fill algo")
-                    pixel.in_queue = False
+                    tool_log.debug("done fill algo")
                     return list(changed) + [(pixel, (col[0], col[1], col[2], alpha))], False
             else:
                 return [], False
@@ -203,15 +218,27 @@ class HexCanvas(Canvas):
     Instance Attributes:
         - width: num of pixels horizontally,
         - height: num of pixels vertically
-        - grid: a 2d list, where each element is a horizontal row or pixels
+        - layers: for each layer, a grid of pixels indexed like a 2d list (each element is a horizontal row of pixels)
+        - planes: the colours of each layer (tiled, only painted tiles take memory), which the pixels of the layer
+            are views of
+        - layer_settings: the visibility, opacity and blend mode of each layer
+        - composite: the colours of every layer composited together (what gets drawn)
         - background: the background colour of the canvas
             (if it's None then it's an empty canvas (this is dif than a white canvas)
-        -
+        - renderer: picks and draws cells through the map of which cell is under each screen pixel
     """
     history: History
     drawing: bool
     needs_redraw: bool
-    temp_state: list[list[list[Pixel]]]
+    dirty: set[int] | None  # cell indices waiting to be redrawn (None means every cell)
+    stale: list[set[int] | None]  # for each layer, the cells changed since the last composite (None means every cell)
+    layer_settings: list[LayerSettings]
+    composite: ColourPlanes
+    saver: BackgroundSaver
+    file_path: str  # the save file this canvas was loaded from or saved to ('' if it hasn't been)
+    journal: Journal | None
+    recorder: Recorder | None  # records tool invocations while a recording is running
+    renderer: CanvasRenderer
     show_border: bool
     start_clear: bool
 
@@ -219,58 +246,189 @@ class HexCanvas(Canvas):
                  background: tuple[int, int, int] | None = (255, 255, 255),
                  load_canvas: list[list[Pixel]] | None = None, start_clear: bool = False) -> None:
         self.layers = []
+        self.planes = []
+        self.layer_settings = []
         self.drawing = False
         self.needs_redraw = True
         self.history = History()
-        self.temp_state = []
+        self.dirty = None
+        self.saver = BackgroundSaver()
+        self.file_path = ''
+        self.journal = None
+        self.recorder = None
         self.show_border = True
         self.start_clear = start_clear
+        self.layout = CanvasLayout()
+        self.renderer = CanvasRenderer()
 
         if not load_canvas:
-            new_grid = []
-            for i in range(0, size[1]):  # i.e. each i is a y coord (lower down on grid is a higher y coord)
-                row = []
-                for j in range(0, size[0]):  # i.e. each j is an x coord (rightward on grid is a higher x coord)
-                    if start_clear:
-                        new_pixel = Pixel((j, i), background, None, alpha=0.0)
-                    else:
-                        new_pixel = Pixel((j, i), background, None, alpha=1.0)
-                    row.append(new_pixel)
-                new_grid.append(row)
-            self.layers.append(new_grid)
-            self.width = size[0]
-            self.height = size[1]
             self.background = background
-            # update every pixel's adjacent attribute now that the grid is complete
-            for row in self.layers[0]:
-                for pixel in row:
-                    self.get_adjacent_pixels(0, pixel.coord, True)
+            self.set_planes([ColourPlanes(size[0], size[1], background, 0.0 if start_clear else 1.0)])
         else:
-            self.layers.append(load_canvas)
-            self.size = (len(load_canvas), len(load_canvas[0]))
+            rgb = np.array([[pix.rgb for pix in row] for row in load_canvas], dtype=np.uint8)
+            alpha = np.array([[pix.alpha for pix in row] for row in load_canvas], dtype=np.float64)
+            self.set_planes([ColourPlanes.from_arrays(rgb, alpha)])
             self.background = None
 
+    def set_planes(self, planes: list[ColourPlanes]) -> None:
+        """make the canvas layers views of the given colour planes (one layer per planes)
+        layers that already existed keep their settings"""
+        self.planes = planes
+        self.width, self.height = planes[0].width, planes[0].height
+        self.layers = []
+        for _ in planes:
+            self.add_layer_pixels()
+        self.layer_settings = (self.layer_settings + [LayerSettings() for _ in planes])[:len(planes)]
+        self.composite = ColourPlanes(self.width, self.height)
+        self.stale = [None for _ in planes]
+        self.dirty = None
+
+    def add_layer_pixels(self) -> None:
+        """make the pixel grid of the next layer (its pixels are views of its planes, made as they're needed)
+        in the grid, each y is a row (lower down on grid is a higher y coord),
+        each x is a column (rightward on grid is a higher x coord)"""
+        self.layers.append(PixelGrid(self.planes[len(self.layers)], self.layout))
+
+    def add_layer(self, colour: tuple[int, int, int] | None = None, alpha: float = 0.0) -> int:
+        """add a layer on top of the others (clear unless given a colour and alpha), returns its index"""
+        self.planes.append(ColourPlanes(self.width, self.height, colour, alpha))
+        self.add_layer_pixels()
+        self.layer_settings.append(LayerSettings())
+        self.stale.append(None)
+        self.needs_redraw = True
+        if self.recorder:
+            self.recorder.layer_op('add_layer', colour=colour and list(colour), alpha=alpha)
+        return len(self.layers) - 1
+
+    def set_layer(self, layer: int, visible: bool | None = None, opacity: float | None = None,
+                  blend: str | None = None) -> None:
+        """change how a layer shows (anything left as None stays as it is)"""
+        settings = self.layer_settings[layer]
+        if visible is not None:
+            settings.visible = visible
+        if opacity is not None:
+            settings.opacity = min(1.0, max(0.0, opacity))
+        if blend is not None:
+            assert blend in BLEND_MODES
+            settings.blend = blend
+        self.mark_dirty(None)  # every cell of the layer shows differently now
+        if self.recorder:
+            self.recorder.layer_op('set_layer', layer=layer, visible=visible, opacity=opacity, blend=blend)
+
+    def cell_index(self, coord: tuple[int, int]) -> int:
+        """the flat index of the cell at coord (row by row, from the top left)"""
+        return coord[1] * self.width + coord[0]
+
+    def mark_dirty(self, cells: set[int] | None, layer: int | None = None) -> None:
+        """queue cells to be recomposited and redrawn on the next redraw (None queues every cell)
+        layer is the layer the cells changed on (None if it could be any of them)"""
+        for i in range(len(self.stale)) if layer is None else [layer]:
+            if cells is None or self.stale[i] is None:
+                self.stale[i] = None
+            else:
+                self.stale[i] |= cells
+        self.needs_redraw = True
+
+    def update_composite(self) -> None:
+        """recomposite the cells that changed on a visible layer since the last composite, and queue them to be
+        redrawn (changes to hidden layers can't be seen, so they wait)"""
+        cells = set()
+        for i, settings in enumerate(self.layer_settings):
+            if settings.visible:
+                if cells is not None:
+                    cells = None if self.stale[i] is None else cells | self.stale[i]
+                self.stale[i] = set()
+        if cells is None:
+            composite_cells(self.planes, self.layer_settings, self.composite)
+            self.dirty = None
+        elif cells:
+            composite_cells(self.planes, self.layer_settings, self.composite,
+                            np.fromiter(cells, dtype=np.int64, count=len(cells)))
+            if self.dirty is not None:
+                self.dirty |= cells
+
+    @timed('history.commit')
+    def commit(self, action: str, changed: set[int], layer: int | None = None) -> None:
+        """record the cells an action changed as a new point in history (added once it's made, see History.record)
+        layer is the layer the cells changed on (None if it could be any of them)"""
+        self.history.record(self, action, changed)
+        self.journal_cells(action, changed, layer)
+
+    def journal_cells(self, action: str, changed: set[int] | None, layer: int | None = None) -> None:
+        """append the new colour of the changed cells (None for all of them) on layer (None for every layer)
+        to the journal (only their colours are taken here, the record is made on the journal's worker thread),
+        first journalling the number of layers if the action changed it"""
+        if self.journal is None:
+            return
+        if len(self.planes) != self.journal.num_layers:
+            self.journal.append_layers(action, len(self.planes))
+        if changed is None:
+            indices = np.arange(self.width * self.height, dtype=np.int64)
+        else:
+            indices = np.fromiter(changed, dtype=np.int64, count=len(changed))
+        layers = range(len(self.planes)) if layer is None else [layer]
+        self.journal.append(action, indices, [(i, *self.planes[i].gather(indices)) for i in layers])
+
+    def open_journal(self) -> int:
+        """start journalling next to the current file, first recovering whatever an interrupted session
+        left in its journal. returns the number of operations recovered"""
+        self.close_journal()
+        path = journal_path(self.file_path)
+        dims = (self.width, self.height, len(self.layers))
+        recovered = self.replay_journal(path)
+        if recovered:  # the recovered canvas is where history starts from
+            self.history.wipe()
+            self.history.override(HistoryEntry(self, 'RECOVER'))
+        try:
+            self.journal = Journal(path, dims)
+        except OSError as e:
+            io_log.warning('not journalling, could not open %s: %s', path, e)
+        return recovered
+
+    def close_journal(self) -> None:
+        """stop journalling, deleting the journal (it's only kept when the program dies without closing it)"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def replay_journal(self, path: str) -> int:
+        """replays a journal over the canvas, returns the number of operations replayed"""
+        journal = read_journal(path)
+        if journal is None:
+            return 0
+        dims, records = journal
+        if dims[:2] != (self.width, self.height):
+            io_log.warning('journal %s is for a different canvas, moved it to %s.old', path, path)
+            os.replace(path, path + '.old')
+            return 0
+        for action, cells, num_layers in records:
+            if num_layers is not None and num_layers < len(self.planes):  # the interrupted session removed layers
+                self.set_planes(self.planes[:num_layers])
+            while len(self.planes) < (num_layers or 0):  # or added them (even ones still empty)
+                self.add_layer()
+            for layer, index, rgb, alpha in cells:
+                while layer >= len(self.planes):  # the interrupted session added layers
+                    self.add_layer()
+                y, x = divmod(index, self.width)
+                self.planes[layer].set(x, y, rgb, alpha)
+        if records:
+            io_log.info('recovered %d operations from %s', len(records), path)
+            self.mark_dirty(None)
+        return len(records)
+
     def pos_gets_pixel(self, layer: int, x: int, y: int, screen: pygame.Surface) -> Pixel | None:
         """given a position on the canvas, find which hexagon pixel contains it"""
-        root3 = math.sqrt(3)
-        margin_horiz, margin_vert = 0.5, 0.9
-        w, h = screen.get_width() * margin_horiz, screen.get_height() * margin_vert
-        n, m = self.width, self.height
-        r = min(w / (root3 * (n + 0.5)), h / (1.5 * m + 0.5))  # pixel radius
-        x_offset = screen.get_width() * (1 - margin_horiz) / 2
-        y_offset = screen.get_height() * (1 - margin_vert) / 2
-
-        prob_y = max(0, math.floor(((y - y_offset) / r - 1) / 1.5))
-        extra_offset = 0.5 if prob_y % 2 == 0 else 1
-        prob_x = max(0, math.floor(((x - x_offset) / r / root3) - extra_offset))
-
-        if prob_x in range(0, n) and prob_y in range(0, m):
-            prob_pixel = self.layers[layer][prob_y][prob_x]
-            for pixel in [prob_pixel] + prob_pixel.adj:
-                x_dif, y_dif = abs(pixel.position[0] - x), abs(pixel.position[1] - y)
-
-                if x_dif < (root3 * 0.5 * r) and y_dif < (r - x_dif / root3):
-                    return pixel
+        self.renderer.update(self, screen.get_size())
+        index = self.renderer.pick(x, y)
+        if index >= 0:
+            y, x = divmod(index, self.width)
+            return self.layers[layer][y][x]
+
+    def on_canvas(self, x: float, y: float, screen: pygame.Surface, margin: float = 0.0) -> bool:
+        """whether screen position (x, y) is over the part of the canvas in the view (or within margin screen pixels of it)"""
+        self.renderer.update(self, screen.get_size())
+        margin = 2 * math.ceil(margin)
+        return self.renderer.rect.inflate(margin, margin).clip(self.layout.view.inflate(margin, margin)).collidepoint(x, y)
 
     def canvas_size(self, size: tuple[int, int], orientation: str) -> None:
         """resizes the canvas
@@ -280,24 +438,8 @@ class HexCanvas(Canvas):
     def get_line(self, p1: tuple[int, int], p2: tuple[int, int], segment_rate: float, screen: pygame.Surface,
                  layer: int, col: tuple[int, int, int], alpha: float, overwrite: bool, temp: bool = False) -> set[tuple[Pixel, tuple[int, int, int, float]]]:
         """makes a line between two points on a hex canvas, and return a list of every pixel on the line"""
-        segment_rate = segment_rate / 2  # to make the line more accurate
         line = set()
-        x1, y1, x2, y2, = p1[0], p1[1], p2[0], p2[1]
-        delta_x, delta_y = max(x1, x2) - min(x2, x1), y2 - y1
-        num_pts = math.floor(math.sqrt(delta_x ** 2 + delta_y ** 2) / segment_rate)
-        points_to_check = [p1, p2]
-        direction = -1 if x2 < x1 else 1
-        for n in range(1, num_pts + 1):  # note that if segment_rate > distance from p1 to p2, then num_pts == 0
-            if delta_x != 0:
-                x = x1 + n * segment_rate * math.cos(math.atan(delta_y / delta_x)) * direction
-                y = y1 + n * segment_rate * math.sin(math.atan(delta_y / delta_x))
-            else:  # vertical line
-                x = x1
-                y = y1 + n * segment_rate * (delta_y / abs(delta_y))
-
-            points_to_check.append((x, y))
-
-        for point in points_to_check:
+        for point in line_points(p1, p2, segment_rate / 2):  # half the pixel size to make the line more accurate
             pix = self.pos_gets_pixel(layer, math.floor(point[0]), math.floor(point[1]), screen)
             if pix:
                 line.add((pix, (col[0], col[1], col[2], alpha)))
@@ -307,11 +449,31 @@ class HexCanvas(Canvas):
 
         return line
 
+    def get_polyline(self, points: list[tuple[int, int]], screen: pygame.Surface,
+                     layer: int) -> list[Pixel]:
+        """every pixel along a path through the given points, in the order the path reaches them (each pixel once)"""
+        segment_rate = self.layout.radius / 2
+        pixels = {}
+        if len(points) == 1:
+            points = points * 2
+        for i in range(1, len(points)):
+            for point in line_points(points[i - 1], points[i], segment_rate, in_order=True):
+                pix = self.pos_gets_pixel(layer, math.floor(point[0]), math.floor(point[1]), screen)
+                if pix and pix not in pixels:
+                    pixels[pix] = None
+        return list(pixels)
+
+    def end_operation(self) -> None:
+        """the running stroke, click or fill is over: unmark every cell it marked drawn, coloured or queued
+        (this only starts a new generation of marks, see CellStamps)"""
+        for grid in self.layers:
+            grid.stamps.next_generation()
+
     def drawing_mode(self, activation: bool, tool: ToolBelt) -> None:
         """activates/deactivates drawing mode"""
         if activation:
             self.drawing = True
-            print('started drawing')
+            log.debug('started drawing')
         else:
             self.drawing = False
             # self.history.override(HistoryEntry(self, tool.type))
@@ -320,105 +482,161 @@ class HexCanvas(Canvas):
             # global RECURSION_STAT
             # print(RECURSION_STAT)
             # RECURSION_STAT = 0
-            print('finished drawing')
+            log.debug('finished drawing')
 
+    @timed('history.undo')
     def undo(self, screen: pygame.Surface) -> None:
         """returns board to a previous state in history"""
-        if self.history.travel_back():  # this also mutates the history (in .travel_back() if it's true)
-            print('undid')
-            self.update_canv_version(screen)
+        self.history.wait()  # (the last stroke's point may still be being recorded)
+        if self.travel_to(screen, self.history.position - 1, 'UNDO'):
+            history_log.info('undid')
+            if self.recorder:
+                self.recorder.history('undo')
 
+    @timed('history.redo')
     def redo(self, screen: pygame.Surface) -> None:
         """returns board to a future state in history"""
-        if self.history.travel_forward():  # this also mutates the history (in .travel_back() if it's true)
-            print('redid')
-            self.update_canv_version(screen)
-
-    def update_canv_version(self, screen: pygame.Surface) -> None:
-        """used in undo and redo to update canvas pixels and appearance to that of the new version you undid/redid to"""
-        self.temp_state = self.layers
-        new_canvas = self.history.get_history_point()
-
-        # check if the new_canvas we're updating to has different pixel size to detect resize
-        if new_canvas.layers[0][0][0].size != self.temp_state[0][0][0].size:
-            new_canvas.position_pixels(screen)
-        self.refresh_self(new_canvas)
-        self.needs_redraw = True
+        self.history.wait()
+        if self.travel_to(screen, self.history.position + 1, 'REDO'):
+            history_log.info('redid')
+            if self.recorder:
+                self.recorder.history('redo')
+
+    @timed('history.jump')
+    def jump(self, screen: pygame.Surface, index: int) -> None:
+        """returns board to any state in history (0 is the first), e.g. picked on the history timeline"""
+        self.history.wait()
+        if self.travel_to(screen, index, 'JUMP'):
+            history_log.info('jumped to %d of %d', self.history.position, len(self.history))
+            if self.recorder:
+                self.recorder.history('jump', self.history.position)
+
+    def travel_to(self, screen: pygame.Surface, index: int, action: str) -> bool:
+        """moves history to the point at index and updates the canvas to it (journalled as action),
+        returns whether it moved"""
+        position = self.history.position
+        changed = self.history.travel_to(index)  # the cells that differ between the two points
+        if self.history.position == position:
+            return False
+        self.update_canv_version(screen, changed)
+        self.journal_cells(action, changed)
+        return True
+
+    def update_canv_version(self, screen: pygame.Surface, changed: set[int] | None = None) -> None:
+        """used in undo and redo to update canvas pixels and appearance to that of the new version you undid/redid to
+        changed is every cell that differs between the two versions, and only those get copied over and redrawn,
+        in place (None, or a version with other layers, copies and redraws all of them, and once enough cells
+        changed it's cheaper to copy every tile, only the changed cells get redrawn still)"""
+        new_canvas = self.history.head  # the colours of the version history is at
+
+        # history entries share this canvas's layout, so a resize since then needs no repositioning
+        if (changed is None or not self.same_layers(new_canvas) or
+                len(changed) * COPY_SPEEDUP > self.width * self.height):
+            self.refresh_self(new_canvas)
+        elif changed:
+            cells = np.fromiter(changed, dtype=np.int64, count=len(changed))
+            for planes, new_planes in zip(self.planes, new_canvas.planes):
+                planes.copy_cells_from(new_planes, cells)
+        self.mark_dirty(changed)
 
     def redraw_canv(self, screen: pygame.Surface, force_config: bool = False) -> None:
-        """redraws the entire canvas (avoid using this unless you need to, since it takes time"""
+        """redraws the dirty cells of the canvas (every cell if force_config, which takes time)"""
         if self.needs_redraw:  # just to make sure
-            for layer in range(0, len(self.layers)):
-                for row in range(0, len(self.layers[layer])):
-                    for pixel in range(0, len(self.layers[layer][row])):
-                        new_pixel = self.layers[layer][row][pixel]
-                        old_pixel = None
-                        if self.temp_state and len(self.temp_state[layer]) > row and len(self.temp_state[layer][row]) > pixel:
-                            old_pixel = self.temp_state[layer][row][pixel]
-                        if (not old_pixel or not new_pixel.is_copy(old_pixel)) or force_config:
-                            draw_hexagon(screen, new_pixel.rgb + (new_pixel.alpha,),
-                                         new_pixel.position, new_pixel.size)
-        print('redrew canvas')
+            self.update_composite()
+            cells = None if force_config else self.dirty
+            redrawn = self.renderer.draw(screen, self, cells)
+            PROFILER.count('redrawn', redrawn)
+            render_log.debug('redrew %d cells', redrawn)
+        self.dirty = set()
         self.needs_redraw = False
 
     def refresh_self(self, new: HexCanvas | HistoryEntry) -> None:
-        """partially reinitializes self (still the same object id though"""
-        self.width, self.height = new.width, new.height
+        """partially reinitializes self (still the same object id though)
+        the pixels are kept when the layers are the same size as before, only their colours get copied"""
         self.background = new.background
-        self.layers = []
-        for layer in new.layers:
-            lyr = []
-            for row in layer:
-                rw = []
-                for pix in row:
-                    rw.append(pix.copy())
-                lyr.append(rw)
-            self.layers.append(lyr)
-            for row in self.layers[-1]:
-                for pixel in row:
-                    self.get_adjacent_pixels(len(self.layers) - 1, pixel.coord, True)
+        if [(p.width, p.height) for p in self.planes] == [(p.width, p.height) for p in new.planes]:
+            for planes, new_planes in zip(self.planes, new.planes):
+                planes.copy_from(new_planes)
+        else:
+            self.set_planes([planes.copy() for planes in new.planes])
 
-    def save(self, current_file: str = None) -> str:
-        """save the file as a project file (not an export image)"""
-        save_file = [[], self.layers[0][0][0].size]
-        for layer in self.layers:
-            lyr = []
-            for row in layer:
-                rw = []
-                for pix in row:
-                    rw.append(pix.to_dict())
-                lyr.append(rw)
-            save_file[0].append(lyr)
-        file_name = create_file(save_file, current_file)
-        return file_name
+    def dense_snapshot(self) -> tuple[list[tuple[np.ndarray, np.ndarray]], float]:
+        """a cheap copy of the canvas colours for saving: every layer's (rgb, alpha) arrays and the pixel size
+        (turned into the lists save files are written from by snapshot_lists, off the frame when saving)"""
+        return [planes.dense() for planes in self.planes], self.layout.radius
+
+    def snapshot(self) -> list:
+        """a copy of the canvas colours for saving: the layers (rows of (rgb, alpha) tuples) and the pixel size"""
+        return snapshot_lists(*self.dense_snapshot())
 
+    @timed('save')
+    def save(self, current_file: str = None) -> str:
+        """save the file as a project file (not an export image)
+        the file is encoded and written in the background, so this returns as soon as the canvas colours are copied"""
+        if self.saver.busy:  # save over the file being saved (this coalesces with any other waiting save)
+            file_path = self.saver.file_path
+        else:
+            file_path = save_prompt(current_file)
+            if not file_path:
+                io_log.warning('failed to save file')
+                return ''
+        self.file_path = file_path
+        on_done = None
+        if self.journal is not None:  # once saved, the journal only needs what happened after this snapshot
+            journal, marker = self.journal, self.journal.checkpoint()
+            on_done = lambda: journal.saved(marker, file_path)
+        self.saver.request(self.dense_snapshot(), file_path, on_done)
+        return file_path.split('/')[-1].split('.')[0]
+
+    def load_layers(self, file_layers: list) -> None:
+        """replace the canvas layers with the layers of a loaded file (lists of rows of pixel dicts)"""
+        planes = []
+        for layer in file_layers:
+            rgb = np.array([[pix_dict['rgb'] or (0, 0, 0) for pix_dict in row] for row in layer], dtype=np.uint8)
+            alpha = np.array([[pix_dict['alpha'] for pix_dict in row] for row in layer], dtype=np.float64)
+            planes.append(ColourPlanes.from_arrays(rgb, alpha))
+        self.set_planes(planes)
+
+    @timed('load')
     def load(self, screen: pygame.Surface, use_current: bool = False) -> tuple[bool, str]:
         """loads a valid file to remake the canvas object"""
         file_name = ''
         if not use_current:
-            file, file_name = load_file()  # load file is a tuple of layers + a size
+            file, file_name, file_path = load_file()  # load file is a tuple of layers + a size
             if file:
-                lst = []
-                new_canvas_layers, size = file
-                for layer in new_canvas_layers:
-                    lyr = []
-                    for row in layer:
-                        rw = []
-                        for pix_dict in row:
-                            pixel = Pixel(pix_dict['coord'], pix_dict['rgb'], None, size=size, alpha=pix_dict['alpha'])
-                            rw.append(pixel)
-                        lyr.append(rw)
-                    lst.append(lyr)
-                self.layers = lst
+                self.load_layers(file[0])
                 self.history.wipe()
+                self.file_path = file_path
             else:
-                print('failed to load file')
+                io_log.warning('failed to load file')
                 return False, ''
 
-        self.width, self.height = len(self.layers[0][0]), len(self.layers[0])
         self.position_pixels(screen)
-        for row in self.layers[0]:
-            for pixel in row:
-                self.get_adjacent_pixels(0, pixel.coord, True)
-        self.needs_redraw, self.drawing = True, False
+        self.mark_dirty(None)
+        self.drawing = False
+        if not use_current:
+            self.open_journal()  # recovers any changes an interrupted session made to this file
         return True, file_name
+
+
+def line_points(p1: tuple[float, float], p2: tuple[float, float], segment_rate: float,
+                in_order: bool = False) -> list[tuple[float, float]]:
+    """points every segment_rate along the line from p1 to p2 (both ends included)
+    the ends come first unless in_order, in which case the points go from p1 to p2"""
+    x1, y1, x2, y2, = p1[0], p1[1], p2[0], p2[1]
+    delta_x, delta_y = max(x1, x2) - min(x2, x1), y2 - y1
+    num_pts = math.floor(math.sqrt(delta_x ** 2 + delta_y ** 2) / segment_rate)
+    points = []
+    direction = -1 if x2 < x1 else 1
+    for n in range(1, num_pts + 1):  # note that if segment_rate > distance from p1 to p2, then num_pts == 0
+        if delta_x != 0:
+            x = x1 + n * segment_rate * math.cos(math.atan(delta_y / delta_x)) * direction
+            y = y1 + n * segment_rate * math.sin(math.atan(delta_y / delta_x))
+        else:  # vertical line
+            x = x1
+            y = y1 + n * segment_rate * (delta_y / abs(delta_y))
+
+        points.append((x, y))
+    if in_order:
+        return [p1] + points + [p2]
+    return [p1, p2] + points
@@ -0,0 +1,67 @@
+"""compositing the layers of a canvas into the colours that get shown
+
+Layers are stacked bottom (layer 0) to top. Each visible layer's colours are mixed with what's below them by its
+blend mode, then laid over it (source over), the layer's opacity scaling the alpha of each of its cells.
+Compositing only touches the cells asked for, so a change to a few cells of one layer costs a few cells per layer,
+and compositing everything only touches the tiles some layer has painted.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from src.aux_code.canvas_foundation import ColourPlanes, LayerSettings, TILE_SIZE
+
+BLENDS = {
+    'NORMAL': lambda below, above: above,
+    'MULTIPLY': lambda below, above: below * above,
+    'SCREEN': lambda below, above: below + above - below * above,
+    'ADD': lambda below, above: np.minimum(1.0, below + above),
+    'DARKEN': np.minimum,
+    'LIGHTEN': np.maximum,
+}
+
+
+def composite_cells(planes: list[ColourPlanes], settings: list[LayerSettings], out: ColourPlanes,
+                    cells: np.ndarray | None = None) -> None:
+    """composite the layers into out, at the given flat cell indices (every cell if None)
+    compositing every cell only visits the tiles some layer has painted, the rest get the composited background"""
+    shown = [(layer, setting) for layer, setting in zip(planes, settings) if setting.visible and setting.opacity > 0]
+    if len(shown) == 1 and shown[0][1].blend == 'NORMAL' and shown[0][1].opacity == 1.0:  # nothing to mix
+        if cells is None:
+            out.copy_from(shown[0][0])
+        else:
+            out.scatter(cells, *shown[0][0].gather(cells))
+        return
+
+    if cells is not None:
+        out.scatter(cells, *composite_arrays([(layer.gather(cells), setting) for layer, setting in shown], len(cells)))
+        return
+
+    background = [((np.array([layer.background], dtype=np.uint8), np.array([layer.background_alpha])), setting)
+                  for layer, setting in shown]
+    rgb, alpha = composite_arrays(background, 1)
+    out.background, out.background_alpha = tuple(rgb[0].tolist()), float(alpha[0])
+    out.tiles = {}
+    for key in set().union(*(layer.tiles for layer, _ in shown)):
+        tiles = []
+        for layer, setting in shown:
+            tile_rgb, tile_alpha = layer.tile_arrays(key)
+            tiles.append(((tile_rgb.reshape(-1, 3), tile_alpha.reshape(-1)), setting))
+        rgb, alpha = composite_arrays(tiles, TILE_SIZE * TILE_SIZE)
+        out.tiles[key] = (rgb.reshape(TILE_SIZE, TILE_SIZE, 3), alpha.reshape(TILE_SIZE, TILE_SIZE))
+
+
+def composite_arrays(layers: list[tuple[tuple[np.ndarray, np.ndarray], LayerSettings]],
+                     size: int) -> tuple[np.ndarray, np.ndarray]:
+    """composite the (rgb, alpha) arrays of each shown layer (bottom first) of size cells"""
+    rgb, alpha = np.zeros((size, 3)), np.zeros(size)
+    for (layer_rgb, layer_alpha), setting in layers:
+        above = layer_rgb / 255
+        above_alpha = np.clip(layer_alpha, 0.0, 1.0) * setting.opacity
+        # where there is something below, the layer's colour becomes its blend with it
+        above = above + alpha[:, None] * (BLENDS[setting.blend](rgb, above) - above)
+        new_alpha = above_alpha + alpha * (1 - above_alpha)
+        premultiplied = above * above_alpha[:, None] + rgb * (alpha * (1 - above_alpha))[:, None]
+        rgb = premultiplied / np.maximum(new_alpha, 1e-12)[:, None]
+        alpha = new_alpha
+    return np.rint(np.clip(rgb, 0.0, 1.0) * 255).astype(np.uint8), alpha
@@ -8,8 +8,22 @@ CLICK_TOOLS = {'BUCKET', 'MAGIC_WAND', 'COLOUR_PICKER'}
 RECOLOUR_TOOLS = {'PENCIL', 'BUCKET', 'LINE', 'PAINT_LINE', 'PAINT_BRUSH', 'ERASER', 'HEXAGON', 'SQUARE', 'TEXT', 'GRADIENT',
                   'REPLACE', 'BLUR', 'SCRAMBLE'}
 LINE_TOOLS = {'LINE', 'PAINT_LINE'}
-KEYBINDS = {pygame.K_p: 'PENCIL', pygame.K_b: 'BUCKET', pygame.K_l: 'LINE', pygame.K_k: 'PAINT_LINE'}
-SCREEN_W, SCREEN_H = screeninfo.get_monitors()[0].width, screeninfo.get_monitors()[0].height
+BLEND_MODES = ['NORMAL', 'MULTIPLY', 'SCREEN', 'ADD', 'DARKEN', 'LIGHTEN']  # in the order Ctrl+B cycles through them
+KEYBINDS = {pygame.K_p: 'PENCIL', pygame.K_b: 'BUCKET', pygame.K_l: 'LINE', pygame.K_k: 'PAINT_LINE', pygame.K_z: 'ZOOM',
+            pygame.K_h: 'PAN'}
+VIEW_TOOLS = {'ZOOM', 'PAN'}  # tools that move the view instead of drawing
+ZOOM_STEP = 1.25  # how much one mouse wheel notch zooms
+MEMORY_WARNING_MB = 1024  # warn once the canvas, its history and the caches are estimated to hold more than this
+MEMORY_CHECK_SECONDS = 5  # the main loop checks that at most this often (and only when history changed)
+HISTORY_KEYFRAME_INTERVAL = 16  # history keeps a copy of the whole canvas every this many points (see History)
+HISTORY_KEPT_UNPACKED = 8  # history points further than this from the current one are kept compressed
+HISTORY_COMPRESSION_LEVEL = 1  # zlib level history points are compressed with (1 is fastest, 9 is smallest)
+HISTORY_MEMORY_MB = 64  # compressed history points kept in memory past this are spilled to a scratch file
+HISTORY_PREFETCH = 8  # history points before the current one read back from the scratch file ahead of undo
+try:
+    SCREEN_W, SCREEN_H = screeninfo.get_monitors()[0].width, screeninfo.get_monitors()[0].height
+except (screeninfo.ScreenInfoError, IndexError):  # no monitor to ask (e.g. running headless)
+    SCREEN_W, SCREEN_H = 1920, 1080
 SCREEN_SIZES = [(int(SCREEN_W * (x / 100)), int(SCREEN_H * (x / 100))) for x in range(0, 151)
                 if int(SCREEN_W * (x / 100)) == float(SCREEN_W * (x / 100)) and
                 int(SCREEN_H * (x / 100)) == float(SCREEN_H * (x / 100))]
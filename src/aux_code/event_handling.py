@@ -1,14 +1,20 @@
 """for handling different events"""
 from __future__ import annotations
 
-from src.aux_code.constants import KEYBINDS
+from src.aux_code.constants import KEYBINDS, BLEND_MODES, VIEW_TOOLS, ZOOM_STEP
 from src.aux_code.ui import UI
 from src.aux_code.pygame_configure import pygame, screen_as_image
+from src.aux_code.recorder import Recorder
+from src.aux_code.profiler import PROFILER
+from src.aux_code.memory import memory_report, format_report
+from src.aux_code.log import get_logger
+
+log = get_logger('events')
 
 
 def event_handler(event: pygame.event, ui: UI, x: int, y: int, just_finished_drawing, just_started_drawing, just_loaded, layer: int,
-                  running: bool, file_name: str, save_loop: dict) -> tuple[bool, bool, bool, bool]:
-    """handles different events"""
+                  running: bool, file_name: str, save_loop: dict) -> tuple[bool, bool, bool, bool, int]:
+    """handles different events (returns the layer being drawn on too, which some events change)"""
     if event.type == pygame.QUIT:
         running = False
 
@@ -18,26 +24,30 @@ def event_handler(event: pygame.event, ui: UI, x: int, y: int, just_finished_dra
         # background redraw
         ui.refresh_ui()  # this used to be inside the load function before the ui class was made
         just_loaded = True
-        print(ui.screen.get_width(), ui.screen.get_height())
+        log.info('%d %d', ui.screen.get_width(), ui.screen.get_height())
 
     # special ctrl actions
     elif event.type == pygame.KEYDOWN and pygame.key.get_mods() & pygame.KMOD_CTRL and not ui.canvas.drawing:
         if event.key == pygame.K_z:  # undo action
             ui.canvas.undo(ui.screen)
+            layer = min(layer, len(ui.canvas.layers) - 1)  # undoing may have removed a layer
         elif event.key == pygame.K_y:  # redo action
             ui.canvas.redo(ui.screen)
         elif event.key == pygame.K_h:  # print the history of actions in the console
-            print(ui.canvas.history)
+            log.info('%s', ui.canvas.history)
+        elif event.key == pygame.K_m:  # print where the memory goes (canvas, history, caches)
+            log.info('%s', format_report(memory_report(ui.canvas, ui)))
         elif event.key == pygame.K_s:  # save file
             new_file = ui.canvas.save(file_name)
             if new_file:
                 file_name = new_file
-            print(file_name)
+            log.info('%s', file_name)
         elif event.key == pygame.K_l:  # load save file
             loaded, new_file = ui.canvas.load(ui.screen)
+            layer = min(layer, len(ui.canvas.layers) - 1)
             if loaded and new_file:
                 file_name = new_file
-                print(file_name)
+                log.info('%s', file_name)
                 # background redraw
                 ui.refresh_ui()
                 just_loaded = True
@@ -46,6 +56,54 @@ def event_handler(event: pygame.event, ui: UI, x: int, y: int, just_finished_dra
         elif event.key == pygame.K_d:  # manual force redraw canvas
             ui.canvas.needs_redraw = True
             ui.canvas.redraw_canv(ui.screen, force_config=True)
+        elif event.key == pygame.K_0:  # zoom back out to the whole canvas
+            ui.reset_view()
+        elif event.key == pygame.K_r:  # start/stop recording tool invocations
+            if ui.canvas.recorder is None:
+                ui.canvas.recorder = Recorder(ui.canvas, ui.screen)
+                log.info('started recording')
+            else:
+                log.info('saved recording to %s', ui.canvas.recorder.save())
+                ui.canvas.recorder = None
+
+        # layers
+        elif event.key == pygame.K_n:  # add a layer on top, and draw on it
+            layer = ui.canvas.add_layer()
+            ui.canvas.commit('NEW_LAYER', set())
+            log.info('drawing on new layer %d', layer)
+        elif event.key in {pygame.K_UP, pygame.K_DOWN}:  # draw on the layer above/below
+            layer = min(len(ui.canvas.layers) - 1, max(0, layer + (1 if event.key == pygame.K_UP else -1)))
+            log.info('drawing on layer %d', layer)
+        elif event.key == pygame.K_v:  # show/hide the layer
+            ui.canvas.set_layer(layer, visible=not ui.canvas.layer_settings[layer].visible)
+        elif event.key == pygame.K_b:  # next blend mode for the layer
+            blend = ui.canvas.layer_settings[layer].blend
+            ui.canvas.set_layer(layer, blend=BLEND_MODES[(BLEND_MODES.index(blend) + 1) % len(BLEND_MODES)])
+            log.info('layer %d blend mode: %s', layer, ui.canvas.layer_settings[layer].blend)
+        elif event.key in {pygame.K_MINUS, pygame.K_EQUALS}:  # less/more layer opacity
+            opacity = ui.canvas.layer_settings[layer].opacity + (0.1 if event.key == pygame.K_EQUALS else -0.1)
+            ui.canvas.set_layer(layer, opacity=round(opacity, 2))
+            log.info('layer %d opacity: %s', layer, ui.canvas.layer_settings[layer].opacity)
+
+    # performance overlay, and exporting what the profiler timed as a trace file
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+        ui.toggle_profile()
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+        log.info('saved profile trace to %s', PROFILER.export_trace())
+
+    # history timeline (clicking or dragging along it jumps to any point in history)
+    elif event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+        ui.toggle_timeline()
+    elif (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and ui.show_timeline and not ui.canvas.drawing
+          and ui.timeline_area().collidepoint(x, y)):
+        ui.scrubbing = True
+        ui.scrub_timeline(x)
+        layer = min(layer, len(ui.canvas.layers) - 1)  # jumping may have removed a layer
+    elif event.type == pygame.MOUSEMOTION and ui.scrubbing:
+        ui.scrub_timeline(event.pos[0])
+        layer = min(layer, len(ui.canvas.layers) - 1)
+    elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and ui.scrubbing:
+        ui.scrubbing = False
 
     # switch tool (using tool keybinds)
     elif event.type == pygame.KEYDOWN and event.key in KEYBINDS:
@@ -59,10 +117,24 @@ def event_handler(event: pygame.event, ui: UI, x: int, y: int, just_finished_dra
     elif ui.tool.rainbow_mode and event.type == pygame.KEYUP and event.key == pygame.K_RSHIFT:
         ui.tool.rainbow_mode = False
 
+    # zoom and pan the view (the mouse wheel zooms, dragging with the middle button or the pan tool pans)
+    elif event.type == pygame.MOUSEWHEEL and not ui.canvas.drawing and ui.canvas.layout.view.collidepoint(x, y):
+        ui.zoom(ZOOM_STEP ** event.y, x, y)
+    elif (event.type == pygame.MOUSEBUTTONDOWN and (event.button == 2 or (event.button == 1 and ui.tool.type == 'PAN'))
+          and not ui.canvas.drawing and not ui.click_mode and not ui.not_on_canvas(x, y)):
+        ui.panning = True
+    elif event.type == pygame.MOUSEMOTION and ui.panning:
+        ui.pan(*event.rel)
+    elif event.type == pygame.MOUSEBUTTONUP and event.button in {1, 2} and ui.panning:
+        ui.panning = False
+    elif (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and ui.tool.type == 'ZOOM'
+          and not ui.click_mode and not ui.not_on_canvas(x, y)):  # shift click zooms out
+        ui.zoom(0.5 if pygame.key.get_mods() & pygame.KMOD_SHIFT else 2.0, x, y)
+
     # start drawing (depending on the tool type, this may only hold true for one loop (i.e. for single click tools)
     elif (((event.type == pygame.MOUSEBUTTONDOWN and event.button == 1) or event.type == pygame.FINGERDOWN)
           and not ui.canvas.drawing and (not ui.not_on_canvas(x, y)) # or tool in LINE_TOOLS) TODO?
-          and not ui.click_mode):
+          and not ui.click_mode and ui.tool.type not in VIEW_TOOLS):
         ui.canvas.drawing_mode(True, ui.tool)
         just_started_drawing = True
 
@@ -80,7 +152,7 @@ def event_handler(event: pygame.event, ui: UI, x: int, y: int, just_finished_dra
             ui.tool.type = prev_tool
             ui.update_colour_ui(ui.tool.colour, ui.tool.alpha)
         else:
-            print('No pixel to pick')
+            log.info('No pixel to pick')
 
     # UI click element event
     elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and not ui.click_mode and ui.not_on_canvas(x, y):
@@ -89,4 +161,4 @@ def event_handler(event: pygame.event, ui: UI, x: int, y: int, just_finished_dra
     # UI release click event
     elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and (ui.click_mode or ui.not_on_canvas(x, y)):
         ui.clicking_mode_switch(False)
-    return just_finished_drawing, just_started_drawing, just_loaded, running
+    return just_finished_drawing, just_started_drawing, just_loaded, running, layer
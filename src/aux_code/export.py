@@ -0,0 +1,109 @@
+"""rendering canvases to images without a window (a library for scripts, and a command line tool)
+
+The image is rasterised the same way the canvas is drawn on screen: every image pixel gets the colour of the cell
+whose hexagon contains its centre (see canvas_render.cell_index_map), so no polygons are drawn. The image is worked
+out in bands of rows, so only a band's worth of the index map is held at once however big the image is.
+Cells keep their alpha, and pixels outside every cell are transparent. Thumbnails are drawn from a level of the
+canvas's mip pyramid (see mip_pyramid), so cells smaller than a pixel get averaged rather than skipped.
+
+Usage:
+    python -m src.aux_code.export <save file> [--radius R] [--out <png file>]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from src.aux_code.canvas_foundation import CanvasLayout, ColourPlanes
+from src.aux_code.canvas_system import HexCanvas
+from src.aux_code.canvas_render import cell_index_map
+from src.aux_code.mip_pyramid import MipPyramid, lod_level
+from src.aux_code.save_and_load import read_file
+from src.aux_code.pygame_configure import pygame
+
+DEFAULT_RADIUS = 8  # cell radius of an exported image (in image pixels) when none is given
+BAND_ROWS = 256  # image rows worked out at a time
+THUMBNAIL_SIZE = 256  # the longest side of a thumbnail (in pixels) when none is given
+
+
+def load_canvas(file_path: str) -> HexCanvas:
+    """a canvas holding the layers of a save file"""
+    layers = read_file(file_path)[0]
+    canvas = HexCanvas((len(layers[0][0]), len(layers[0])))
+    canvas.load_layers(layers)
+    return canvas
+
+
+def render(canvas: HexCanvas, radius: float = DEFAULT_RADIUS) -> pygame.Surface:
+    """the composite of the canvas layers as an image, each cell a hexagon of the given radius (in pixels)"""
+    canvas.update_composite()
+    return render_planes(canvas.composite, radius)
+
+
+def thumbnail(canvas: HexCanvas, size: int = THUMBNAIL_SIZE) -> pygame.Surface:
+    """the composite of the canvas layers as an image whose longest side is about size pixels"""
+    canvas.update_composite()
+    radius = min(size / (math.sqrt(3) * (canvas.width + 0.5)), size / (1.5 * canvas.height + 0.5))
+    level = lod_level(radius)
+    pyramid = MipPyramid()
+    pyramid.touch(canvas.composite, None)
+    return render_planes(pyramid.level(level), radius * 2 ** level)
+
+
+def render_planes(planes: ColourPlanes, radius: float) -> pygame.Surface:
+    """the colours of planes as an image, each cell a hexagon of the given radius (in pixels)"""
+    width, height = planes.width, planes.height
+    layout = CanvasLayout()
+    image_rect = layout.place_at(width, height, radius)
+    image = pygame.Surface(image_rect.size, pygame.SRCALPHA)
+
+    for top in range(0, image_rect.h, BAND_ROWS):
+        band = pygame.Rect(0, top, image_rect.w, min(BAND_ROWS, image_rect.h - top))
+        index_map = cell_index_map(layout, width, height, band)
+        inside = index_map >= 0
+        if not inside.any():
+            continue
+        rows, cols = np.divmod(index_map, width)
+        first, last = int(rows[inside].min()), int(rows[inside].max()) + 1
+        if (last - first) * width <= index_map.size:  # read the band's rows of cells in one go
+            rgb, alpha = planes.region(0, first, width, last)
+            slots = np.where(inside, (rows - first) * width + cols, 0)
+            rgb, alpha = rgb.reshape(-1, 3)[slots], alpha.reshape(-1)[slots]
+        else:  # cells smaller than pixels: only read the cells under the pixels
+            rgb, alpha = planes.gather(np.maximum(index_map, 0).reshape(-1))
+            rgb, alpha = rgb.reshape(index_map.shape + (3,)), alpha.reshape(index_map.shape)
+        pygame.surfarray.pixels3d(image)[:, band.top:band.bottom] = rgb
+        pygame.surfarray.pixels_alpha(image)[:, band.top:band.bottom] = \
+            np.where(inside, np.rint(np.clip(alpha, 0.0, 1.0) * 255), 0).astype(np.uint8)
+    return image
+
+
+def export_image(file_path: str, out_path: str | None = None, radius: float = DEFAULT_RADIUS) -> str:
+    """render a save file to an image file (a png next to the save file unless out_path is given),
+    returns where it was written"""
+    if out_path is None:
+        out_path = os.path.splitext(file_path)[0] + '.png'
+    pygame.image.save(render(load_canvas(file_path), radius), out_path)
+    return out_path
+
+
+def main() -> None:
+    """command line export: renders a save file to a png, reporting how long it took"""
+    parser = argparse.ArgumentParser(description='render a HexPaint save file to an image without a window')
+    parser.add_argument('file')
+    parser.add_argument('--radius', type=float, default=DEFAULT_RADIUS, help='cell radius in pixels')
+    parser.add_argument('--out', default=None, help='where to write the image (defaults to a png next to the file)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    out_path = export_image(args.file, args.out, args.radius)
+    print(json.dumps({'file': args.file, 'out': out_path, 'seconds': time.perf_counter() - start}))
+
+
+if __name__ == '__main__':
+    main()
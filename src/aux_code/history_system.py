@@ -1,84 +1,490 @@
+"""canvas history: every point the canvas went through, as deltas with a keyframe every so often
+
+Every point keeps what the action that got the canvas there changed (its delta): the cells it changed and their colours
+on every layer from before and after it, so stepping to the next or previous point only touches those cells.
+Every HISTORY_KEYFRAME_INTERVAL points, and wherever the layers changed (e.g. one was added), a copy of the whole canvas
+is kept too (a keyframe), so any point can be rebuilt from the keyframe at or before it plus fewer than
+HISTORY_KEYFRAME_INTERVAL deltas, however far away it is (see History.travel_to).
+
+Only the points within HISTORY_KEPT_UNPACKED of the point history is at are kept as they are: the others are
+compressed on a worker thread (see HistoryStore), and decompressed when history travels back to them. Points never
+change once made, so a point is only ever compressed once: it keeps its compressed copy while it's unpacked, and packing
+it again just lets go of its arrays.
+
+Compressed points are kept in memory up to HISTORY_MEMORY_MB, least recently used first out: past that, they're
+written to a scratch file for the session (which is deleted when it's closed) and only their place in it is kept, so
+history can be as long as the disk allows without the process growing. Travelling back reads the HISTORY_PREFETCH
+points before the one history got to back from the file on the worker thread, ahead of undoing them.
+
+Recording a point doesn't hold up the frame it's committed in either: only the changed cells' new colours are taken from
+the canvas when it's committed, and the rest of the point (the colours from before, and a keyframe if one's due) is
+made from the head on another worker thread, which adds it to history once it's made. Anything that reads or moves
+history waits for the points still being made first (see History.wait).
+"""
 from __future__ import annotations
-from src.aux_code.canvas_foundation import Canvas
-from src.aux_code.linked_list import LinkedList
+
+import collections
+import math
+import pickle
+import queue
+import tempfile
+import threading
+import zlib
+from typing import BinaryIO
+
+import numpy as np
+
+from src.aux_code.canvas_foundation import Canvas, ColourPlanes, TILE_SIZE
+from src.aux_code.constants import HISTORY_KEYFRAME_INTERVAL, HISTORY_KEPT_UNPACKED, HISTORY_COMPRESSION_LEVEL, \
+    HISTORY_MEMORY_MB, HISTORY_PREFETCH
+from src.aux_code.log import get_logger
+from src.aux_code.profiler import PROFILER, timed
+
+log = get_logger('history')
+
+STEP_COST = 1024  # what applying a delta costs on top of writing its cells (in cells written, roughly)
+COPY_SPEEDUP = 32  # how many times cheaper a cell of a keyframe is to copy (a tile at a time) than to write on its own
+_PACKING = threading.Lock()  # held while an entry is swapped between packed and not (or spilled and not)
+MB = 1024 * 1024
+
+
+def union_cells(cells: list[np.ndarray]) -> np.ndarray:
+    """every cell in any of the arrays of flat indices, sorted and once each (as much work as there are cells, however
+    big the canvas is, and sorted rather than np.unique'd, which hashes the cells and is a lot slower here)"""
+    union = np.sort(np.concatenate(cells))
+    return union[np.concatenate(([True], union[1:] != union[:-1]))]
 
 
 class HistoryEntry(Canvas):
-    """a node in history"""
-    action: str  # most recent tool action performed (that got it to this canvas)
-    num_affected: int  # number of pixels that were affected
+    """a node in history: what the action that got the canvas to it changed (a delta),
+    and for a keyframe, a copy of the colour planes of the whole canvas
+
+    Instance Attributes:
+        - action: most recent tool action performed (that got it to this canvas)
+        - num_affected: number of pixels that were affected
+        - has_delta: whether the entry has a delta (it doesn't if e.g. the action changed the layers)
+        - keyframe: whether the entry keeps a copy of the whole canvas
+        - cells: the cells the action changed, as sorted flat indices (None if it could be any of them)
+        - before, after: for each layer, the (rgb, alpha) of the changed cells before and after the action
+        - planes: a keyframe's copy of the colours of each layer
+        - packed: the delta and keyframe compressed, and the cells compressed (None until they've been compressed,
+            and once they've been spilled to the scratch file and let go of)
+        - spilled: where the compressed delta and keyframe, and cells, are in the scratch file, as their offset and
+            their two lengths (None until they've been spilled)
+        - unpacked: whether the delta and keyframe are in memory as they are (if not, cells, before, after and planes
+            are empty until the entry is unpacked)
+        - near: whether the entry is near the point history is at (so it's kept unpacked)
+    """
+    action: str
+    num_affected: int
+    has_delta: bool
+    keyframe: bool
+    cells: np.ndarray | None
+    before: list[tuple[np.ndarray, np.ndarray]] | None
+    after: list[tuple[np.ndarray, np.ndarray]] | None
+    packed: tuple[bytes, bytes] | None
+    spilled: tuple[int, int, int] | None
+    unpacked: bool
+    near: bool
+    _tiles: int  # the number of tiles the keyframe holds
 
-    def __init__(self, canv: Canvas, action: str, num_affected: int = 0) -> None:
+    def __init__(self, canv: Canvas, action: str, num_affected: int = 0, changed: set[int] | None = None,
+                 keyframe: bool = True) -> None:
         self.width, self.height = canv.width, canv.height
         self.background = canv.background
+        self.layout = canv.layout
         self.layers = []
+        self.planes = []
+        self.keyframe = False
+        self._tiles = 0
+        if keyframe:
+            self.keep_keyframe(canv.planes)
         self.action = action
         self.num_affected = num_affected
-        for layer in canv.layers:
-            lyr = []
-            for row in layer:
-                rw = []
-                for pix in row:
-                    rw.append(pix.copy())
-                lyr.append(rw)
-            self.layers.append(lyr)
-            for row in self.layers[-1]:
-                for pixel in row:
-                    self.get_adjacent_pixels(len(self.layers) - 1, pixel.coord, True)
+        self.cells = None if changed is None else np.sort(np.fromiter(changed, dtype=np.int64, count=len(changed)))
+        self.before = self.after = None
+        self.has_delta = False
+        self.packed = None
+        self.spilled = None
+        self.unpacked = True
+        self.near = True
+
+    @timed('history.snapshot')
+    def keep_keyframe(self, planes: list[ColourPlanes]) -> None:
+        """keep a copy of the colour planes of every layer, making the entry a keyframe"""
+        self.planes = [layer.copy() for layer in planes]
+        self.keyframe = True
+        self._tiles = sum(len(layer.tiles) for layer in self.planes)
+
+    def keep_after(self, after: list[ColourPlanes]) -> None:
+        """keep the colours of the changed cells in the planes of every layer after the action
+        (the half of the delta taken from the canvas, so it's taken as the action is committed)"""
+        self.after = [layer.gather(self.cells) for layer in after]
+
+    def keep_before(self, before: list[ColourPlanes]) -> None:
+        """keep the colours of the changed cells in the planes of every layer before the action, completing the delta"""
+        self.before = [layer.gather(self.cells) for layer in before]
+        self.has_delta = True
+
+    def apply(self, planes: list[ColourPlanes], forward: bool = True) -> None:
+        """write the changed cells' colours from after the action (forward) or from before it to the given planes"""
+        for layer, (rgb, alpha) in zip(planes, self.after if forward else self.before):
+            layer.scatter(self.cells, rgb, alpha)
+
+    def step_cost(self) -> float:
+        """roughly what applying the delta costs (infinite if there's no delta)"""
+        return self.num_affected + STEP_COST if self.has_delta else math.inf
+
+    def restore_cost(self) -> float:
+        """roughly what copying the keyframe costs (in cells written, like step_cost)"""
+        return self._tiles * TILE_SIZE * TILE_SIZE / COPY_SPEEDUP
+
+    def compress(self) -> None:
+        """compress the delta and keyframe (if they haven't been already), and let go of them unless the entry is
+        near the point history is at"""
+        if self.packed is None and self.spilled is None:
+            payload = pickle.dumps((self.before, self.after, self.planes), pickle.HIGHEST_PROTOCOL)
+            cells = self.cells.tobytes() if self.has_delta else b''
+            self.packed = (zlib.compress(payload, HISTORY_COMPRESSION_LEVEL),
+                           zlib.compress(cells, HISTORY_COMPRESSION_LEVEL))
+        self.pack()
+
+    def pack(self) -> None:
+        """let go of the delta and keyframe (only kept compressed), unless the entry is near the point history is at
+        or hasn't been compressed yet"""
+        with _PACKING:
+            if not self.near and (self.packed is not None or self.spilled is not None) and self.unpacked:
+                self.before = self.after = self.cells = None
+                self.planes = []
+                self.unpacked = False
+
+    def compressed(self, store: HistoryStore) -> tuple[bytes, bytes]:
+        """the compressed delta and keyframe, and cells (read from the store's scratch file if they were spilled)"""
+        with _PACKING:
+            packed, spilled = self.packed, self.spilled
+        return packed if packed is not None else store.read(spilled)
+
+    def changed_cells(self, store: HistoryStore) -> np.ndarray:
+        """the cells the action changed (decompressed just for this if they're packed, the entry stays packed)"""
+        with _PACKING:
+            cells, unpacked = self.cells, self.unpacked
+        return cells if unpacked else np.frombuffer(zlib.decompress(self.compressed(store)[1]), dtype=np.int64)
+
+    def unpack(self, store: HistoryStore) -> None:
+        """mark the entry near the point history is at, decompressing its delta and keyframe if they were packed"""
+        with _PACKING:
+            self.near = True
+            if self.unpacked:
+                return
+        with PROFILER.span('history.unpack'):
+            payload, cells = self.compressed(store)
+            self.before, self.after, self.planes = pickle.loads(zlib.decompress(payload))
+            self.cells = np.frombuffer(zlib.decompress(cells), dtype=np.int64) if self.has_delta else None
+        self.unpacked = True
+
+    def packed_bytes(self) -> int:
+        """the bytes of the compressed copy held in memory (0 if there isn't one)"""
+        packed = self.packed
+        return 0 if packed is None else len(packed[0]) + len(packed[1])
+
+
+class HistoryStore:
+    """compresses history entries on a worker thread, so the frame loop only ever puts entries on a queue,
+    and keeps the compressed entries in memory up to a limit, spilling the least recently used ones past it to a
+    scratch file (the thread starts the first time there's something to do, the file the first time it's needed)
+
+    Instance Attributes:
+        - memory_limit: how many bytes of compressed entries are kept in memory
+        - resident_bytes: how many bytes of compressed entries are in memory
+        - spilled_bytes: how many bytes have been written to the scratch file
+    """
+    memory_limit: int
+    resident_bytes: int
+    spilled_bytes: int
+    _queue: queue.Queue  # (what to do, entry) jobs for the worker thread, None to stop it
+    _thread: threading.Thread | None
+    _resident: collections.OrderedDict[int, HistoryEntry]  # the entries in memory by id, least recently used first
+    _file: BinaryIO | None  # the scratch file (deleted once it's closed)
+    _lock: threading.Lock  # held while the resident entries or the file are used
+
+    def __init__(self, memory_limit: int = HISTORY_MEMORY_MB * MB) -> None:
+        self.memory_limit = memory_limit
+        self.resident_bytes = 0
+        self.spilled_bytes = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._resident = collections.OrderedDict()
+        self._file = None
+        self._lock = threading.Lock()
+
+    def compress(self, entry: HistoryEntry) -> None:
+        """compress an entry (it's let go of if it's still far from the point history is at once it's compressed)"""
+        self._put('compress', entry)
+
+    def prefetch(self, entry: HistoryEntry) -> None:
+        """read an entry that was spilled back into memory, so unpacking it doesn't wait on the scratch file"""
+        if entry.packed is None and entry.spilled is not None:
+            self._put('prefetch', entry)
+
+    def drop(self, entry: HistoryEntry) -> None:
+        """stop keeping an entry that left history in memory (what it spilled stays in the file until it's closed)"""
+        with self._lock:
+            if self._resident.pop(id(entry), None) is not None:
+                self.resident_bytes -= entry.packed_bytes()
+
+    def read(self, spilled: tuple[int, int, int]) -> tuple[bytes, bytes]:
+        """the compressed delta and keyframe, and cells, of an entry spilled to the given place in the scratch file"""
+        offset, payload, cells = spilled
+        with PROFILER.span('history.read'), self._lock:
+            self._file.seek(offset)
+            data = self._file.read(payload + cells)
+        return data[:payload], data[payload:]
+
+    def wait(self) -> None:
+        """block until everything put so far has been done"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """stop the worker thread once it's done what was put so far, and delete the scratch file"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread = None
+
+    def _put(self, job: str, entry: HistoryEntry) -> None:
+        """queue a job for the worker thread (starting it if it hasn't been)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put((job, entry))
+
+    def _run(self) -> None:
+        """worker thread: compress and prefetch queued entries, spilling what doesn't fit in memory"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            job, entry = item
+            if job == 'compress':
+                with PROFILER.span('history.pack'):
+                    entry.compress()
+            elif job == 'prefetch':
+                with _PACKING:
+                    spilled = entry.spilled if entry.packed is None else None
+                if spilled is not None:
+                    packed = self.read(spilled)
+                    with _PACKING:
+                        entry.packed = packed
+            self._keep(entry)
+            self._spill()
+            self._queue.task_done()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._resident.clear()
+        self._queue.task_done()
+
+    def _keep(self, entry: HistoryEntry) -> None:
+        """count an entry's compressed copy as in memory, as the most recently used"""
+        with self._lock:
+            if id(entry) in self._resident:
+                self._resident.move_to_end(id(entry))
+            elif entry.packed is not None:
+                self._resident[id(entry)] = entry
+                self.resident_bytes += entry.packed_bytes()
+
+    def _spill(self) -> None:
+        """write the least recently used entries to the scratch file (if they aren't in it already) and let go of
+        their compressed copies, until the ones left fit in memory"""
+        spilled = []
+        with self._lock:
+            while self.resident_bytes > self.memory_limit and self._resident:
+                entry = self._resident.popitem(last=False)[1]
+                payload, cells = entry.packed
+                if entry.spilled is None:
+                    if self._file is None:
+                        self._file = tempfile.TemporaryFile(prefix='hexpaint-history-')
+                    offset = self._file.seek(0, 2)
+                    with PROFILER.span('history.spill'):
+                        self._file.write(payload)
+                        self._file.write(cells)
+                    entry.spilled = (offset, len(payload), len(cells))
+                    self.spilled_bytes += len(payload) + len(cells)
+                self.resident_bytes -= len(payload) + len(cells)
+                spilled.append(entry)
+        with _PACKING:
+            for entry in spilled:
+                entry.packed = None
 
 
 class History:
     """keeps track of canvas history
-    Note, every node in the history linked list is a HexCanvas object"""
-    past: LinkedList
-    future: LinkedList
+
+    Instance Attributes:
+        - entries: every point in history, oldest first
+        - position: the index of the point the canvas is at (the points after it were undone)
+        - head: the colours of the canvas at that point, kept up to date as history changes and is travelled
+            (what deltas are made from, and what undo and redo copy from)
+        - store: compresses the entries that aren't near the point history is at, and spills them to disk
+    """
+    entries: list[HistoryEntry]
+    position: int
+    head: HistoryEntry | None
+    store: HistoryStore
+    _near: set[int]  # the indices of the entries that are kept unpacked
+    _snapshots: queue.Queue  # the entries committed but still being made, with their after colours taken
+    _snapshotter: threading.Thread | None  # the worker thread making them (started the first time one's committed)
 
     def __init__(self) -> None:
         """creates a History object"""
-        self.past = LinkedList([])
-        self.future = LinkedList([])
+        self.entries = []
+        self.position = -1
+        self.head = None
+        self.store = HistoryStore()
+        self._near = set()
+        self._snapshots = queue.Queue()
+        self._snapshotter = None
 
     def __len__(self) -> int:
         """length of history"""
-        return len(self.past) + len(self.future)
+        return len(self.entries)
 
     def __str__(self) -> str:
         """prints a list which is the course of actions (from historyEntries)"""
-        lst = [x.action for x in self.past.to_list()] + [x.action + '(undid)' for x in self.future.to_list()]
+        lst = [x.action for x in self.entries[:self.position + 1]] + \
+              [x.action + '(undid)' for x in self.entries[self.position + 1:]]
         return ', '.join(lst)
 
     def no_future(self) -> bool:
         """checks if there is only one thing left"""
-        return len(self.future) == 0
+        return self.position == len(self.entries) - 1
 
     def override(self, entry: HistoryEntry) -> None:
-        """create a new present item to history and get rid of everything from the saved point onward"""
-        self.future = LinkedList([])
-        self.past.append(entry)
+        """create a new present item to history and get rid of everything from the saved point onward
+        (the entry is a delta from the point history is at, or a keyframe)"""
+        self.wait()
+        self._override(entry)
+
+    def _override(self, entry: HistoryEntry) -> None:
+        """override, without waiting for the entries still being made"""
+        for dropped in self.entries[self.position + 1:]:
+            self.store.drop(dropped)
+        del self.entries[self.position + 1:]
+        self._near = {index for index in self._near if index <= self.position}
+        self.entries.append(entry)
+        self.position = len(self.entries) - 1
+        self.use(self.position)
+        if entry.has_delta:
+            entry.apply(self.head.planes)
+        else:
+            self.head = HistoryEntry(entry, 'HEAD')
+        self.head.background = entry.background
+        self.settle()
+
+    def record(self, canv: Canvas, action: str, changed: set[int]) -> HistoryEntry:
+        """add the point an action that changed the given cells got the canvas to, returns its entry
+        (a delta from the point history is at, which is also a keyframe every HISTORY_KEYFRAME_INTERVAL points,
+        or just a keyframe if the layers changed)
+        a delta is made and added on the snapshot worker thread, only the changed cells' new colours are taken here"""
+        entry = HistoryEntry(canv, action, len(changed), changed, keyframe=False)
+        if self.head is not None and self.head.same_layers(canv):  # (entries being made never change the layers)
+            entry.keep_after(canv.planes)
+            if self._snapshotter is None:
+                self._snapshotter = threading.Thread(target=self._run_snapshots, daemon=True)
+                self._snapshotter.start()
+            self._snapshots.put(entry)
+        else:
+            entry.keep_keyframe(canv.planes)
+            self.override(entry)
+        return entry
+
+    def wait(self) -> None:
+        """block until every entry recorded so far has been made and added to history"""
+        self._snapshots.join()
+
+    def _run_snapshots(self) -> None:
+        """worker thread: finish the deltas of the entries recorded (from the head, which is at the point before
+        each of them until it's added), add them, and keep a keyframe of the head once one's due"""
+        while True:
+            entry = self._snapshots.get()
+            try:
+                with PROFILER.span('history.record'):
+                    entry.keep_before(self.head.planes)
+                    keyframe = self.position + 1 - self.keyframe_at(self.position) >= HISTORY_KEYFRAME_INTERVAL
+                    self._override(entry)
+                    if keyframe:
+                        entry.keep_keyframe(self.head.planes)
+            except Exception:  # (a failed entry mustn't leave undo waiting on it forever)
+                log.exception('failed to record %s', entry.action)
+            finally:
+                self._snapshots.task_done()
+
+    def keyframe_at(self, index: int) -> int:
+        """the index of the last keyframe at or before the point at index"""
+        while not self.entries[index].keyframe:
+            index -= 1
+        return index
 
     def get_history_point(self) -> HistoryEntry:
         """get to the point in history we're at"""
-        return self.past[len(self.past) - 1]
-
-    def travel_back(self) -> bool:
-        """travel back in history"""
-        if len(self.past) >= 2:
-            released = self.past.remove_last()
-            self.future.insert(0, released)
-            return True
+        return self.entries[self.position]
+
+    def use(self, index: int) -> HistoryEntry:
+        """the entry at index, unpacked (it stays unpacked until history is far from it again, see settle)"""
+        entry = self.entries[index]
+        entry.unpack(self.store)
+        self._near.add(index)
+        return entry
+
+    def settle(self) -> None:
+        """hand the entries history is no longer near to the store"""
+        for index in [index for index in self._near if abs(index - self.position) > HISTORY_KEPT_UNPACKED]:
+            self._near.discard(index)
+            entry = self.entries[index]
+            entry.near = False
+            if entry.packed is None and entry.spilled is None:
+                self.store.compress(entry)
+            else:
+                entry.pack()
+
+    def travel_to(self, index: int) -> set[int] | None:
+        """travel to the point at index (clamped to the points there are), by stepping through the deltas in between
+        or by rebuilding it from the keyframe before it, whichever is cheaper
+        returns the cells that differ between the two points (None if it could be any of them)"""
+        self.wait()
+        index = max(0, min(index, len(self.entries) - 1))
+        if index == self.position:
+            return set()
+        forward = index > self.position
+        between = range(self.position + 1, index + 1) if forward else range(self.position, index, -1)
+        keyframe = self.keyframe_at(index)
+        rebuild = range(keyframe + 1, index + 1)
+        if sum(self.entries[i].step_cost() for i in between) <= (self.entries[keyframe].restore_cost() +
+                                                                 sum(self.entries[i].step_cost() for i in rebuild)):
+            for i in between:
+                self.use(i).apply(self.head.planes, forward)
         else:
-            return False
-
-    def travel_forward(self) -> bool:
-        """travel forward in history"""
-        if not self.no_future():
-            released = self.future.remove_first()
-            self.past.append(released)
-            return True
+            self.head = HistoryEntry(self.use(keyframe), 'HEAD')
+            for i in rebuild:
+                self.use(i).apply(self.head.planes)
+        self.position = index
+        self.head.background = self.entries[index].background
+        if not all(self.entries[i].has_delta for i in between):
+            changed = None
         else:
-            return False
+            changed = set(union_cells([self.entries[i].changed_cells(self.store) for i in between]).tolist())
+        self.settle()
+        if not forward:
+            for i in range(index - 1, max(-1, index - 1 - HISTORY_PREFETCH), -1):
+                self.store.prefetch(self.entries[i])
+        return changed
 
     def wipe(self) -> None:
         """wipe history"""
-        self.past = LinkedList([])
-        self.future = LinkedList([])
+        self.wait()
+        self.entries = []
+        self.position = -1
+        self.head = None
+        self._near = set()
+        self.store.close()
+        self.store = HistoryStore()
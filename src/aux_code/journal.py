@@ -0,0 +1,234 @@
+"""append-only journal of canvas operations (for crash recovery and autosave)
+
+A journal sits next to the file it belongs to (e.g. flower.hexpaint.journal). It starts with a header giving the
+canvas dimensions, followed by one binary record per committed operation:
+
+    record length, crc32 of the record, action name, then for every changed cell: layer, cell index, r, g, b, alpha
+
+or, for an operation that changed the number of layers (e.g. added one), no cells but the number of layers after it.
+
+Records store the colour a cell ended up with, so replaying them in order over the last full save rebuilds the
+canvas. A record that was only half written when the program died fails its crc and ends the replay.
+
+A journal is only left behind by a session that didn't close it (i.e. one that died): closing a journal deletes it.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from src.aux_code.log import get_logger
+
+log = get_logger('io')
+
+JOURNAL_SUFFIX = '.journal'
+SAVE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resources', 'save_files')
+UNTITLED_JOURNAL = os.path.join(SAVE_FOLDER, 'untitled.hexpaint' + JOURNAL_SUFFIX)
+_MAGIC = b'HXJ1'
+_HEADER = struct.Struct('<4sIII')  # magic, width, height, number of layers
+_RECORD_HEAD = struct.Struct('<II')  # length of the record body, crc32 of the body
+_ACTION_HEAD = struct.Struct('<BI')  # length of the action name, number of cells
+_CELL = struct.Struct('<BIBBBd')  # layer, cell index, r, g, b, alpha
+_LAYERS = struct.Struct('<B')  # the number of layers, in a record without cells
+_CELLS = np.dtype([('layer', 'u1'), ('index', '<u4'), ('rgb', 'u1', 3), ('alpha', '<f8')])  # _CELL, as an array
+
+
+def journal_path(file_path: str) -> str:
+    """where the journal of a save file lives"""
+    return file_path + JOURNAL_SUFFIX if file_path else UNTITLED_JOURNAL
+
+
+def encode_record(action: str, indices: np.ndarray, layers: list[tuple[int, np.ndarray, np.ndarray]]) -> bytes:
+    """encodes an operation (action name and the new colour of every cell it changed) as a journal record
+    the cells are the flat indices, and each layer they changed on is its number and their (rgb, alpha) on it"""
+    name = action.encode('utf-8')[:255]
+    cells = np.empty((len(layers), len(indices)), dtype=_CELLS)
+    for row, (layer, rgb, alpha) in zip(cells, layers):
+        row['layer'], row['index'], row['rgb'], row['alpha'] = layer, indices, rgb, alpha
+    body = _ACTION_HEAD.pack(len(name), cells.size) + name + cells.tobytes()
+    return _RECORD_HEAD.pack(len(body), zlib.crc32(body)) + body
+
+
+def encode_layers(action: str, num_layers: int) -> bytes:
+    """encodes an operation that changed the number of layers (to num_layers) as a journal record"""
+    name = action.encode('utf-8')[:255]
+    body = _ACTION_HEAD.pack(len(name), 0) + name + _LAYERS.pack(num_layers)
+    return _RECORD_HEAD.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_journal(path: str) -> tuple[tuple[int, int, int], list[tuple[str, list, int | None]]] | None:
+    """reads a journal, returns its (width, height, number of layers) and every complete record in it,
+    as the action, its cells and the number of layers after it (None unless it changed them)
+    returns None if there is no journal at path (or it isn't a journal)"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < _HEADER.size:
+        return None
+    magic, width, height, num_layers = _HEADER.unpack_from(data, 0)
+    if magic != _MAGIC:
+        return None
+
+    records = []
+    offset = _HEADER.size
+    while offset + _RECORD_HEAD.size <= len(data):
+        length, crc = _RECORD_HEAD.unpack_from(data, offset)
+        body = data[offset + _RECORD_HEAD.size:offset + _RECORD_HEAD.size + length]
+        if len(body) < length or zlib.crc32(body) != crc:  # torn write at the end of the journal
+            break
+        name_len, count = _ACTION_HEAD.unpack_from(body, 0)
+        action = body[_ACTION_HEAD.size:_ACTION_HEAD.size + name_len].decode('utf-8')
+        cells, layers_after = [], None
+        for i in range(count):
+            layer, index, r, g, b, alpha = _CELL.unpack_from(body, _ACTION_HEAD.size + name_len + i * _CELL.size)
+            cells.append((layer, index, (r, g, b), alpha))
+        if count == 0 and len(body) == _ACTION_HEAD.size + name_len + _LAYERS.size:
+            layers_after = _LAYERS.unpack_from(body, _ACTION_HEAD.size + name_len)[0]
+        records.append((action, cells, layers_after))
+        offset += _RECORD_HEAD.size + length
+    return (width, height, num_layers), records
+
+
+class Journal:
+    """encodes and writes journal records on a worker thread, so the frame loop only ever puts operations on a queue
+
+    Records are fsync'd in batches, at most once every sync_interval seconds. If writing fails, the journal stops
+    (the error is logged, and whatever is appended after is dropped).
+
+    Instance Attributes:
+        - path: the journal file being appended to
+        - dims: the (width, height, number of layers) of the canvas being journalled
+        - sync_interval: seconds between fsyncs of the journal
+        - failed: whether writing failed, stopping the journal
+        - num_layers: the number of layers the journal has recorded the canvas as having
+    """
+    path: str
+    dims: tuple[int, int, int]
+    sync_interval: float
+    failed: bool
+    num_layers: int
+    _queue: queue.Queue
+    _thread: threading.Thread
+
+    def __init__(self, path: str, dims: tuple[int, int, int], sync_interval: float = 1.0) -> None:
+        """opens (or starts) the journal at path (raises OSError if it can't be)"""
+        self.path = path
+        self.dims = dims
+        self.sync_interval = sync_interval
+        self.failed = False
+        self.num_layers = dims[2]
+        self._queue = queue.Queue()
+        file = self._open(path)
+        self._thread = threading.Thread(target=self._run, args=(file,), daemon=True)
+        self._thread.start()
+
+    def append(self, action: str, indices: np.ndarray, layers: list[tuple[int, np.ndarray, np.ndarray]]) -> None:
+        """journal an operation: its action name, the flat indices of the cells it changed, and for each layer they
+        changed on, its number and their new (rgb, alpha) (see encode_record, which runs on the worker thread)"""
+        if len(indices) and layers and not self.failed:
+            self._queue.put(('record', action, indices, layers))
+
+    def append_layers(self, action: str, num_layers: int) -> None:
+        """journal an operation that changed the number of layers (to num_layers)"""
+        self.num_layers = num_layers
+        if not self.failed:
+            self._queue.put(('layers', action, num_layers))
+
+    def checkpoint(self) -> threading.Event:
+        """mark the current end of the journal (e.g. when a full save is snapshot)
+        returns an event which is set, with the mark (and the number of layers there) stored on it, once the writer
+        gets to it"""
+        marker = threading.Event()
+        self._queue.put(('checkpoint', marker))
+        return marker
+
+    def saved(self, marker: threading.Event, file_path: str) -> None:
+        """a full save of everything up to marker has been written to file_path:
+        drop the records it covers and carry on journalling next to file_path"""
+        self._queue.put(('saved', marker, journal_path(file_path)))
+
+    def close(self) -> None:
+        """write everything queued, stop the writer and delete the journal
+        (it's only needed if the program dies without closing it)"""
+        self._queue.put(('close',))
+        self._thread.join()
+
+    def _run(self, file) -> None:
+        """worker thread: write queued operations until closed, stopping the journal if that fails"""
+        try:
+            self._write(file)
+        except OSError as e:
+            self.failed = True
+            log.error('stopped journalling to %s: %s', self.path, e)
+            file.close()
+
+    def _write(self, file) -> None:
+        """encode and write queued operations, fsyncing in batches"""
+        unsynced, last_sync = False, time.monotonic()
+        num_layers = self.dims[2]  # as of the last record written
+        while True:
+            try:
+                job = self._queue.get(timeout=self.sync_interval)
+            except queue.Empty:
+                job = None
+
+            if job is None:
+                pass
+            elif job[0] == 'record':
+                file.write(encode_record(job[1], job[2], job[3]))
+                unsynced = True
+            elif job[0] == 'layers':
+                file.write(encode_layers(job[1], job[2]))
+                num_layers = job[2]
+                unsynced = True
+            elif job[0] == 'checkpoint':
+                job[1].offset, job[1].num_layers = file.tell(), num_layers
+                job[1].set()
+            elif job[0] == 'saved':
+                file = self._compact(file, job[1].offset, job[1].num_layers, job[2])
+                unsynced, last_sync = False, time.monotonic()
+            elif job[0] == 'close':
+                file.close()
+                os.remove(self.path)
+                return
+
+            if unsynced and (job is None or time.monotonic() - last_sync >= self.sync_interval):
+                file.flush()
+                os.fsync(file.fileno())
+                unsynced, last_sync = False, time.monotonic()
+
+    def _open(self, path: str):
+        """open a journal for appending, starting it with a header if it's new"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        file = open(path, 'ab')
+        if file.tell() == 0:
+            file.write(_HEADER.pack(_MAGIC, *self.dims))
+            file.flush()
+        return file
+
+    def _compact(self, file, offset: int, num_layers: int, new_path: str):
+        """rewrite the journal at new_path with only the records written after offset
+        (num_layers is the number of layers the canvas had there, which the new header starts from)"""
+        file.flush()
+        file.close()
+        with open(self.path, 'rb') as old:
+            old.seek(offset)
+            tail = old.read()
+        self.dims = (self.dims[0], self.dims[1], num_layers)
+        temp_path = new_path + '.tmp'
+        with open(temp_path, 'wb') as new:
+            new.write(_HEADER.pack(_MAGIC, *self.dims) + tail)
+            new.flush()
+            os.fsync(new.fileno())
+        os.replace(temp_path, new_path)
+        if new_path != self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = new_path
+        return self._open(new_path)
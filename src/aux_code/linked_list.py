@@ -122,8 +122,7 @@ class LinkedList:
                 return curr.item
             curr = curr.next
             curr_index += 1
-        print(curr_index)
-        raise IndexError
+        raise IndexError(f'index {i} is past the end of a list of {curr_index} items')
 
     def __contains__(self, item: Any) -> bool:
         """Return whether <item> is in this list.
@@ -0,0 +1,92 @@
+"""leveled logging, with a logger per subsystem (instead of printing)
+
+Every subsystem logs through its own logger (hexpaint.<subsystem>, see SUBSYSTEMS), so each can be turned up, down
+or off on its own. Messages on hot paths (every redraw, hover, fill, and stroke start and end) are debug messages,
+which are off unless asked for: a message that's off costs a level check, since messages are formatted %-style from
+their arguments only when they're shown. Shown messages go to stdout as they always did, and can also go to a file,
+written in buffered chunks (anything at warning or above is written straight away).
+
+The logging is set from the environment when this is first imported (and can be set again with configure):
+    HEXPAINT_LOG: a level for every subsystem, then subsystem=level for any that differ, e.g. 'info,canvas=debug,ui=off'
+        (levels are debug, info, warning, error and off, info if not given)
+    HEXPAINT_LOG_FILE: a file to also write the shown messages to (with when, what level and which subsystem)
+"""
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import os
+import sys
+
+ROOT = 'hexpaint'
+SUBSYSTEMS = ('canvas', 'history', 'tools', 'render', 'ui', 'events', 'io', 'perf')
+LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR,
+          'off': logging.CRITICAL + 10}
+FILE_BUFFER = 256  # messages held before they're written to the log file
+FILE_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """writes messages to whatever sys.stdout is when they're written (so redirecting stdout redirects them too)"""
+
+    @property
+    def stream(self):
+        """the stream messages go to"""
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value) -> None:
+        pass
+
+
+def get_logger(subsystem: str) -> logging.Logger:
+    """the logger of a subsystem (one of SUBSYSTEMS)"""
+    return logging.getLogger(ROOT + '.' + subsystem)
+
+
+def parse_levels(spec: str) -> tuple[int, dict[str, int]]:
+    """the level for every subsystem, and the levels of the subsystems that differ, from e.g. 'info,canvas=debug'"""
+    level, levels = logging.INFO, {}
+    for part in filter(None, (part.strip().lower() for part in spec.split(','))):
+        if '=' in part:
+            subsystem, name = part.split('=', 1)
+            if subsystem not in SUBSYSTEMS or name not in LEVELS:
+                raise ValueError('unknown log setting ' + part)
+            levels[subsystem] = LEVELS[name]
+        elif part in LEVELS:
+            level = LEVELS[part]
+        else:
+            raise ValueError('unknown log level ' + part)
+    return level, levels
+
+
+def configure(spec: str = 'info', file_path: str | None = None, buffer: int = FILE_BUFFER) -> None:
+    """set the level of every subsystem from a spec like 'info,canvas=debug,ui=off' (see parse_levels),
+    and where messages go: stdout, and file_path too if given (buffer messages at a time)"""
+    level, levels = parse_levels(spec)
+    root = logging.getLogger(ROOT)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        target = getattr(handler, 'target', None)
+        handler.close()  # (a buffer writes what it was still holding to its file, which is then closed too)
+        if target is not None:
+            target.close()
+    root.setLevel(level)
+    root.propagate = False
+    for subsystem in SUBSYSTEMS:
+        get_logger(subsystem).setLevel(levels.get(subsystem, logging.NOTSET))
+
+    console = ConsoleHandler()
+    console.setFormatter(logging.Formatter('%(message)s'))
+    root.addHandler(console)
+    if file_path:
+        target = logging.FileHandler(file_path, delay=True)
+        target.setFormatter(logging.Formatter(FILE_FORMAT))
+        root.addHandler(logging.handlers.MemoryHandler(buffer, logging.WARNING, target))
+
+
+try:
+    configure(os.environ.get('HEXPAINT_LOG', 'info'), os.environ.get('HEXPAINT_LOG_FILE'))
+except ValueError as e:  # a typo in the environment shouldn't stop the program
+    configure()
+    get_logger('io').warning('ignored HEXPAINT_LOG: %s', e)
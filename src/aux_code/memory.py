@@ -0,0 +1,137 @@
+"""estimating where memory goes: the canvas layers, every history entry, and the render and asset caches
+
+The numbers are estimates of the bytes held by arrays, surfaces and the python objects there are a lot of (pixel
+views, cell index sets, profiler spans), not of every object. An array shared by several owners (e.g. a tile a
+history entry shares with the canvas) is counted once, for the first owner reported: the live canvas comes first,
+then history from the oldest entry on, so each history entry is charged what it holds on its own. History spilled to
+its scratch file is reported on its own, since it isn't in memory.
+"""
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from src.aux_code.canvas_foundation import ColourPlanes, PixelGrid
+from src.aux_code.constants import MEMORY_WARNING_MB
+from src.aux_code.profiler import PROFILER
+from src.aux_code.pygame_configure import pygame
+
+if TYPE_CHECKING:
+    from src.aux_code.canvas_system import HexCanvas
+    from src.aux_code.history_system import HistoryEntry
+    from src.aux_code.ui import UI
+
+MB = 1024 * 1024
+INT_BYTES = 28  # a python int in a set of cell indices (plus its share of the set's table, roughly)
+SPAN_BYTES = 150  # a profiler span (a tuple of a name, a thread id and two floats)
+
+
+def array_bytes(array: np.ndarray | None, seen: set[int]) -> int:
+    """the bytes of an array (0 if it's None or was already counted)"""
+    if array is None or id(array) in seen:
+        return 0
+    seen.add(id(array))
+    return array.nbytes
+
+
+def planes_bytes(planes: ColourPlanes, seen: set[int]) -> int:
+    """the bytes of the tiles of planes that weren't already counted"""
+    # (the tiles are listed first: the history head gets new tiles on the snapshot worker thread)
+    return sum(array_bytes(rgb, seen) + array_bytes(alpha, seen) for rgb, alpha in list(planes.tiles.values()))
+
+
+def surface_bytes(surface: pygame.Surface | None) -> int:
+    """the bytes of a surface's pixels"""
+    return 0 if surface is None else surface.get_bytesize() * surface.get_width() * surface.get_height()
+
+
+def cells_bytes(cells: set[int] | None) -> int:
+    """the bytes of a set of cell indices"""
+    return 0 if cells is None else sys.getsizeof(cells) + INT_BYTES * len(cells)
+
+
+def pixels_bytes(grid: PixelGrid) -> int:
+    """the bytes of the pixel views a layer made so far"""
+    pixels = grid._pixels
+    if not pixels:
+        return 0
+    sample = next(iter(pixels.values()))
+    return sys.getsizeof(pixels) + len(pixels) * (sys.getsizeof(sample) + sys.getsizeof(sample.__dict__))
+
+
+def stamps_bytes(grid: PixelGrid) -> int:
+    """the bytes of the operation marks of a layer (see CellStamps)"""
+    return sum(chunk.itemsize * len(chunk) for chunks in grid.stamps.stamps.values() for chunk in chunks.values())
+
+
+def entry_bytes(entry: HistoryEntry, seen: set[int]) -> int:
+    """the bytes of a history entry's keyframe and delta (packed or not) that weren't already counted"""
+    delta = (entry.before or []) + (entry.after or [])
+    return (sum(planes_bytes(planes, seen) for planes in entry.planes) + array_bytes(entry.cells, seen) +
+            sum(array_bytes(rgb, seen) + array_bytes(alpha, seen) for rgb, alpha in delta) +
+            (0 if entry.packed is None else sum(sys.getsizeof(packed) for packed in entry.packed)))
+
+
+def memory_report(canvas: HexCanvas, ui: UI | None = None, warning_mb: float = MEMORY_WARNING_MB) -> dict[str, Any]:
+    """estimated bytes held by the canvas (its layers, composite and queued cells), each of its history entries,
+    its renderer's caches, and (given the ui) the ui's assets, with the totals of each and whether the total is over
+    warning_mb megabytes"""
+    seen = set()
+    layers = [{'layer': i, 'tiles': len(planes.tiles), 'bytes': planes_bytes(planes, seen) + pixels_bytes(grid) +
+               stamps_bytes(grid)}
+              for i, (planes, grid) in enumerate(zip(canvas.planes, canvas.layers))]
+    composite = planes_bytes(canvas.composite, seen)
+    queued = sum(cells_bytes(cells) for cells in canvas.stale) + cells_bytes(canvas.dirty)
+
+    spilled = canvas.history.store.spilled_bytes
+    history = [{'action': entry.action, 'where': 'past' if i <= canvas.history.position else 'future',
+                'cells': entry.num_affected, 'bytes': entry_bytes(entry, seen)}
+               for i, entry in enumerate(canvas.history.entries)]
+    if canvas.history.head is not None:
+        history.append({'action': 'HEAD', 'where': 'present', 'cells': 0,
+                        'bytes': entry_bytes(canvas.history.head, seen)})
+
+    renderer = canvas.renderer
+    render = {'index_map': array_bytes(renderer.index_map, seen), 'slots': array_bytes(renderer._slots, seen),
+              'surfaces': sum(surface_bytes(surface) for surface in (renderer.surface, renderer.underlay,
+                                                                     renderer.frame)),
+              'checkerboard': surface_bytes(renderer._checker[1]) if renderer._checker else 0,
+              'mip_pyramid': sum(planes_bytes(planes, seen) for planes in renderer.pyramid.levels[1:]),
+              'profiler_spans': len(PROFILER.spans) * SPAN_BYTES}
+    assets = {}
+    if ui is not None:
+        assets = {'screen': surface_bytes(ui.screen), 'background_image': surface_bytes(ui.background_image)}
+
+    totals = {'layers': sum(layer['bytes'] for layer in layers) + composite + queued,
+              'history': sum(entry['bytes'] for entry in history),
+              'render': sum(render.values()), 'assets': sum(assets.values())}
+    total = sum(totals.values())
+    return {'total': total, 'warning': total > warning_mb * MB, 'warning_mb': warning_mb, 'totals': totals,
+            'layers': layers, 'composite': composite, 'queued_cells': queued, 'history': history,
+            'history_spilled': spilled, 'render': render, 'assets': assets}
+
+
+def format_report(report: dict[str, Any]) -> str:
+    """a memory report as lines of text (the biggest history entries first)"""
+    lines = [f"memory: {report['total'] / MB:.1f} MB estimated (warning at {report['warning_mb']} MB)",
+             '  ' + ', '.join(f'{part} {size / MB:.1f} MB' for part, size in report['totals'].items()),
+             '  layers: ' + ', '.join(f"{layer['layer']}: {layer['tiles']} tiles {layer['bytes'] / MB:.1f} MB"
+                                      for layer in report['layers']) + f", composite {report['composite'] / MB:.1f} MB",
+             '  render: ' + ', '.join(f'{part} {size / MB:.1f} MB' for part, size in report['render'].items())]
+    history = report['history']
+    lines.append(f'  history: {len(history)} entries, biggest: ' +
+                 ', '.join(f"{entry['action']}({entry['where']}) {entry['bytes'] / MB:.1f} MB"
+                           for entry in sorted(history, key=lambda entry: -entry['bytes'])[:5]) +
+                 f", {report['history_spilled'] / MB:.1f} MB spilled to disk")
+    return '\n'.join(lines)
+
+
+def memory_warning(report: dict[str, Any]) -> str | None:
+    """a warning to show if the report is over its warning limit (None if it isn't)"""
+    if not report['warning']:
+        return None
+    biggest = max(report['totals'], key=report['totals'].get)
+    return (f"warning: an estimated {report['total'] / MB:.0f} MB is in use (over {report['warning_mb']} MB), "
+            f"mostly {biggest} ({report['totals'][biggest] / MB:.0f} MB)")
@@ -0,0 +1,125 @@
+"""downsampled copies of a canvas, for drawing it zoomed out
+
+Level 0 of the pyramid is the canvas composite itself (one texel per cell), and every level after it halves the
+width and height of the one before it, each texel being the average of the (up to) 2 x 2 texels under it. Colours are
+averaged premultiplied by their alpha, so transparent cells don't darken the texels they're in.
+
+Levels are made when they're first needed, and kept up to date from the cells that changed since they were last
+used (only the texels above a changed cell get worked out again). Tiles of a level are only made over tiles of the
+level below that have been made, so a mostly untouched canvas costs next to nothing.
+"""
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+from src.aux_code.canvas_foundation import ColourPlanes, TILE_SIZE
+
+
+def lod_level(radius: float) -> int:
+    """the pyramid level to draw cells of the given radius (in screen pixels) from: the first level whose texels
+    cover at least a screen pixel (0 while the cells themselves do)"""
+    cell_area = 1.5 * math.sqrt(3) * radius ** 2
+    return 0 if cell_area >= 1 else math.ceil(math.log(1 / cell_area, 4))
+
+
+def reduce(rgb: np.ndarray, alpha: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """halves (rows, columns, 3) and (rows, columns) arrays of colours, each texel of the result being the average
+    of the 2 x 2 texels under it (an odd last row or column is averaged on its own)"""
+    rows, cols = alpha.shape
+    real = np.zeros((rows + rows % 2, cols + cols % 2), dtype=np.float64)
+    real[:rows, :cols] = 1.0
+    weight = np.zeros_like(real)
+    weight[:rows, :cols] = alpha
+    premultiplied = np.zeros(real.shape + (3,), dtype=np.float64)
+    premultiplied[:rows, :cols] = rgb * weight[:rows, :cols, None]
+
+    def quarters(array: np.ndarray) -> np.ndarray:
+        """sums every 2 x 2 block of array"""
+        return array.reshape(array.shape[0] // 2, 2, array.shape[1] // 2, 2, *array.shape[2:]).sum(axis=(1, 3))
+
+    total_alpha, count = quarters(weight), quarters(real)
+    total_rgb = quarters(premultiplied)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rgb = np.where(total_alpha[..., None] > 0, total_rgb / total_alpha[..., None], 0.0)
+        alpha = np.where(count > 0, total_alpha / count, 0.0)
+    return np.rint(rgb).astype(np.uint8), alpha
+
+
+class MipPyramid:
+    """the downsampled levels of a canvas composite
+
+    Instance Attributes:
+        - base: the planes level 0 is (the canvas composite)
+        - levels: the planes of every level made so far (levels[0] is base)
+    """
+    base: ColourPlanes | None
+    levels: list[ColourPlanes]
+    _pending: list[set[int] | None]  # per level, the texels of the level below it that changed (None for all of them)
+
+    def __init__(self) -> None:
+        self.base, self.levels, self._pending = None, [], []
+
+    def touch(self, base: ColourPlanes, cells: set[int] | None) -> None:
+        """the given cells of base changed (None for all of them, or a new base)"""
+        if base is not self.base or cells is None:
+            self.base, self.levels, self._pending = base, [base], [None]
+        elif len(self.levels) > 1 and self._pending[1] is not None:
+            self._pending[1] |= cells
+
+    def level(self, n: int) -> ColourPlanes:
+        """the planes of level n, brought up to date"""
+        while len(self.levels) <= n:
+            below = self.levels[-1]
+            self.levels.append(ColourPlanes(-(-below.width // 2), -(-below.height // 2), below.background,
+                                            below.background_alpha))
+            self._pending.append(None)
+        for i in range(1, n + 1):
+            if self._pending[i] is None:
+                self.rebuild(i)
+                changed = None
+            elif self._pending[i]:
+                changed = self.refresh(i, self._pending[i])
+            else:
+                continue
+            self._pending[i] = set()
+            if i + 1 < len(self.levels) and self._pending[i + 1] is not None:  # the level above needs them next
+                self._pending[i + 1] = None if changed is None else self._pending[i + 1] | changed
+        return self.levels[n]
+
+    def rebuild(self, n: int) -> None:
+        """work out every texel of level n, a tile at a time (tiles over unmade tiles of the level below stay unmade)"""
+        below, planes = self.levels[n - 1], self.levels[n]
+        planes.background, planes.background_alpha = below.background, below.background_alpha
+        planes.tiles = {}
+        made = {divmod(key, below.tiles_across) for key in below.tiles}  # (tile row, tile column) of the level below
+        for tile_y, tile_x in {(row // 2, col // 2) for row, col in made}:
+            top, left = 2 * TILE_SIZE * tile_y, 2 * TILE_SIZE * tile_x
+            bottom, right = min(below.height, top + 2 * TILE_SIZE), min(below.width, left + 2 * TILE_SIZE)
+            rgb, alpha = below.region(left, top, right, bottom)
+            rgb, alpha = reduce(rgb, alpha)
+            tile_rgb, tile_alpha = planes.blank_tile()
+            tile_rgb[:rgb.shape[0], :rgb.shape[1]], tile_alpha[:alpha.shape[0], :alpha.shape[1]] = rgb, alpha
+            planes.tiles[tile_y * planes.tiles_across + tile_x] = (tile_rgb, tile_alpha)
+
+    def refresh(self, n: int, changed: set[int]) -> set[int]:
+        """work out the texels of level n over the changed texels of the level below, returns their indices"""
+        below, planes = self.levels[n - 1], self.levels[n]
+        ys, xs = np.divmod(np.fromiter(changed, dtype=np.int64, count=len(changed)), below.width)
+        parents = np.unique((ys // 2) * planes.width + xs // 2)
+        parent_ys, parent_xs = np.divmod(parents, planes.width)
+
+        # the 2 x 2 texels under each parent, as a (parents, 4) block (texels past the edge are left out of the average)
+        child_ys = 2 * parent_ys[:, None] + np.array([0, 0, 1, 1])
+        child_xs = 2 * parent_xs[:, None] + np.array([0, 1, 0, 1])
+        real = (child_ys < below.height) & (child_xs < below.width)
+        children = np.where(real, child_ys * below.width + child_xs, 0)
+        rgb, alpha = below.gather(children.reshape(-1))
+        weight = alpha.reshape(-1, 4) * real
+        total_alpha = weight.sum(axis=1)
+        total_rgb = (rgb.reshape(-1, 4, 3) * weight[..., None]).sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            parent_rgb = np.where(total_alpha[:, None] > 0, total_rgb / total_alpha[:, None], 0.0)
+        planes.scatter(parents, np.rint(parent_rgb).astype(np.uint8), total_alpha / real.sum(axis=1))
+        return set(parents.tolist())
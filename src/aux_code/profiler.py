@@ -0,0 +1,166 @@
+"""timing where frames go: spans around each phase of the main loop and around the tool, history and save entry points
+
+Every frame is a row of phases, marked off by lap(), and anything can be timed with span() (or the timed decorator),
+including work on other threads (e.g. background saves). The last few seconds of frames are kept for the performance
+overlay (see UI.draw_profile), along with counters of what the frames did (e.g. cells recoloured or redrawn).
+Every span is also kept (up to a limit) to be exported as a Chrome trace file, which chrome://tracing, Perfetto and
+speedscope can open.
+
+Spans cost a couple of perf_counter calls, so they go around whole entry points rather than around per cell work.
+"""
+from __future__ import annotations
+
+import collections
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable
+
+PROFILES_FOLDER = 'resources/profiles'
+FRAMES_KEPT = 240  # frames of rolling statistics (a few seconds' worth)
+SPANS_KEPT = 200000  # spans kept for trace export (older ones are dropped)
+
+
+class FrameStats:
+    """how long a frame took, and what it did
+
+    Instance Attributes:
+        - start: when the frame started (seconds, on the perf_counter clock)
+        - total: how long the frame took (in milliseconds)
+        - phases: how long each phase of the frame took (in milliseconds)
+        - counters: how much of everything the frame did (e.g. cells redrawn)
+    """
+    start: float
+    total: float
+    phases: dict[str, float]
+    counters: dict[str, int]
+
+    def __init__(self, start: float) -> None:
+        self.start = start
+        self.total = 0.0
+        self.phases = {}
+        self.counters = {}
+
+
+class Profiler:
+    """spans and per frame statistics
+
+    Instance Attributes:
+        - frames: the statistics of the last FRAMES_KEPT finished frames (oldest first)
+        - spans: the last SPANS_KEPT spans, as (name, thread id, start, end) (in seconds, on the perf_counter clock)
+    """
+    frames: collections.deque[FrameStats]
+    spans: collections.deque[tuple[str, int, float, float]]
+    _frame: FrameStats | None  # the frame running
+    _lap: float  # when the last phase of the running frame ended
+    _main_thread: int  # the thread frames run on (spans on other threads don't count towards frames)
+
+    def __init__(self) -> None:
+        self.frames = collections.deque(maxlen=FRAMES_KEPT)
+        self.spans = collections.deque(maxlen=SPANS_KEPT)
+        self._frame = None
+        self._lap = 0.0
+        self._main_thread = threading.get_ident()
+
+    def begin_frame(self) -> None:
+        """start timing a frame (finishing the one running, if it wasn't)"""
+        self.end_frame()
+        self._lap = time.perf_counter()
+        self._frame = FrameStats(self._lap)
+        self._main_thread = threading.get_ident()
+
+    def lap(self, phase: str) -> None:
+        """the running frame's phase (everything since the last lap, or since the frame started) just ended"""
+        if self._frame is not None:
+            now = time.perf_counter()
+            self.spans.append((phase, self._main_thread, self._lap, now))
+            self._frame.phases[phase] = self._frame.phases.get(phase, 0.0) + (now - self._lap) * 1000
+            self._lap = now
+
+    def end_frame(self) -> None:
+        """finish timing the running frame"""
+        if self._frame is not None:
+            end = time.perf_counter()
+            self.spans.append(('frame', self._main_thread, self._frame.start, end))
+            self._frame.total = (end - self._frame.start) * 1000
+            self.frames.append(self._frame)
+            self._frame = None
+
+    def count(self, counter: str, amount: int = 1) -> None:
+        """add to one of the running frame's counters"""
+        if self._frame is not None:
+            self._frame.counters[counter] = self._frame.counters.get(counter, 0) + amount
+
+    def record(self, name: str, start: float, end: float) -> None:
+        """keep a span that ran from start to end (on the perf_counter clock) on this thread"""
+        self.spans.append((name, threading.get_ident(), start, end))
+
+    def span(self, name: str) -> Span:
+        """a context manager timing what runs inside it"""
+        return Span(self, name)
+
+    def summary(self) -> dict:
+        """the rolling statistics: frame time percentiles, the average time of each phase and the average counters
+        (per frame, over the frames kept)"""
+        if not self.frames:
+            return {'frames': 0}
+        totals = sorted(frame.total for frame in self.frames)
+        phases, counters = {}, {}
+        for frame in self.frames:
+            for phase, ms in frame.phases.items():
+                phases[phase] = phases.get(phase, 0.0) + ms / len(self.frames)
+            for counter, amount in frame.counters.items():
+                counters[counter] = counters.get(counter, 0) + amount / len(self.frames)
+        return {'frames': len(totals), 'frame_ms': {'p50': totals[len(totals) // 2],
+                                                   'p95': totals[min(len(totals) - 1, len(totals) * 95 // 100)],
+                                                   'max': totals[-1]},
+                'phase_ms': phases, 'counters': counters}
+
+    def export_trace(self, path: str | None = None) -> str:
+        """write the spans kept as a Chrome trace file, returns where it was written"""
+        if path is None:
+            os.makedirs(PROFILES_FOLDER, exist_ok=True)
+            path = os.path.join(PROFILES_FOLDER, time.strftime('%Y%m%d-%H%M%S') + '.trace.json')
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': start * 1e6, 'dur': (end - start) * 1e6}
+                  for name, tid, start, end in list(self.spans)]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        return path
+
+
+class Span:
+    """times what runs inside a with block (see Profiler.span)"""
+    __slots__ = ('profiler', 'name', 'start')
+    profiler: Profiler
+    name: str
+    start: float
+
+    def __init__(self, profiler: Profiler, name: str) -> None:
+        self.profiler, self.name, self.start = profiler, name, 0.0
+
+    def __enter__(self) -> Span:
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.profiler.record(self.name, self.start, time.perf_counter())
+
+
+PROFILER = Profiler()  # the one profiler everything reports to
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """decorates a function so every call of it is a span of the given name"""
+    def decorate(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                PROFILER.record(name, start, time.perf_counter())
+        return wrapper
+    return decorate
@@ -6,6 +6,8 @@ import pygame
 import math
 import sys
 
+from src.aux_code.log import get_logger
+
 
 def initialize_pygame_window(width: int, height: int) -> pygame.Surface:
     """Initialize and return a new pygame window with the given width and height.
@@ -73,16 +75,42 @@ def draw_lines_g(screen: pygame.Surface, colour: tuple[int, int, int], verts: li
     #     print(verts)
 
 
+MIN_BORDER_HEX_RADIUS = 2  # below this radius (in screen pixels) a canvas border is drawn as a rectangle
+
+
 def draw_hex_border(screen: pygame.Surface, line_thick: int, start_pos: tuple[float, float], start_pos2: tuple[float, float],
                     rows: int, cols: int, radius: float, colour: tuple[int, int, int] = (100, 100, 100)) -> None:
-    """starts at start pos as top left hex, then draws a hex border along the canvas given the radius, rows and cols"""
+    """starts at start pos as top left hex, then draws a hex border along the canvas given the radius, rows and cols
+    (only the hexagons inside the screen's clip area get their lines drawn, and hexagons too small for their edges
+    to be seen get a plain rectangle around them instead)"""
+    if radius < MIN_BORDER_HEX_RADIUS:
+        hex_width_half = radius * math.sqrt(3 / 4)
+        left, top = start_pos[0] - hex_width_half, start_pos[1] - radius
+        right, bottom = start_pos[0] + 2 * hex_width_half * cols, start_pos2[1] + radius
+        draw_lines_g(screen, colour, [(left, top), (right, top), (right, bottom), (left, bottom)], line_thick)
+        return
+    clip = screen.get_clip()
+    reach = radius + line_thick  # how far a hexagon's border lines can get from its centre
     for side in range(0, 4):
         hex_width_half = radius * math.sqrt(3 / 4)
-        side_len = cols if side % 2 == 0 else rows
         x, y = start_pos
         x2, y2 = start_pos2
-
-        for i in range(0, side_len):
+        if side % 2 == 0:  # hexagons along the top or bottom go across
+            side_y = y if side == 0 else y2
+            if side_y + reach < clip.top or side_y - reach > clip.bottom:
+                continue
+            first = math.floor((clip.left - reach - x) / (2 * hex_width_half)) - 1
+            last = math.ceil((clip.right + reach - x) / (2 * hex_width_half)) + 1
+            side_range = range(max(0, first), min(cols, last))
+        else:  # hexagons along the right or left go down
+            side_x = x2 if side == 1 else x
+            if side_x + reach + hex_width_half < clip.left or side_x - reach - hex_width_half > clip.right:
+                continue
+            first = math.floor((clip.top - reach - y) / (1.5 * radius)) - 1
+            last = math.ceil((clip.bottom + reach - y) / (1.5 * radius)) + 1
+            side_range = range(max(0, first), min(rows, last))
+
+        for i in side_range:
             if side == 0:  # top
                 verts = regular_polygon_vertices(x + i * 2 * hex_width_half, y, radius, 6)
                 draw_g_line(screen, colour, verts[5], verts[0], line_thick)
@@ -129,7 +157,7 @@ def input_mouse_pygame() -> tuple[int, int]:
     if event.type == pygame.MOUSEBUTTONUP:
         return event.pos
     else:
-        print('Exiting Pygame window. Please restart the Python console!')
+        get_logger('ui').info('Exiting Pygame window. Please restart the Python console!')
         pygame.display.quit()
         sys.exit(0)
 
@@ -0,0 +1,173 @@
+"""recording tool invocations, and replaying them headlessly (for debugging, benchmarks and regression fixtures)
+
+A recording is a JSON lines file. The first line is a header with the screen size, the canvas the recording
+started from (in the save file format) and how it was zoomed and panned, every other line is an operation:
+    - a stroke: the tool type, its settings, the layer, how the canvas was zoomed and panned, and every sample the
+      stroke handled (screen position, the cell under it, the colour the tool was using at the time, and the mouse
+      motion that led there)
+    - an undo or a redo
+    - a layer being added, or a change to how a layer shows (its visibility, opacity or blend mode)
+    - a view change: how the canvas is zoomed and panned after the user zoomed, panned or reset the view
+
+Usage:
+    python -m src.aux_code.recorder <recording> [--repeat N] [--out <save file>]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+
+from src.aux_code.canvas_foundation import CanvasLayout
+from src.aux_code.canvas_system import HexCanvas, ToolBelt
+from src.aux_code.history_system import HistoryEntry
+from src.aux_code.stroke_system import StrokeHandler
+from src.aux_code.save_and_load import compress_writing, uncompress, write_file
+from src.aux_code.pygame_configure import pygame
+
+RECORDINGS_FOLDER = 'resources/recordings'
+# the ToolBelt attributes that change how a tool behaves
+TOOL_SETTINGS = ('size', 'hardness', 'overwrite', 'tolerance', 'alpha_tolerate', 'globally', 'spiral', 'alpha_dim',
+                 'keep_mass', 'enforce_draw_once', 'smart_pencil')
+
+
+class Recorder:
+    """records the tool invocations made on a canvas
+
+    Instance Attributes:
+        - header: the screen size, starting canvas and starting view of the recording
+        - ops: the recorded operations, in order
+    """
+    header: dict
+    ops: list[dict]
+    _layout: CanvasLayout  # where the recorded canvas is on the screen
+    _stroke: dict | None
+
+    def __init__(self, canvas: HexCanvas, screen: pygame.Surface) -> None:
+        """start recording from the current state of canvas"""
+        self.header = {'version': 1, 'screen': list(screen.get_size()), 'canvas': compress_writing(canvas.snapshot()),
+                       'view': canvas.layout.placement()}
+        self.ops = []
+        self._layout = canvas.layout
+        self._stroke = None
+
+    def sample(self, tool: ToolBelt, layer: int, pos: tuple[int, int], col: tuple[int, int, int], alpha: float,
+               cell: tuple[int, int] | None = None, motion: list[tuple[int, int]] | None = None) -> None:
+        """record one sample of a stroke (the first sample of a stroke also records the tool it uses)"""
+        if self._stroke is None:
+            self._stroke = {'op': 'stroke', 'tool': tool.type, 'layer': layer, 'view': self._layout.placement(),
+                            'settings': {name: getattr(tool, name) for name in TOOL_SETTINGS}, 'samples': []}
+        self._stroke['samples'].append([pos[0], pos[1], cell and list(cell), list(col), alpha,
+                                        [list(point) for point in motion] if motion else None])
+
+    def end_stroke(self) -> None:
+        """the stroke being recorded has finished"""
+        if self._stroke is not None:
+            self.ops.append(self._stroke)
+            self._stroke = None
+
+    def history(self, op: str, to: int | None = None) -> None:
+        """record an undo, a redo, or a jump to the point in history at index to"""
+        self.end_stroke()
+        self.ops.append({'op': op} if to is None else {'op': op, 'to': to})
+
+    def layer_op(self, op: str, **args) -> None:
+        """record a layer being added (op is 'add_layer') or shown differently (op is 'set_layer'), with the
+        arguments HexCanvas was given"""
+        self.end_stroke()
+        self.ops.append({'op': op, **args})
+
+    def view(self) -> None:
+        """record how the canvas is zoomed and panned now (a run of view changes, like a pan, is kept as its last)"""
+        self.end_stroke()
+        if self.ops and self.ops[-1]['op'] == 'view':
+            self.ops.pop()
+        self.ops.append({'op': 'view', 'view': self._layout.placement()})
+
+    def save(self, path: str | None = None) -> str:
+        """write the recording as a JSON lines file, returns where it was written"""
+        self.end_stroke()
+        if path is None:
+            os.makedirs(RECORDINGS_FOLDER, exist_ok=True)
+            path = os.path.join(RECORDINGS_FOLDER, time.strftime('%Y%m%d-%H%M%S') + '.hexrec')
+        lines = [json.dumps(self.header)] + [json.dumps(op) for op in self.ops]
+        write_file(path, '\n'.join(lines) + '\n')
+        return path
+
+
+def load_recording(path: str) -> tuple[dict, list[dict]]:
+    """reads a recording, returns its header and operations"""
+    with open(path, 'r') as file:
+        lines = [line for line in file.read().split('\n') if line]
+    return json.loads(lines[0]), [json.loads(line) for line in lines[1:]]
+
+
+def replay(header: dict, ops: list[dict]) -> HexCanvas:
+    """re-apply recorded operations to a fresh copy of the canvas they were recorded on, without a window
+    (every operation is applied as fast as possible, there is no frame pacing)"""
+    screen = pygame.Surface(header['screen'])
+    layers, _ = uncompress(header['canvas'])
+    canvas = HexCanvas((len(layers[0][0]), len(layers[0])))
+    canvas.load_layers(layers)
+    canvas.load(screen, use_current=True)
+    if 'view' in header:
+        canvas.layout.restore(*header['view'])
+    canvas.history.override(HistoryEntry(canvas, 'REPLAY'))
+    tool = ToolBelt()
+    strokes = StrokeHandler(canvas, tool, screen)
+
+    for op in ops:
+        if op['op'] == 'undo':
+            canvas.undo(screen)
+        elif op['op'] == 'redo':
+            canvas.redo(screen)
+        elif op['op'] == 'jump':
+            canvas.jump(screen, op['to'])
+        elif op['op'] == 'add_layer':  # added the way the program adds them, as a new point in history
+            canvas.add_layer(tuple(op['colour']) if op['colour'] else None, op['alpha'])
+            canvas.commit('NEW_LAYER', set())
+        elif op['op'] == 'set_layer':
+            canvas.set_layer(op['layer'], op['visible'], op['opacity'], op['blend'])
+        elif op['op'] == 'view':
+            canvas.layout.restore(*op['view'])
+        elif op['op'] == 'stroke':
+            if 'view' in op:  # screen positions only land on the same cells with the canvas zoomed and panned the same
+                canvas.layout.restore(*op['view'])
+            tool.type = op['tool']
+            for name, value in op['settings'].items():
+                setattr(tool, name, value)
+            canvas.drawing_mode(True, tool)
+            for x, y, _, col, alpha, motion in op['samples']:
+                if not canvas.drawing:  # click tools finish after their first sample
+                    break
+                motion = [tuple(point) for point in motion] if motion else None
+                strokes.drawing_logistics(alpha, tuple(col), x, y, op['layer'], motion)
+            if canvas.drawing:
+                canvas.drawing_mode(False, tool)
+            strokes.colouring_logistics(None, None, True)
+    return canvas
+
+
+def main() -> None:
+    """command line replay: replays a recording, reporting how long it took"""
+    parser = argparse.ArgumentParser(description='replay a HexPaint recording without a window')
+    parser.add_argument('recording')
+    parser.add_argument('--repeat', type=int, default=1, help='number of times to replay it')
+    parser.add_argument('--out', default=None, help='save the replayed canvas to this file')
+    args = parser.parse_args()
+
+    header, ops = load_recording(args.recording)
+    times = []
+    canvas = None
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        canvas = replay(header, ops)
+        times.append(time.perf_counter() - start)
+    print(json.dumps({'recording': args.recording, 'ops': len(ops), 'seconds': times}))
+    if args.out:
+        write_file(args.out, compress_writing(canvas.snapshot()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,19 @@
 """save and load functions"""
+import ast
 import os
+import threading
 import tkinter as tk
 from tkinter import filedialog
-from typing import Any
+from typing import Any, Callable
 import base64
 
+import numpy as np
+
+from src.aux_code.profiler import timed
+from src.aux_code.log import get_logger
+
+log = get_logger('io')
+
 
 def hex_to_binary(hex_str: str) -> str:
     """converts a hex string to binary"""
@@ -12,24 +21,29 @@ def hex_to_binary(hex_str: str) -> str:
 
 
 
-def load_file() -> tuple[Any, str]:
-    """loads a file (prompts user to select, then returns the file contents"""
+def load_file() -> tuple[Any, str, str]:
+    """loads a file (prompts user to select, then returns the file contents, name and path"""
     selected_file = file_prompt()
     if selected_file:
-        with open(selected_file, 'r') as file:
-            file_contents = file.read()
-        assert isinstance(file_contents, str)
         name = selected_file.split('/')[-1].split('.')[0]
-        if file_contents[0] == '[':
-            return eval(file_contents), name
-        else:
-            try:
-                return uncompress(file_contents), name
-            except Exception as e:
-                print('failed to uncompress file due to: ', e)
-                return None, ''
+        try:
+            return read_file(selected_file), name, selected_file
+        except Exception as e:
+            log.warning('failed to uncompress file due to: %s', e)
+            return None, '', ''
     else:
-        return None, ''
+        return None, '', ''
+
+
+@timed('load.read')
+def read_file(file_path: str) -> list:
+    """reads a save file (either format) without prompting, returns its layers and pixel size"""
+    with open(file_path, 'r') as file:
+        file_contents = file.read()
+    assert isinstance(file_contents, str)
+    if file_contents[0] == '[':  # the old format is a python literal, which is only ever read as one
+        return ast.literal_eval(file_contents)
+    return uncompress(file_contents)
 
 
 def file_prompt() -> str | None:
@@ -41,28 +55,135 @@ def file_prompt() -> str | None:
     if file_path.endswith(".hexpaint"):
         return file_path
     else:
-        print('Invalid file')
+        log.warning('Invalid file')
 
 
-def create_file(lst: list, current_file: str | None) -> str:
-    """saves a list as a txt"""
+def save_prompt(current_file: str | None) -> str:
+    """prompts the user to pick where to save, returns the chosen path ('' if cancelled)"""
     root = tk.Tk()
     root.withdraw()
     sugg_file = '' if current_file is None else current_file + '.hexpaint'
     file_path = filedialog.asksaveasfilename(initialdir=os.getcwd() + 'resources/save_files',
                                              defaultextension=".hexpaint", filetypes=[("Text Files", "*.hexpaint")], initialfile=sugg_file)
+    return file_path if file_path else ''
+
+
+@timed('save.write')
+def write_file(file_path: str, contents: str) -> None:
+    """writes a file atomically: the contents go to a temp file next to it, which then replaces the real file,
+    so a crash mid-save never leaves a half written save file behind"""
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w') as file:
+        file.write(contents)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+
+
+def create_file(lst: list, current_file: str | None) -> str:
+    """saves a list as a txt"""
+    file_path = save_prompt(current_file)
     if file_path:
-        with open(file_path, 'w') as file:
-            bin_data = compress_writing(lst)
-            file.write(bin_data)
+        write_file(file_path, compress_writing(lst))
         return file_path.split('/')[-1].split('.')[0]
     else:
-        print('failed to save file')
+        log.warning('failed to save file')
         return ''
 
 
-def compress_writing(lst: list) -> str:
-    """saves a list as a txt"""
+def snapshot_lists(layers: list[tuple[np.ndarray, np.ndarray]], pix_size: float) -> list:
+    """the layers (rows of (rgb, alpha) tuples) and the pixel size compress_writing takes,
+    from every layer's (rgb, alpha) arrays (see HexCanvas.dense_snapshot)
+    (a row at a time, so a worker thread doing this never holds up the frame loop for long)"""
+    lists = []
+    for rgb, alpha in layers:
+        lists.append([list(zip(map(tuple, rgb_row.tolist()), alpha_row.tolist()))
+                      for rgb_row, alpha_row in zip(rgb, alpha)])
+    return [lists, pix_size]
+
+
+class BackgroundSaver:
+    """encodes and writes save files on a worker thread, so the window never freezes while saving
+
+    Instance Attributes:
+        - progress: how much of the running save has been encoded (0.0 to 1.0)
+        - status: a short message about the running (or last) save, for the UI to show
+        - file_path: the file being saved (or last saved)
+    """
+    progress: float
+    status: str
+    file_path: str
+    _thread: threading.Thread | None
+    _pending: tuple[tuple, str, Callable[[], None] | None] | None
+    _lock: threading.Lock
+
+    def __init__(self) -> None:
+        self.progress = 0.0
+        self.status = ''
+        self.file_path = ''
+        self._thread = None
+        self._pending = None
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> bool:
+        """whether a save is running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def request(self, snapshot: tuple[list[tuple[np.ndarray, np.ndarray]], float], file_path: str,
+                on_done: Callable[[], None] | None = None) -> bool:
+        """save a canvas snapshot (see HexCanvas.dense_snapshot) to file_path in the background
+        (it's turned into lists and encoded on the worker thread, and on_done is called once it's written)
+        if a save is already running, this one waits for it and replaces any other waiting save
+        (so repeated requests coalesce into one), and False is returned"""
+        with self._lock:
+            if self.busy:
+                self._pending = (snapshot, file_path, on_done)
+                return False
+            self.file_path = file_path
+            self._thread = threading.Thread(target=self._run, args=(snapshot, file_path, on_done), daemon=True)
+            self._thread.start()
+            return True
+
+    def wait(self) -> None:
+        """block until every requested save has been written (e.g. before quitting)"""
+        thread = self._thread
+        while thread is not None:
+            thread.join()
+            thread = self._thread
+
+    def _run(self, snapshot: tuple, file_path: str, on_done: Callable[[], None] | None) -> None:
+        """worker thread: keep saving until there is nothing pending"""
+        job = (snapshot, file_path, on_done)
+        while job:
+            snapshot, file_path, on_done = job
+            self.file_path = file_path
+            self.progress = 0.0
+            self.status = 'saving ' + os.path.basename(file_path)
+            try:
+                write_file(file_path, compress_writing(snapshot_lists(*snapshot), self._set_progress))
+                self.status = 'saved ' + os.path.basename(file_path)
+                if on_done:
+                    on_done()
+            except OSError as e:
+                self.status = 'failed to save file'
+                log.error('failed to save file due to: %s', e)
+            self.progress = 1.0
+            with self._lock:
+                job, self._pending = self._pending, None
+                if not job:
+                    self._thread = None
+
+    def _set_progress(self, progress: float) -> None:
+        """progress callback for compress_writing"""
+        self.progress = progress
+
+
+@timed('save.encode')
+def compress_writing(lst: list, progress: Callable[[float], None] | None = None) -> str:
+    """saves a list as a txt
+    the list holds the layers (rows of (rgb, alpha) tuples) and the pixel size,
+    progress is called with the fraction of rows encoded so far"""
     output = ''
     layers, pix_size = lst[0], lst[1]
     height = len(layers[0])
@@ -70,6 +191,7 @@ def compress_writing(lst: list) -> str:
     output += f'{pix_size},{height},{width}\n\n'
     prev_entry = ''
     all_uniques = set()
+    rows_done, total_rows = 0, len(layers) * height
     for layer in layers:
         for y in range(height):
             line = ''
@@ -78,8 +200,7 @@ def compress_writing(lst: list) -> str:
                 pixel = layer[y][x]
                 if pixel:
                     entry = ''
-                    r, g, b = pixel['rgb']
-                    a = pixel['alpha']
+                    (r, g, b), a = pixel
                     if r == g == b and r in {0, 255} and a == 1:
                         if r == 255:
                             entry += '1'
@@ -112,6 +233,9 @@ def compress_writing(lst: list) -> str:
                     if x < width - 1:
                         line += ','
             output += line + '\n'
+            rows_done += 1
+            if progress and rows_done % 16 == 0:
+                progress(rows_done / total_rows)
         output += '\n'
 
     if output[-1] == '\n':
@@ -119,6 +243,7 @@ def compress_writing(lst: list) -> str:
     return output
 
 
+@timed('load.decode')
 def uncompress(file_contents: str) -> list:
     """uncompresses the file contents"""
     layers = []
@@ -161,7 +286,7 @@ def uncompress(file_contents: str) -> list:
             if lst:
                 layer.append(lst)
                 if len(lst) > int(height):
-                    print("um yeah lol")
+                    log.warning("decoded a row of %d cells, more than the %s there should be", len(lst), height)
         layers.append(layer)
     return [layers, pix_size]
 
@@ -0,0 +1,156 @@
+"""applying tool strokes to a canvas (used by the main loop and by headless replays)"""
+from __future__ import annotations
+
+from src.aux_code.canvas_system import HexCanvas, ToolBelt
+from src.aux_code.pygame_configure import pygame
+from src.aux_code.constants import RECOLOUR_TOOLS, CLICK_TOOLS, LINE_TOOLS
+from src.aux_code.profiler import PROFILER, timed
+from src.aux_code.log import get_logger
+
+log = get_logger('tools')
+
+
+class StrokeHandler:
+    """the drawing and colouring logistics of a stroke, i.e. everything between pressing and releasing the mouse
+
+    Instance Attributes:
+        - canvas: the canvas being drawn on
+        - tool: the tool drawing the stroke
+        - screen: the surface the canvas is drawn on
+        - loop_save: what the stroke has done so far (kept between frames)
+    """
+    canvas: HexCanvas
+    tool: ToolBelt
+    screen: pygame.Surface
+    loop_save: dict
+
+    def __init__(self, canvas: HexCanvas, tool: ToolBelt, screen: pygame.Surface) -> None:
+        self.canvas = canvas
+        self.tool = tool
+        self.screen = screen
+        self.loop_save = {'pixel_history': [], 'pixels_tobe_coloured': [], 'pixels_drawn': [], 'changed': set()}
+
+    @timed('tool.draw')
+    def drawing_logistics(self, alpha, col, x, y, layer, motion: list[tuple[int, int]] | None = None) -> None:
+        """handles drawing stuff
+        motion holds every position the mouse moved through since the last frame (oldest first), if known"""
+        if self.canvas.drawing:
+            self.loop_save['layer'] = layer  # (what the stroke is committed and journalled as changing)
+            if motion:
+                x, y = motion[-1]
+            pixel = self.canvas.pos_gets_pixel(layer, x, y, self.screen)
+            if self.canvas.recorder:
+                self.canvas.recorder.sample(self.tool, layer, (x, y), col, alpha, pixel.coord if pixel else None, motion)
+            if self.tool.type == 'PENCIL' and motion:
+                self.pencil_polyline(alpha, col, layer, motion, pixel)
+                return
+            if pixel and pixel.drawn and self.tool.enforce_draw_once:
+                return
+            self.loop_save['pixel_history'].append(((x, y), pixel))
+            fix_pixels = []
+            # print(len(self.loop_save['pixel_history']))
+
+            # fixing line skidding (drawing lines between two points in free drawing when moving too fast)
+            if self.tool.type in {'PENCIL'} and len(self.loop_save['pixel_history']) > 1:
+                pix1, pix2 = self.loop_save['pixel_history'][-2], self.loop_save['pixel_history'][-1]
+                # print(len(self.loop_save['pixel_history']))
+                if pix1[1] is None or pix2[1] is None or pix1[1] not in pix2[1].adj:
+                    fix_pixels = list(
+                        self.canvas.get_line(pix1[0], pix2[0], self.canvas.layers[layer][0][0].size, self.screen,
+                                             layer, col, alpha, self.tool.overwrite, False))
+            # applying the tool action
+            if pixel or (self.tool.type in LINE_TOOLS and len(self.tool.positions) > 0):
+                pix_to_colour, temporary = self.tool.onclick(pixel, self.canvas, self.screen, layer, (x, y),
+                                                             self.canvas.layers[layer][0][0].size, col, alpha)
+                self.loop_save['pixels_tobe_coloured'] = pix_to_colour + fix_pixels
+                # print(f"pix to colour {len(pix_to_colour)}")
+                # print(f"pix + fix to colour {len(self.loop_save['pixels_tobe_coloured'])}")
+
+                if self.tool.type in RECOLOUR_TOOLS and not temporary:  # if this tool is one that recolours pixels
+                    drawn_before = len(self.loop_save['pixels_drawn'])
+                    for pix, rgba in self.loop_save['pixels_tobe_coloured']:
+                        if pix.drawn and self.tool.enforce_draw_once:
+                            # this is for pixels drawn because of fix pixels, so they weren't skipped in the first place
+                            continue
+                        pix.set_drawn(self.tool.enforce_draw_once)
+                        self.loop_save['pixels_drawn'].append(pix)
+                        self.loop_save['changed'].add(self.canvas.cell_index(pix.coord))
+                        pix.recolour(rgba[:3], rgba[3] * self.tool.hardness, self.tool.overwrite)
+                        self.canvas.mark_dirty({self.canvas.cell_index(pix.coord)}, layer)
+                    PROFILER.count('recoloured', len(self.loop_save['pixels_drawn']) - drawn_before)
+
+            # disable drawing mode for click tools (e.g. bucket)
+            if self.tool.type in CLICK_TOOLS:
+                self.canvas.drawing_mode(False, self.tool)
+                self.canvas.end_operation()
+                if len(self.loop_save['pixels_drawn']) > 0:
+                    self.canvas.commit(self.tool.type, self.loop_save['changed'],
+                                       self.loop_save.get('layer'))
+                # self.canvas.history.override(HistoryEntry(self.canvas, self.tool.type))  # fixes an undo/redo related bug
+                if self.canvas.recorder:
+                    self.canvas.recorder.end_stroke()
+                self.loop_save['pixels_drawn'] = []
+                self.loop_save['changed'] = set()
+                self.loop_save['pixel_history'] = []
+                self.loop_save['pixels_tobe_coloured'] = []
+
+    @timed('tool.pencil')
+    def pencil_polyline(self, alpha, col, layer, motion: list[tuple[int, int]], pixel) -> None:
+        """draws a pencil stroke through every position the mouse moved through this frame, as one batch
+        (so fast strokes don't skip pixels and no gaps need fixing afterwards)"""
+        points = [self.loop_save['pixel_history'][-1][0]] if self.loop_save['pixel_history'] else []
+        for point in motion:
+            if not points or point != points[-1]:
+                points.append(point)
+        self.loop_save['pixel_history'].append((points[-1], pixel))
+
+        to_colour = []
+        for pix in self.canvas.get_polyline(points, self.screen, layer):
+            pix_to_colour, _ = self.tool.onclick(pix, self.canvas, self.screen, layer, pix.position,
+                                                 self.canvas.layout.radius, col, alpha)
+            to_colour.extend(pix_to_colour)
+        self.loop_save['pixels_tobe_coloured'] = to_colour
+
+        drawn_before = len(self.loop_save['pixels_drawn'])
+        for pix, rgba in to_colour:
+            if pix.drawn and self.tool.enforce_draw_once:
+                continue
+            pix.set_drawn(self.tool.enforce_draw_once)
+            self.loop_save['pixels_drawn'].append(pix)
+            self.loop_save['changed'].add(self.canvas.cell_index(pix.coord))
+            pix.recolour(rgba[:3], rgba[3] * self.tool.hardness, self.tool.overwrite)
+            self.canvas.mark_dirty({self.canvas.cell_index(pix.coord)}, layer)
+        PROFILER.count('recoloured', len(self.loop_save['pixels_drawn']) - drawn_before)
+
+    @timed('tool.colour')
+    def colouring_logistics(self, alpha, col, just_finished_drawing: bool) -> None:
+        """handles actually configuring the drawings onto the canvas when you're done drawing"""
+        num_pixels_coloured = 0  # haven't used this variable in any meaningful way yet
+
+        if self.tool.type in RECOLOUR_TOOLS and 'pixels_tobe_coloured' in self.loop_save:  # if this tool type recolours pixels
+            for pix, rgba in self.loop_save['pixels_tobe_coloured']:
+                if pix.coloured and self.tool.enforce_draw_once:
+                    continue
+                pix.recolour(rgba[:3], rgba[3], self.tool.overwrite)
+                pix.coloured = False
+                self.loop_save['changed'].add(self.canvas.cell_index(pix.coord))
+                self.canvas.mark_dirty({self.canvas.cell_index(pix.coord)})
+                num_pixels_coloured += 1
+            self.loop_save['pixels_tobe_coloured'] = []
+        old_num_pixels_coloured = num_pixels_coloured
+        PROFILER.count('recoloured', num_pixels_coloured)
+        num_pixels_coloured += len(self.loop_save['pixels_drawn'])  # account for ones that were drawn in drawing mode! (e.g. pencil)
+        self.loop_save['pixel_history'] = []
+        if just_finished_drawing and num_pixels_coloured > 0:
+            log.debug("drawing phase has drawn %d pixels: %d were drawn from the drawing mode and %d were drawn from "
+                      "the colouring mode", num_pixels_coloured, len(self.loop_save['pixels_drawn']),
+                      old_num_pixels_coloured)
+            # used to be in canv.drawing_mode, but it caused problems since some tools
+            # only recolour pixels to canvas after the event calls (in which drawing_mode is called)
+            self.canvas.commit(self.tool.type, self.loop_save['changed'], self.loop_save.get('layer'))
+        if just_finished_drawing and self.canvas.recorder:
+            self.canvas.recorder.end_stroke()
+        if just_finished_drawing or self.loop_save['pixels_drawn']:
+            self.canvas.end_operation()
+        self.loop_save['pixels_drawn'] = []
+        self.loop_save['changed'] = set()
@@ -3,14 +3,16 @@ from __future__ import annotations
 from src.aux_code.history_system import HistoryEntry
 from src.aux_code.canvas_system import HexCanvas, ToolBelt
 import src.aux_code.UI_elements as UI_elements
-from src.aux_code.pygame_configure import pygame, math, draw_hex_border, initialize_pygame_window
+from src.aux_code.pygame_configure import pygame, draw_hex_border, initialize_pygame_window, draw_text
 from src.aux_code.extra_functions import rgb_to_hsv
 from src.aux_code.constants import TOOLS, TOOL_CONTROLS, DECIMAL_SLIDERS, COLOUR_UI
+from src.aux_code.profiler import Profiler
 
 
 class UI:
     """the user interface"""
     background: str
+    background_image: pygame.Surface
     border_cols: tuple[tuple[int, int, int], tuple[int, int, int]]
     canvas: HexCanvas
     screen: pygame.Surface
@@ -18,17 +20,28 @@ class UI:
     elements: dict[str, UI_elements.UIelement]
     click_mode: bool
     clicking: UI_elements.UIelement | None
+    panning: bool  # whether the canvas is being dragged around
+    show_profile: bool  # whether the performance overlay is showing
+    profile_font: pygame.font.Font | None  # the overlays' font (loaded the first time one is shown)
+    show_timeline: bool  # whether the history timeline is showing
+    scrubbing: bool  # whether the history timeline is being dragged along
 
     def __init__(self, screen_size: tuple[int, int], canv_size: tuple[int, int]) -> None:
         self.background = "resources/images/checker_bg.png"
+        self.background_image = pygame.image.load(self.background)
         self.border_cols = ((50, 50, 50), (90, 90, 90))
         self.screen = initialize_pygame_window(screen_size[0], screen_size[1])
         self.canvas = HexCanvas(canv_size)
         self.tool = ToolBelt()
         self.canvas.position_pixels(self.screen)
-        self.canvas.history.past.append(HistoryEntry(self.canvas, 'NEW'))
+        self.canvas.history.override(HistoryEntry(self.canvas, 'NEW'))
         self.click_mode = False
         self.clicking = None
+        self.panning = False
+        self.show_profile = False
+        self.profile_font = None
+        self.show_timeline = False
+        self.scrubbing = False
 
         # element generation (note how the key names are the same as the etype
         slider_size = (20, 250)
@@ -103,18 +116,8 @@ class UI:
         """refreshes the UI"""
         if not only_elements:
             # set up background image
-            # crop_rect = pygame.Rect(0, 0, 2000, 1000)  # (x, y, width, height)
-            editor_bg = pygame.image.load(self.background)  # .subsurface(crop_rect)
-            self.screen.blit(editor_bg, (0, 0))
-            # set up canvas border
-            pix_ref = self.canvas.layers[0][0][0]
-            pix_ref2 = self.canvas.layers[0][-1][-1]
-            if self.canvas.show_border:
-                widths = (100, 200)
-                for i in range(2):
-                    draw_hex_border(screen=self.screen, start_pos=pix_ref.position, start_pos2=pix_ref2.position,
-                                                     line_thick=self.screen.get_width() // widths[i], colour=self.border_cols[i],
-                                                     rows=self.canvas.height, cols=self.canvas.width, radius=pix_ref.size)
+            self.screen.blit(self.background_image, (0, 0))
+            self.draw_border()
 
         for e in self.elements:
             if isinstance(e, UI_elements.Button):
@@ -123,14 +126,152 @@ class UI:
                 image_choice = 0
             self.elements[e].draw(self.screen, image_to_use=image_choice)
 
-    def not_on_canvas(self, mouse_x: float, mouse_y: float) -> bool:
-        """returns whether the mouse is currently on hovering the canvas"""
+    def border_area(self) -> pygame.Rect:
+        """the area of the screen the canvas and its border can cover (the view, with room for the border around it)"""
+        width = self.screen.get_width() // 100 * 4
+        return self.canvas.layout.view.inflate(width, width).clip(self.screen.get_rect())
+
+    def draw_border(self) -> None:
+        """draws the canvas border (the part of it around the view)"""
+        if not self.canvas.show_border:
+            return
+        widths = (100, 200)
         pix_ref = self.canvas.layers[0][0][0]
-        x_in_scope = (pix_ref.position[0] - pix_ref.size * 2 < mouse_x < pix_ref.position[0] +
-                      self.canvas.width * pix_ref.size * math.sqrt(3 / 4) * 2)
-        y_in_scope = (pix_ref.position[1] - pix_ref.size * 2 < mouse_y < pix_ref.position[1] +
-                      self.canvas.height * pix_ref.size * 3 / 2)
-        return not (x_in_scope and y_in_scope)
+        pix_ref2 = self.canvas.layers[0][-1][-1]
+        clip = self.screen.get_clip()
+        self.screen.set_clip(clip.clip(self.border_area()))
+        for i in range(2):
+            draw_hex_border(screen=self.screen, start_pos=pix_ref.position, start_pos2=pix_ref2.position,
+                            line_thick=self.screen.get_width() // widths[i], colour=self.border_cols[i],
+                            rows=self.canvas.height, cols=self.canvas.width, radius=pix_ref.size)
+        self.screen.set_clip(clip)
+
+    def refresh_canvas_area(self) -> None:
+        """redraws the background and border of the view (after the canvas was zoomed or panned)
+        the canvas itself gets redrawn on the next redraw, and a running recording records where it is now"""
+        area = self.border_area()
+        self.screen.blit(self.background_image, area.topleft, area)
+        self.draw_border()
+        self.canvas.needs_redraw = True
+        if self.canvas.recorder:
+            self.canvas.recorder.view()
+
+    def zoom(self, factor: float, x: float, y: float) -> None:
+        """zoom the canvas in (factor > 1) or out (factor < 1), keeping the cell under (x, y) where it is"""
+        self.canvas.layout.zoom_at(factor, (x, y))
+        self.refresh_canvas_area()
+
+    def pan(self, dx: float, dy: float) -> None:
+        """move the canvas by (dx, dy) screen pixels"""
+        self.canvas.layout.pan(dx, dy)
+        self.refresh_canvas_area()
+
+    def reset_view(self) -> None:
+        """zoom back out so the whole canvas fits the view"""
+        self.canvas.position_pixels(self.screen)
+        self.refresh_canvas_area()
+
+    def draw_status(self, text: str) -> None:
+        """shows a short status message (e.g. save progress) in the bottom left corner of the window"""
+        font_size = 20
+        area = pygame.Rect(0, self.screen.get_height() - font_size * 2, self.screen.get_width() // 4, font_size * 2)
+        self.screen.blit(self.background_image, area.topleft, area)
+        if text:
+            draw_text(self.screen, (area.x + 10, area.y + font_size // 2), text, font_size=font_size)
+
+    def profile_area(self) -> pygame.Rect:
+        """the area of the screen the performance overlay covers (the top right corner)"""
+        return pygame.Rect(self.screen.get_width() - 260, 0, 260, 150)
+
+    def toggle_profile(self) -> None:
+        """show or hide the performance overlay (hiding it redraws what was under it)"""
+        self.show_profile = not self.show_profile
+        if not self.show_profile:
+            self.refresh_ui()
+            self.canvas.dirty = None  # every cell, without recompositing them
+            self.canvas.needs_redraw = True
+
+    def draw_profile(self, profiler: Profiler) -> None:
+        """draws the performance overlay: a graph of the last frame times (the line is 60 fps), the frame time
+        percentiles, the average time of each phase of a frame, and how many cells frames recolour and redraw"""
+        area = self.profile_area()
+        self.screen.fill((20, 20, 20), area)
+        font = self.overlay_font()
+
+        graph = pygame.Rect(area.x + 5, area.bottom - 45, area.w - 10, 40)
+        scale = graph.h / 50  # pixels per millisecond (the graph tops out at 50ms)
+        frames = list(profiler.frames)[-graph.w // 2:]
+        for i, frame in enumerate(frames):
+            height = min(graph.h, max(1, round(frame.total * scale)))
+            colour = (90, 200, 90) if frame.total <= 1000 / 60 else (230, 170, 40) if frame.total <= 50 else (230, 60, 60)
+            self.screen.fill(colour, (graph.x + 2 * i, graph.bottom - height, 2, height))
+        pygame.draw.line(self.screen, (120, 120, 120), (graph.x, graph.bottom - 1000 / 60 * scale),
+                         (graph.right, graph.bottom - 1000 / 60 * scale))
+
+        summary = profiler.summary()
+        if summary['frames']:
+            frame_ms, counters = summary['frame_ms'], summary['counters']
+            phases = sorted(summary['phase_ms'].items(), key=lambda item: -item[1])
+            lines = [f"frame {frame_ms['p50']:.1f}ms  p95 {frame_ms['p95']:.1f}  max {frame_ms['max']:.1f}",
+                     '  '.join(f'{phase} {ms:.1f}' for phase, ms in phases[:3]),
+                     '  '.join(f'{phase} {ms:.1f}' for phase, ms in phases[3:6]),
+                     f"recoloured {counters.get('recoloured', 0):.0f}  redrawn {counters.get('redrawn', 0):.0f} /frame"]
+            for i, line in enumerate(lines):
+                self.screen.blit(font.render(line, True, (230, 230, 230)), (area.x + 5, area.y + 5 + 20 * i))
+
+    def overlay_font(self) -> pygame.font.Font:
+        """the font of the overlays (the performance overlay and the history timeline)"""
+        if self.profile_font is None:
+            pygame.font.init()
+            self.profile_font = pygame.font.Font('resources/fonts/Squarewave-Bold.ttf', 14)
+        return self.profile_font
+
+    def timeline_area(self) -> pygame.Rect:
+        """the area of the screen the history timeline covers (along the bottom, right of the status message)"""
+        left = self.screen.get_width() // 4 + 10
+        return pygame.Rect(left, self.screen.get_height() - 34, self.screen.get_width() - left - 10, 28)
+
+    def timeline_bar(self) -> pygame.Rect:
+        """the part of the history timeline the points in history are spread along"""
+        area = self.timeline_area()
+        return pygame.Rect(area.x + 5, area.y + 5, area.w - 160, area.h - 10)
+
+    def toggle_timeline(self) -> None:
+        """show or hide the history timeline (hiding it redraws what was under it)"""
+        self.show_timeline = not self.show_timeline
+        self.scrubbing = False
+        if not self.show_timeline:
+            self.refresh_ui()
+            self.canvas.dirty = None  # every cell, without recompositing them
+            self.canvas.needs_redraw = True
+
+    def draw_timeline(self) -> None:
+        """draws the history timeline: a bar filled up to the point history is at (the rest was undone),
+        with a notch at every keyframe, and the action that got the canvas to that point"""
+        history = self.canvas.history
+        area, bar = self.timeline_area(), self.timeline_bar()
+        last = max(1, len(history) - 1)
+        at = bar.x + round(history.position / last * bar.w)
+        self.screen.fill((20, 20, 20), area)
+        self.screen.fill((60, 60, 60), bar)
+        self.screen.fill((90, 150, 220), (bar.x, bar.y, at - bar.x, bar.h))
+        for i, entry in enumerate(history.entries):
+            if entry.keyframe:
+                x = bar.x + round(i / last * bar.w)
+                pygame.draw.line(self.screen, (230, 230, 230), (x, bar.y), (x, bar.y + bar.h // 3))
+        pygame.draw.line(self.screen, (255, 255, 255), (at, area.y + 2), (at, area.bottom - 3), 3)
+        text = f'{history.position + 1}/{len(history)} {history.get_history_point().action}'
+        self.screen.blit(self.overlay_font().render(text, True, (230, 230, 230)), (bar.right + 10, area.y + 7))
+
+    def scrub_timeline(self, x: float) -> None:
+        """jump to the point in history under x on the history timeline"""
+        bar = self.timeline_bar()
+        self.canvas.jump(self.screen, round((x - bar.x) / bar.w * (len(self.canvas.history) - 1)))
+
+    def not_on_canvas(self, mouse_x: float, mouse_y: float) -> bool:
+        """returns whether the mouse is not hovering the canvas (or just around the part of it in the view)"""
+        layout = self.canvas.layout
+        return not self.canvas.on_canvas(mouse_x, mouse_y, self.screen, margin=layout.radius / layout.zoom * 2)
 
     def during_click_mode(self, x: int, y: int) -> None:
         """what happens when you are clicking (dragging or whatnot) and element"""
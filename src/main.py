@@ -2,12 +2,17 @@
 from __future__ import annotations
 
 import random
+import time
 
 from aux_code.ui import UI
 from aux_code.history_system import HistoryEntry
-from aux_code.pygame_configure import pygame, draw_hexagon
+from aux_code.pygame_configure import pygame
 from aux_code.event_handling import event_handler
-from aux_code.constants import SCREEN_SIZES, RECOLOUR_TOOLS, CLICK_TOOLS, LINE_TOOLS
+from aux_code.stroke_system import StrokeHandler
+from aux_code.constants import SCREEN_SIZES, MEMORY_CHECK_SECONDS
+from src.aux_code.profiler import PROFILER  # (the same module the rest of aux_code reports to)
+from src.aux_code.memory import memory_report, memory_warning
+from src.aux_code.log import get_logger
 import sys
 
 
@@ -16,160 +21,137 @@ class Program:
     ui: UI
     layer: int
     running: bool
-    loop_save: dict
+    strokes: StrokeHandler
     just_finished_drawing: bool
     just_started_drawing: bool
     just_loaded: bool
+    motion: list[tuple[int, int]]  # every position the mouse moved through since the stroke last handled it
+    history_length: int  # the length of history when memory was last checked
+    memory_checked: float  # when memory was last checked (on the time.monotonic clock)
     file_name: str | None
+    status: str
 
-    def __init__(self, size: tuple[int, int] = (650, 650), canv_size: tuple[int, int] = (65, 65)):
+    def __init__(self, size: tuple[int, int] = (650, 650), canv_size: tuple[int, int] = (65, 65), start: bool = True):
         sys.setrecursionlimit(size[0] * size[1])
 
         self.ui = UI(screen_size=size, canv_size=canv_size)
         self.layer = 0
         self.file_name = None
+        self.status = ''
+
+        # pick up where an interrupted session left off, then keep a journal of this one
+        self.ui.canvas.open_journal()
 
         # refresh ui to make everything appear for the first time
         self.ui.refresh_ui()
 
         # loop savers
         self.running = True
-        self.loop_save = {'pixel_history': [], 'pixels_tobe_coloured': [], 'pixels_drawn': []}
+        self.strokes = StrokeHandler(self.ui.canvas, self.ui.tool, self.ui.screen)
         self.just_finished_drawing = self.just_started_drawing = self.just_loaded = False
+        self.motion = []
+        self.history_length = len(self.ui.canvas.history)
+        self.memory_checked = time.monotonic()
 
-        # start program
-        self.run_program()
+        # start program (unless whoever made it is driving the frames, see run_frame)
+        if start:
+            self.run_program()
 
-        # exit program
-        pygame.quit()
+            # exit program
+            pygame.quit()
 
     def run_program(self):
         """the main game loop"""
         while self.running:
-            x, y = pygame.mouse.get_pos()
-            # handle events
-            for event in pygame.event.get():
-                self.just_finished_drawing, self.just_started_drawing, self.just_loaded, self.running = (
-                    event_handler(event, self.ui, x, y, self.just_finished_drawing, self.just_started_drawing, self.just_loaded,
-                                  self.layer, self.running, self.file_name, self.loop_save)
-                )
-            if self.ui.click_mode:
-                self.ui.during_click_mode(x, y)
-
-            # pick colour for drawing
-            if self.ui.tool.rainbow_mode:
-                self.colour = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
-                self.ui.update_colour_ui(self.colour, self.ui.tool.alpha)
-                self.ui.tool.colour = self.colour
-                col = self.colour
-            else:
-                col = self.ui.tool.colour if self.ui.tool.using_main else self.ui.tool.colour2
-            alpha = self.ui.tool.alpha if self.ui.tool.using_main else self.ui.tool.alpha2
-
-            # drawing
-            if self.ui.canvas.drawing:
-                self.drawing_logistics(alpha, col, x, y, self.layer)
-            else:
-                self.colouring_logistics(alpha, col)
-
-            # redraw
-            if self.ui.canvas.needs_redraw:
-                if self.just_loaded:
-                    self.ui.canvas.redraw_canv(self.ui.screen, force_config=True)
-                else:
-                    self.ui.canvas.redraw_canv(self.ui.screen, force_config=False)
-
-            # fix history
-            if self.just_loaded and len(self.ui.canvas.history) < 1:
-                self.ui.canvas.history.past.append(HistoryEntry(self.ui.canvas, 'LOAD'))
-
-            # reset loop variants
-            self.just_finished_drawing = False
-            self.just_loaded = False
-
-            pygame.display.flip()
-
-    def drawing_logistics(self, alpha, col, x, y, layer) -> None:
-        """handles drawing stuff"""
+            self.run_frame(pygame.mouse.get_pos(), pygame.event.get())
+        self.stop()
+
+    def run_frame(self, mouse: tuple[int, int], events: list[pygame.event.Event]) -> None:
+        """one pass of the main loop: handle the events, draw, and show the result
+        (mouse is where the mouse is this frame)"""
+        x, y = mouse
+        PROFILER.begin_frame()
+        # handle events
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:  # strokes start where pressed
+                self.motion = [event.pos]
+            elif event.type == pygame.MOUSEMOTION:
+                self.motion.append(event.pos)
+            self.just_finished_drawing, self.just_started_drawing, self.just_loaded, self.running, self.layer = (
+                event_handler(event, self.ui, x, y, self.just_finished_drawing, self.just_started_drawing, self.just_loaded,
+                              self.layer, self.running, self.file_name, self.strokes.loop_save)
+            )
+        if self.ui.click_mode:
+            self.ui.during_click_mode(x, y)
+        PROFILER.lap('events')
+
+        # pick colour for drawing
+        if self.ui.tool.rainbow_mode:
+            self.colour = (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+            self.ui.update_colour_ui(self.colour, self.ui.tool.alpha)
+            self.ui.tool.colour = self.colour
+            col = self.colour
+        else:
+            col = self.ui.tool.colour if self.ui.tool.using_main else self.ui.tool.colour2
+        alpha = self.ui.tool.alpha if self.ui.tool.using_main else self.ui.tool.alpha2
+
+        # drawing
         if self.ui.canvas.drawing:
             if self.just_started_drawing:
                 self.just_started_drawing = False
-                return
-            pixel = self.ui.canvas.pos_gets_pixel(layer, x, y, self.ui.screen)
-            if pixel and pixel.drawn and self.ui.tool.enforce_draw_once:
-                return
-            self.loop_save['pixel_history'].append(((x, y), pixel))
-            fix_pixels = []
-            # print(len(self.loop_save['pixel_history']))
-
-            # fixing line skidding (drawing lines between two points in free drawing when moving too fast)
-            if self.ui.tool.type in {'PENCIL'} and len(self.loop_save['pixel_history']) > 1:
-                pix1, pix2 = self.loop_save['pixel_history'][-2], self.loop_save['pixel_history'][-1]
-                # print(len(self.loop_save['pixel_history']))
-                if pix1[1] is None or pix2[1] is None or pix1[1] not in pix2[1].adj:
-                    fix_pixels = list(
-                        self.ui.canvas.get_line(pix1[0], pix2[0], self.ui.canvas.layers[layer][0][0].size, self.ui.screen,
-                                                layer, col, alpha, self.ui.tool.overwrite, False))
-            # applying the tool action
-            if pixel or (self.ui.tool.type in LINE_TOOLS and len(self.ui.tool.positions) > 0):
-                pix_to_colour, temporary = self.ui.tool.onclick(pixel, self.ui.canvas, self.ui.screen, layer, (x, y),
-                                                                self.ui.canvas.layers[layer][0][0].size, col, alpha)
-                self.loop_save['pixels_tobe_coloured'] = pix_to_colour + fix_pixels
-                # print(f"pix to colour {len(pix_to_colour)}")
-                # print(f"pix + fix to colour {len(self.loop_save['pixels_tobe_coloured'])}")
-
-                if self.ui.tool.type in RECOLOUR_TOOLS and not temporary:  # if this tool is one that recolours pixels
-                    for pix, rgba in self.loop_save['pixels_tobe_coloured']:
-                        if pix.drawn and self.ui.tool.enforce_draw_once:
-                            # this is for pixels drawn because of fix pixels, so they weren't skipped in the first place
-                            continue
-                        pix.set_drawn(self.ui.tool.enforce_draw_once)
-                        self.loop_save['pixels_drawn'].append(pix)
-                        pix.recolour(rgba[:3], rgba[3] * self.ui.tool.hardness, self.ui.tool.overwrite)
-                        actual_drawn = self.ui.canvas.layers[-1][pix.coord[1]][pix.coord[0]]
-                        draw_hexagon(self.ui.screen, actual_drawn.rgb + (actual_drawn.alpha,),
-                                     actual_drawn.position, actual_drawn.size)
-
-            # disable drawing mode for click tools (e.g. bucket)
-            if self.ui.tool.type in CLICK_TOOLS:
-                self.ui.canvas.drawing_mode(False, self.ui.tool)
-                for pix in self.loop_save['pixels_drawn']:
-                    pix.coloured = False
-                    pix.drawn = False
-                if len(self.loop_save['pixels_drawn']) > 0:
-                    self.ui.canvas.history.override(HistoryEntry(self.ui.canvas, self.ui.tool.type, len(self.loop_save['pixels_drawn'])))
-                # self.ui.canvas.history.override(HistoryEntry(self.ui.canvas, self.ui.tool.type))  # fixes an undo/redo related bug
-                self.loop_save['pixels_drawn'] = []
-                self.loop_save['pixel_history'] = []
-                self.loop_save['pixels_tobe_coloured'] = []
-
-    def colouring_logistics(self, alpha, col):
-        """handles actually configuring the drawings onto the canvas when you're done drawing"""
-        num_pixels_coloured = 0  # haven't used this variable in any meaningful way yet
-
-        if self.ui.tool.type in RECOLOUR_TOOLS and 'pixels_tobe_coloured' in self.loop_save:  # if this tool type recolours pixels
-            for pix, rgba in self.loop_save['pixels_tobe_coloured']:
-                if pix.coloured and self.ui.tool.enforce_draw_once:
-                    continue
-                pix.recolour(rgba[:3], rgba[3], self.ui.tool.overwrite)
-                pix.coloured = False
-                actual_drawn = self.ui.canvas.layers[-1][pix.coord[1]][pix.coord[0]]
-                draw_hexagon(self.ui.screen, actual_drawn.rgb + (actual_drawn.alpha,),
-                             actual_drawn.position, actual_drawn.size)
-                num_pixels_coloured += 1
-            self.loop_save['pixels_tobe_coloured'] = []
-        old_num_pixels_coloured = num_pixels_coloured
-        num_pixels_coloured += len(self.loop_save['pixels_drawn'])  # account for ones that were drawn in drawing mode! (e.g. pencil)
-        self.loop_save['pixel_history'] = []
-        if self.just_finished_drawing and num_pixels_coloured > 0:
-            print("drawing phase has drawn " + str(num_pixels_coloured) + " pixels: " + str(len(self.loop_save['pixels_drawn'])) + " were drawn from the drawing mode and " + str(old_num_pixels_coloured) + " were drawn from the colouring mode")
-            # used to be in canv.drawing_mode, but it caused problems since some tools
-            # only recolour pixels to canvas after the event calls (in which drawing_mode is called)
-            self.ui.canvas.history.override(HistoryEntry(self.ui.canvas, self.ui.tool.type, num_pixels_coloured))
-        for pix in self.loop_save['pixels_drawn']:
-            pix.coloured = False
-            pix.drawn = False
-        self.loop_save['pixels_drawn'] = []
+            else:
+                self.strokes.drawing_logistics(alpha, col, x, y, self.layer, self.motion)
+                self.motion = []
+        else:
+            self.strokes.colouring_logistics(alpha, col, self.just_finished_drawing)
+            self.motion = []
+        PROFILER.lap('tool')
+
+        # redraw
+        if self.ui.canvas.needs_redraw:
+            if self.just_loaded:
+                self.ui.canvas.redraw_canv(self.ui.screen, force_config=True)
+            else:
+                self.ui.canvas.redraw_canv(self.ui.screen, force_config=False)
+        PROFILER.lap('redraw')
+
+        # fix history
+        if self.just_loaded and len(self.ui.canvas.history) < 1:
+            self.ui.canvas.history.override(HistoryEntry(self.ui.canvas, 'LOAD'))
+        # warn when history grows past the memory limit (checked when it grew or shrank, at most every few seconds)
+        if (len(self.ui.canvas.history) != self.history_length and
+                time.monotonic() - self.memory_checked >= MEMORY_CHECK_SECONDS):
+            self.history_length = len(self.ui.canvas.history)
+            self.memory_checked = time.monotonic()
+            warning = memory_warning(memory_report(self.ui.canvas, self.ui))
+            if warning:
+                get_logger('perf').warning(warning)
+        PROFILER.lap('history')
+
+        # show how a background save is going (only redrawn when the message changes)
+        saver = self.ui.canvas.saver
+        status = f'{saver.status} {round(saver.progress * 100)}%' if saver.busy else saver.status
+        if status != self.status or self.just_loaded:
+            self.ui.draw_status(status)
+            self.status = status
+        if self.ui.show_profile:
+            self.ui.draw_profile(PROFILER)
+        if self.ui.show_timeline:
+            self.ui.draw_timeline()
+        PROFILER.lap('ui')
+
+        # reset loop variants
+        self.just_finished_drawing = False
+        self.just_loaded = False
+
+        pygame.display.flip()
+        PROFILER.lap('flip')
+        PROFILER.end_frame()
+
+    def stop(self) -> None:
+        """finish what the canvas is writing to disk"""
+        self.ui.canvas.saver.wait()  # don't quit halfway through writing a save
+        self.ui.canvas.close_journal()
 
 
 def main(n: int = 17, size=(48, 48)) -> None:
@@ -0,0 +1,338 @@
+"""microbenchmarks of the core engines, run without a window
+
+Every benchmark is timed at a few canvas sizes (and the save file benchmarks on every bundled save file). Each run
+gets a fresh setup that isn't timed, and the results (with the machine and library versions they were measured on)
+are written as JSON, so two runs can be compared: --compare prints how much slower or faster each benchmark got.
+
+Usage:
+    python -m src.test.benchmarks [--sizes 48,256,1000] [--only name,...] [--repeat N] [--out <json file>]
+        [--compare <earlier json file>]
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+
+from src.aux_code.canvas_system import HexCanvas, ToolBelt
+from src.aux_code.history_system import HistoryEntry
+from src.aux_code.extra_functions import colour_add
+from src.aux_code.save_and_load import compress_writing, uncompress, read_file
+from src.aux_code.pygame_configure import pygame
+
+SCREEN_SIZE = (1600, 900)
+SIZES = (48, 256, 1000)  # canvas widths and heights benchmarked (when none are given)
+REPEAT = 5  # timed runs of every benchmark (when not given)
+SAVE_FILES = os.path.join(os.path.dirname(__file__), '..', 'resources', 'save_files')
+
+# name -> (setup taking a canvas size and returning the state a run needs, the timed run, biggest size it's run at)
+BENCHMARKS: dict[str, tuple[Callable[[int], Any], Callable[[Any], None], int | None]] = {}
+# name -> (setup taking a save file path, the timed run)
+FILE_BENCHMARKS: dict[str, tuple[Callable[[str], Any], Callable[[Any], None]]] = {}
+
+
+def benchmark(name: str, setup: Callable[[int], Any], max_size: int | None = None):
+    """registers the decorated function as the timed run of a benchmark
+    (max_size is for benchmarks that would take far too long on big canvases)"""
+    def register(run: Callable[[Any], None]) -> Callable[[Any], None]:
+        BENCHMARKS[name] = (setup, run, max_size)
+        return run
+    return register
+
+
+def file_benchmark(name: str, setup: Callable[[str], Any]):
+    """registers the decorated function as the timed run of a save file benchmark"""
+    def register(run: Callable[[Any], None]) -> Callable[[Any], None]:
+        FILE_BENCHMARKS[name] = (setup, run)
+        return run
+    return register
+
+
+def new_canvas(size: int) -> tuple[HexCanvas, pygame.Surface]:
+    """a size x size canvas laid out on an off screen surface, drawn once"""
+    screen = pygame.Surface(SCREEN_SIZE)
+    canvas = HexCanvas((size, size))
+    canvas.position_pixels(screen)
+    canvas.history.override(HistoryEntry(canvas, 'NEW'))
+    canvas.redraw_canv(screen, force_config=True)
+    return canvas, screen
+
+
+def painted_canvas(size: int) -> tuple[HexCanvas, pygame.Surface]:
+    """a canvas with a few strokes on it (so fills and snapshots have something other than blank tiles)"""
+    canvas, screen = new_canvas(size)
+    rng = random.Random(size)
+    for _ in range(8):
+        y, colour = rng.randrange(size), (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        for x in range(size):
+            canvas.layers[0][y][x].recolour(colour, 1.0, True)
+    canvas.mark_dirty(None)
+    canvas.redraw_canv(screen)
+    return canvas, screen
+
+
+def bucket_setup(globally: bool = False, spiral: int = 0) -> Callable[[int], Any]:
+    """setup for a bucket fill from the middle of a blank canvas"""
+    def setup(size: int) -> tuple:
+        canvas, screen = new_canvas(size)
+        tool = ToolBelt()
+        tool.type, tool.globally, tool.spiral, tool.colour = 'BUCKET', globally, spiral, (200, 30, 30)
+        return canvas, screen, tool, canvas.layers[0][size // 2][size // 2]
+    return setup
+
+
+@benchmark('construct', setup=lambda size: size)
+def run_construct(size: int) -> None:
+    """making a canvas and laying it out"""
+    HexCanvas((size, size)).position_pixels(pygame.Surface(SCREEN_SIZE))
+
+
+@benchmark('history_snapshot', setup=painted_canvas)
+def run_history_snapshot(state: tuple) -> None:
+    """snapshotting the canvas into a history entry"""
+    HistoryEntry(state[0], 'BENCH')
+
+
+def undo_setup(size: int) -> tuple:
+    """a canvas with one committed stroke to undo and redo"""
+    canvas, screen = painted_canvas(size)
+    changed = set()
+    for x in range(size):
+        canvas.layers[0][size // 3][x].recolour((10, 200, 10), 1.0, True)
+        changed.add(canvas.cell_index((x, size // 3)))
+    canvas.mark_dirty(changed, 0)
+    canvas.commit('PENCIL', changed)
+    return canvas, screen
+
+
+@benchmark('undo_redo', setup=undo_setup)
+def run_undo_redo(state: tuple) -> None:
+    """undoing a stroke, redrawing, redoing it and redrawing"""
+    canvas, screen = state
+    canvas.undo(screen)
+    canvas.redraw_canv(screen)
+    canvas.redo(screen)
+    canvas.redraw_canv(screen)
+
+
+def jump_setup(size: int) -> tuple:
+    """a canvas with 240 committed strokes (a row each) to jump back and forth through (most of them compressed)"""
+    canvas, screen = painted_canvas(size)
+    rng = random.Random(size)
+    for _ in range(240):
+        y, colour = rng.randrange(size), (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        changed = set()
+        for x in range(size):
+            canvas.layers[0][y][x].recolour(colour, 1.0, True)
+            changed.add(canvas.cell_index((x, y)))
+        canvas.commit('PENCIL', changed)
+    canvas.history.wait()
+    canvas.history.store.wait()  # (so compressing older points doesn't run during the timing)
+    canvas.mark_dirty(None)
+    canvas.redraw_canv(screen)
+    return canvas, screen
+
+
+@benchmark('history_jump', setup=jump_setup)
+def run_history_jump(state: tuple) -> None:
+    """jumping 200 points back in history, redrawing, jumping back to the end and redrawing"""
+    canvas, screen = state
+    canvas.jump(screen, len(canvas.history) - 201)
+    canvas.redraw_canv(screen)
+    canvas.jump(screen, len(canvas.history) - 1)
+    canvas.redraw_canv(screen)
+
+
+@benchmark('bucket_local', setup=bucket_setup(), max_size=256)
+def run_bucket(state: tuple) -> None:
+    """a bucket fill (of the whole blank canvas, from its middle)"""
+    canvas, screen, tool, pixel = state
+    tool.onclick(pixel, canvas, screen, 0, pixel.position, pixel.size, None, None)
+
+
+benchmark('bucket_global', setup=bucket_setup(globally=True), max_size=256)(run_bucket)
+benchmark('bucket_spiral', setup=bucket_setup(spiral=3), max_size=64)(run_bucket)
+
+
+@benchmark('get_line', setup=new_canvas)
+def run_get_line(state: tuple) -> None:
+    """the pixels of a line across the canvas, corner to corner"""
+    canvas, screen = state
+    start, end = canvas.layers[0][0][0].position, canvas.layers[0][-1][-1].position
+    canvas.get_line(start, end, canvas.layout.radius, screen, 0, (0, 0, 0), 1.0, False)
+
+
+def pick_setup(size: int) -> tuple:
+    """a canvas and 1000 random screen positions over it"""
+    canvas, screen = new_canvas(size)
+    rng = random.Random(0)
+    rect = canvas.renderer.rect
+    points = [(rng.randrange(rect.left, rect.right), rng.randrange(rect.top, rect.bottom)) for _ in range(1000)]
+    return canvas, screen, points
+
+
+@benchmark('pos_gets_pixel_x1000', setup=pick_setup)
+def run_pos_gets_pixel(state: tuple) -> None:
+    """finding the pixel under 1000 screen positions"""
+    canvas, screen, points = state
+    for x, y in points:
+        canvas.pos_gets_pixel(0, x, y, screen)
+
+
+@benchmark('redraw_full', setup=painted_canvas)
+def run_redraw_full(state: tuple) -> None:
+    """redrawing every cell"""
+    canvas, screen = state
+    canvas.needs_redraw = True
+    canvas.redraw_canv(screen, force_config=True)
+
+
+def dirty_setup(size: int) -> tuple:
+    """a canvas with 50 cells recoloured since it was last drawn"""
+    canvas, screen = painted_canvas(size)
+    rng = random.Random(1)
+    for _ in range(50):
+        x, y = rng.randrange(size), rng.randrange(size)
+        canvas.layers[0][y][x].recolour((0, 0, 255), 0.5)
+        canvas.mark_dirty({canvas.cell_index((x, y))}, 0)
+    return canvas, screen
+
+
+@benchmark('redraw_dirty_50', setup=dirty_setup)
+def run_redraw_dirty(state: tuple) -> None:
+    """redrawing the cells that changed since the last redraw"""
+    canvas, screen = state
+    canvas.redraw_canv(screen)
+
+
+@benchmark('compress_writing', setup=lambda size: painted_canvas(size)[0].snapshot())
+def run_compress_writing(snapshot: list) -> None:
+    """encoding a snapshot in the save format"""
+    compress_writing(snapshot)
+
+
+@benchmark('uncompress', setup=lambda size: compress_writing(painted_canvas(size)[0].snapshot()))
+def run_uncompress(contents: str) -> None:
+    """decoding the save format"""
+    uncompress(contents)
+
+
+@benchmark('colour_add_x10000', setup=lambda size: [((i % 256, 40, 90), ((7 * i) % 256, 200, 3), (i % 100) / 100,
+                                                        ((3 * i) % 100) / 100) for i in range(10000)])
+def run_colour_add(colours: list) -> None:
+    """mixing 10000 pairs of colours (this doesn't depend on the canvas size)"""
+    for rgb1, rgb2, alpha1, alpha2 in colours:
+        colour_add(rgb1, rgb2, alpha1, alpha2)
+
+
+@file_benchmark('file_read', setup=lambda path: path)
+def run_file_read(path: str) -> None:
+    """reading and decoding a save file"""
+    read_file(path)
+
+
+def file_canvas_snapshot(path: str) -> list:
+    """the snapshot of a canvas loaded from a save file"""
+    layers = read_file(path)[0]
+    canvas = HexCanvas((len(layers[0][0]), len(layers[0])))
+    canvas.load_layers(layers)
+    return canvas.snapshot()
+
+
+@file_benchmark('file_compress_writing', setup=file_canvas_snapshot)
+def run_file_compress_writing(snapshot: list) -> None:
+    """encoding a save file's canvas in the save format"""
+    compress_writing(snapshot)
+
+
+def measure(setup: Callable[[], Any], run: Callable[[Any], None], repeat: int) -> dict:
+    """times repeat runs (each after its own untimed setup), returns their stats in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):  # the engines print progress as they go
+            state = setup()
+            start = time.perf_counter()
+            run(state)
+            times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {'runs': repeat, 'min_ms': times[0], 'median_ms': statistics.median(times),
+            'mean_ms': statistics.fmean(times), 'max_ms': times[-1]}
+
+
+def run_benchmarks(sizes: tuple[int, ...] = SIZES, only: set[str] | None = None, repeat: int = REPEAT,
+                   on_result: Callable[[dict], None] | None = None) -> dict:
+    """runs the benchmarks (only the named ones, if given), returns the results with what they were measured on"""
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))  # spiral bucket fills recurse once per cell
+    results = []
+
+    def record(result: dict) -> None:
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    for name, (setup, run, max_size) in BENCHMARKS.items():
+        if only is None or name in only:
+            for size in sizes:
+                if max_size is None or size <= max_size:
+                    record({'name': name, 'case': f'{size}x{size}', **measure(lambda: setup(size), run, repeat)})
+    for name, (setup, run) in FILE_BENCHMARKS.items():
+        if only is None or name in only:
+            for path in sorted(glob.glob(os.path.join(SAVE_FILES, '*.hexpaint'))):
+                record({'name': name, 'case': os.path.basename(path), **measure(lambda: setup(path), run, repeat)})
+    return {'meta': {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'python': platform.python_version(),
+                     'numpy': np.__version__, 'pygame': pygame.version.ver, 'machine': platform.platform(),
+                     'processor': platform.processor(), 'repeat': repeat},
+            'results': results}
+
+
+def compare(old: dict, new: dict) -> list[dict]:
+    """how the median time of every benchmark in both runs changed (ratio > 1 means it got slower)"""
+    old_results = {(result['name'], result['case']): result for result in old['results']}
+    changes = []
+    for result in new['results']:
+        before = old_results.get((result['name'], result['case']))
+        if before:
+            changes.append({'name': result['name'], 'case': result['case'], 'old_ms': before['median_ms'],
+                            'new_ms': result['median_ms'], 'ratio': result['median_ms'] / max(before['median_ms'], 1e-9)})
+    return changes
+
+
+def main() -> None:
+    """command line benchmarks: prints a JSON line per result, and writes them all to a file if asked"""
+    parser = argparse.ArgumentParser(description='benchmark the HexPaint engines without a window')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES), help='comma separated canvas sizes')
+    parser.add_argument('--only', default=None, help='comma separated benchmark names, out of ' +
+                        ', '.join(list(BENCHMARKS) + list(FILE_BENCHMARKS)))
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='timed runs of every benchmark')
+    parser.add_argument('--out', default=None, help='write the results (JSON) to this file')
+    parser.add_argument('--compare', default=None, help='results (JSON) of an earlier run to compare against')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    sizes = tuple(int(size) for size in args.sizes.split(','))
+    results = run_benchmarks(sizes, only, args.repeat, on_result=lambda result: print(json.dumps(result), flush=True))
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            for change in compare(json.load(file), results):
+                print(json.dumps(change))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""end to end stroke latency: the whole program driven by a trace of mouse and key events, without a window
+
+The program runs under SDL's dummy video driver, and every frame of a trace has its events posted to the pygame event
+queue before the frame is run (see Program.run_frame), so event handling, stroke drawing, history commits, redraws and
+display.flip are all timed together. For every canvas size this reports:
+    - frame_ms: how long frames took
+    - latency_ms: from posting a mouse event with the button held to the end of the frame that changed the screen
+      pixel under it (events whose pixel never changed, e.g. ones over colour that was already there, are counted
+      under unchanged instead)
+    - commit_stall_ms: how long the frames that finished a stroke took (that's when the stroke is committed to history)
+
+By default a trace of a few strokes across the canvas (then an undo and a redo) is made for every size. A trace can
+be recorded from a real window with --record, and replayed with --trace (at the screen and canvas size it was
+recorded at, since its positions are on screen).
+
+Usage:
+    python -m src.test.latency [--sizes 48,128,256,512,1000] [--screen 1200,900] [--out <json file>]
+    python -m src.test.latency --record <json file> [--sizes 65] [--screen 1200,900]
+    python -m src.test.latency --trace <json file> [--out <json file>]
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if '--record' not in sys.argv:
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+sys.path.insert(0, SRC)  # main imports aux_code the way it does when run from src
+os.chdir(SRC)  # the ui loads its images from resources/
+
+from src.main import Program
+from src.aux_code import journal
+from src.aux_code.log import ROOT
+from src.aux_code.canvas_render import canvas_rect
+from src.aux_code.pygame_configure import pygame
+
+SIZES = (48, 128, 256, 512, 1000)  # canvas widths and heights measured (when none are given)
+SCREEN_SIZE = (1200, 900)
+PROBE_FRAMES = 30  # frames a latency probe waits for its pixel to change before it's counted as unchanged
+EVENT_TYPES = {name: getattr(pygame, name) for name in ('MOUSEMOTION', 'MOUSEBUTTONDOWN', 'MOUSEBUTTONUP',
+                                                        'MOUSEWHEEL', 'KEYDOWN', 'KEYUP', 'QUIT')}
+
+
+def event_to_json(event: pygame.event.Event) -> dict | None:
+    """a traced event as a dict (None for events that aren't traced)"""
+    for name, event_type in EVENT_TYPES.items():
+        if event.type == event_type:
+            attributes = {key: list(value) if isinstance(value, tuple) else value for key, value in event.dict.items()
+                          if isinstance(value, (int, float, str, tuple))}
+            return {'type': name, **attributes}
+    return None
+
+
+def event_from_json(data: dict) -> pygame.event.Event:
+    """the event a dict from event_to_json stands for"""
+    attributes = {key: tuple(value) if isinstance(value, list) else value for key, value in data.items()
+                  if key != 'type'}
+    return pygame.event.Event(EVENT_TYPES[data['type']], attributes)
+
+
+def stroke_trace(program: Program, strokes: int = 6, frames_per_stroke: int = 40, moves_per_frame: int = 3,
+                 idle_frames: int = 5) -> list[tuple[tuple[int, int], list[pygame.event.Event]]]:
+    """a trace of horizontal strokes across the canvas (none crossing another), then an undo and a redo
+    each frame of it is (where the mouse is, the events posted that frame)"""
+    canvas = program.ui.canvas
+    rect = canvas_rect(canvas.layout, canvas.width, canvas.height, program.ui.screen.get_size())
+    frames = []
+    for stroke in range(strokes):
+        y = rect.top + (stroke + 1) * rect.h // (strokes + 1)
+        xs = np.linspace(rect.left + rect.w * 0.02, rect.right - rect.w * 0.02, frames_per_stroke * moves_per_frame)
+        points = [(int(x), y) for x in xs]
+        frames.append((points[0], [pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=points[0])]))
+        for i in range(0, len(points), moves_per_frame):
+            moves = [pygame.event.Event(pygame.MOUSEMOTION, pos=point, rel=(point[0] - points[max(0, i + j - 1)][0], 0),
+                                        buttons=(1, 0, 0)) for j, point in enumerate(points[i:i + moves_per_frame])]
+            frames.append((points[min(i + moves_per_frame, len(points)) - 1], moves))
+        frames.append((points[-1], [pygame.event.Event(pygame.MOUSEBUTTONUP, button=1, pos=points[-1])]))
+        frames.extend((points[-1], []) for _ in range(idle_frames))
+    for key in (pygame.K_z, pygame.K_y):  # undo the last stroke, then redo it
+        frames.append(((0, 0), [pygame.event.Event(pygame.KEYDOWN, key=key, mod=pygame.KMOD_LCTRL, unicode='',
+                                                   scancode=0)]))
+        frames.extend(((0, 0), []) for _ in range(idle_frames))
+    return frames
+
+
+def stats(values: list[float]) -> dict:
+    """percentiles of the values (in milliseconds)"""
+    if not values:
+        return {'count': 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'count': len(values), 'p50': p50, 'p90': p90, 'p99': p99, 'max': max(values)}
+
+
+def replay(program: Program, frames: list[tuple[tuple[int, int], list[pygame.event.Event]]]) -> dict:
+    """runs the program through the frames of a trace, returns what was measured"""
+    screen = program.ui.screen
+    frame_times, latencies, stalls = [], [], []
+    probes = []  # (screen position, its colour before the event, when the event was posted, frames left to wait)
+    unchanged = 0
+    pygame.event.clear()
+    for mouse, events in frames:
+        if not program.running:
+            break
+        finishing = program.ui.canvas.drawing and any(
+            event.type == pygame.MOUSEBUTTONUP and event.button == 1 for event in events)
+        posted = time.perf_counter()
+        for event in events:
+            if event.type in {pygame.KEYDOWN, pygame.KEYUP}:
+                pygame.key.set_mods(event.mod)  # the dummy driver only knows the modifiers it's told about
+            if ((event.type == pygame.MOUSEMOTION and event.buttons[0]) or
+                    (event.type == pygame.MOUSEBUTTONDOWN and event.button == 1)) and \
+                    screen.get_rect().collidepoint(event.pos):
+                probes.append((event.pos, screen.get_at(event.pos), posted, PROBE_FRAMES))
+            pygame.event.post(event)
+
+        start = time.perf_counter()
+        program.run_frame(mouse, pygame.event.get())
+        end = time.perf_counter()
+        frame_times.append((end - start) * 1000)
+        if finishing:
+            stalls.append((end - start) * 1000)
+
+        waiting = []
+        for pos, colour, posted_at, frames_left in probes:
+            if screen.get_at(pos) != colour:
+                latencies.append((end - posted_at) * 1000)
+            elif frames_left > 1:
+                waiting.append((pos, colour, posted_at, frames_left - 1))
+            else:
+                unchanged += 1
+        probes = waiting
+    return {'frame_ms': stats(frame_times), 'latency_ms': stats(latencies), 'unchanged': unchanged + len(probes),
+            'commit_stall_ms': stats(stalls)}
+
+
+@contextlib.contextmanager
+def scratch_journal():
+    """keeps the journal of an untitled canvas in a temporary folder while the harness runs
+    (so it neither picks up nor leaves behind the real untitled journal)"""
+    real_path = journal.UNTITLED_JOURNAL
+    with tempfile.TemporaryDirectory() as folder:
+        journal.UNTITLED_JOURNAL = os.path.join(folder, os.path.basename(real_path))
+        try:
+            yield
+        finally:
+            journal.UNTITLED_JOURNAL = real_path
+
+
+@contextlib.contextmanager
+def quiet_logs():
+    """only lets the program log warnings and errors while the harness runs (so its info messages don't end up
+    between the harness's JSON lines)"""
+    root = logging.getLogger(ROOT)
+    level = root.level
+    root.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        root.setLevel(level)
+
+
+def measure(canv_size: tuple[int, int], screen_size: tuple[int, int] = SCREEN_SIZE,
+            trace: list[tuple[tuple[int, int], list[pygame.event.Event]]] | None = None) -> dict:
+    """replays a trace (a stroke_trace if none is given) on a new program with a canvas of the given size"""
+    with scratch_journal(), quiet_logs():
+        program = Program(screen_size, canv_size, start=False)
+        result = replay(program, trace if trace is not None else stroke_trace(program))
+        program.stop()
+    return {'canvas': f'{canv_size[0]}x{canv_size[1]}', 'screen': list(screen_size), **result}
+
+
+def record(file_path: str, canv_size: tuple[int, int], screen_size: tuple[int, int] = SCREEN_SIZE) -> None:
+    """runs the program in a window, writing every frame's mouse position and events to a trace file as it quits"""
+    with scratch_journal():
+        program = Program(screen_size, canv_size, start=False)
+        frames = []
+        while program.running:
+            mouse, events = pygame.mouse.get_pos(), pygame.event.get()
+            frames.append({'mouse': list(mouse),
+                           'events': [data for data in map(event_to_json, events) if data is not None]})
+            program.run_frame(mouse, events)
+        program.stop()
+    with open(file_path, 'w') as file:
+        json.dump({'screen': list(screen_size), 'canvas': list(canv_size), 'frames': frames}, file)
+
+
+def load_trace(file_path: str) -> tuple[tuple[int, int], tuple[int, int], list]:
+    """the screen size, canvas size and frames of a recorded trace"""
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+    frames = [(tuple(frame['mouse']), [event_from_json(event) for event in frame['events']])
+              for frame in data['frames']]
+    return tuple(data['screen']), tuple(data['canvas']), frames
+
+
+def main() -> None:
+    """command line harness: prints a JSON line per canvas size, and writes them all to a file if asked"""
+    parser = argparse.ArgumentParser(description='measure HexPaint frame times and stroke latency without a window')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in SIZES), help='comma separated canvas sizes')
+    parser.add_argument('--screen', default=','.join(str(side) for side in SCREEN_SIZE), help='screen width,height')
+    parser.add_argument('--trace', default=None, help='replay this recorded trace instead of the default strokes')
+    parser.add_argument('--record', default=None, help='record a trace to this file from a real window')
+    parser.add_argument('--out', default=None, help='write the results (JSON) to this file')
+    args = parser.parse_args()
+
+    screen_size = tuple(int(side) for side in args.screen.split(','))
+    sizes = [int(size) for size in args.sizes.split(',')]
+    if args.record:
+        record(args.record, (sizes[0], sizes[0]), screen_size)
+        return
+    if args.trace:
+        screen_size, canv_size, frames = load_trace(args.trace)
+        runs = [(canv_size, frames)]
+    else:
+        runs = [((size, size), None) for size in sizes]
+
+    results = []
+    for canv_size, frames in runs:
+        results.append(measure(canv_size, screen_size, frames))
+        print(json.dumps(results[-1]), flush=True)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump({'meta': {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'pygame': pygame.version.ver},
+                       'results': results}, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()